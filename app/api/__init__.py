@@ -13,4 +13,5 @@ from .utils import marshal
 from .decorators import (anonymous_required, token_auth_required, http_auth_required,
                          session_auth_required, auth_required, permissions_accepted,
                          permissions_required, roles_required, roles_accepted, one_of, paginated,
-                         marshal_with, marshal_with_data_envelope, extract_args)
+                         marshal_with, marshal_with_data_envelope, extract_args, use_args,
+                         exported, batched)
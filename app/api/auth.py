@@ -2,11 +2,13 @@
 
 """auth checkers"""
 
-from flask import g
+from flask import g, request, _request_ctx_stack
 from flask_security import current_user
-from flask_security.decorators import _check_http_auth
 from flask_jwt import _jwt_required, JWTError
 
+from ..auth import change_identity
+from ..extensions import auth_datastore, password_verifier
+
 
 def verify_token_auth(realm=None):
     """verify token authentication
@@ -22,11 +24,24 @@ def verify_token_auth(realm=None):
 
 
 def verify_http_auth():
-    """verify http basic authentication
+    """verify http basic authentication, like `flask_security.decorators._check_http_auth` with
+    the password verifier
 
     :return:
     """
-    return _check_http_auth()
+    auth = request.authorization
+    if auth is None or not auth.username:
+        return False
+
+    user = auth_datastore.find_users(email=auth.username).first()
+    if user and password_verifier.verify(auth.password, user):
+        # the password hash of a deprecated scheme is updated
+        if auth_datastore.db.session.is_modified(user):
+            auth_datastore.commit()
+        _request_ctx_stack.top.user = user
+        change_identity(user)
+        return True
+    return False
 
 
 #  FIXME(hoatle): inactive or not verified users (?) should be blocked
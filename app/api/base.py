@@ -2,19 +2,22 @@
 
 """base api"""
 
-from functools import partial
+from functools import partial, wraps
 from datetime import datetime, timedelta
 
 import inflection
 import jwt as jwt_lib
 from werkzeug.security import safe_str_cmp
-from flask import current_app,  make_response
-from flask_security import utils, AnonymousUser
+from flask import current_app,  make_response, request, Response
+from flask_security import AnonymousUser
 from flask_security.utils import md5
 from flask_classy import FlaskView
 
-from ..extensions import jwt, auth_datastore
+from ..auth.tokens import TokenUser
+from ..extensions import jwt, auth_datastore, password_verifier, token_revocations, timings
 from ..exceptions import ApplicationException
+from ..policies import compile_view
+from ..timings import current_timings
 from .errors import api_exception_handler
 from .decorators import token_auth_required, roles_required
 from .representations.json import output_json
@@ -30,18 +33,29 @@ def jwt_authenticate(email, pwd):
     :return None or the matching user
     """
     user = auth_datastore.find_users(email=email).first()
-    if user and utils.verify_and_update_password(pwd, user):
+    if user and password_verifier.verify(pwd, user):
         return user
 
 
 @jwt.identity_handler
 def jwt_load_user(payload):
-    """Register jwt user handler
+    """Register jwt user handler, the identity cache is looked up before the datastore.
+
+    The stateless tokens (JWT_STATELESS config) of the users not revoked are not loaded.
 
     :param payload:
     """
+    if current_app.config.get('JWT_STATELESS') and 'roles' in payload and \
+            payload['sub'] not in token_revocations:
+        return TokenUser(payload)
+
+    user = auth_datastore.get_cached_user(payload['sub'], payload['pwd'])
+    if user:
+        return user
+
     user = auth_datastore.read_user(payload['sub'])
     if user and safe_str_cmp(md5(user.password), payload['pwd']):
+        auth_datastore.cache_user(user)
         return user
     return AnonymousUser()
 
@@ -65,12 +79,15 @@ def jwt_make_payload(user, expiration_delta=None, leeway=None):
         seconds=current_app.config['JWT_LEEWAY'])  # int config as seconds
 
     utc_now = datetime.utcnow()
-    return {
+    payload = {
         'sub': user.id,
         'pwd': md5(user.password),
         'iat': utc_now,
         'exp': utc_now + expiration_delta + leeway
     }
+    if current_app.config.get('JWT_STATELESS'):
+        payload['roles'] = [role.name for role in user.roles]
+    return payload
 
 
 @jwt.jwt_encode_handler
@@ -111,6 +128,20 @@ def jwt_error(ex):
 make_empty_response = partial(make_response, '')
 
 
+def unpack(value):
+    """Unpacks the value returned by a view into the (data, code, headers) tuple like
+    flask-restful: (data,), (data, code) and (data, code, headers) tuples are accepted."""
+    if not isinstance(value, tuple):
+        return value, 200, {}
+    if len(value) == 3:
+        return value
+    if len(value) == 2:
+        return value[0], value[1], {}
+    if len(value) == 1:
+        return value[0], 200, {}
+    return value, 200, {}
+
+
 class Resource(FlaskView):
     """The base Resource class that other REST resources should extend from"""
     trailing_slash = False
@@ -144,6 +175,15 @@ class Resource(FlaskView):
         return super(Resource, cls).get_route_base()
 
 
+    @classmethod
+    def build_rule(cls, rule, method=None):
+        """The rules starting with `:` are the custom methods of the collection, for example:
+        `:batch` => /api/v1.0/users:batch, see: https://cloud.google.com/apis/design/custom_methods
+        """
+        if rule.startswith(':'):
+            return super(Resource, cls).build_rule('/', method).rstrip('/') + rule
+        return super(Resource, cls).build_rule(rule, method)
+
     @classmethod
     def build_route_name(cls, method_name):
 
@@ -155,6 +195,63 @@ class Resource(FlaskView):
 
         return super(Resource, cls).build_route_name(method_name)
 
+    @classmethod
+    def make_proxy_method(cls, name):
+        """Creates the proxy of flask-classy with the view compiled with the class decorators by
+        `compile_view`, the hooks of the view and the timed representations are looked up once
+        here instead of per request. The representation is the best match of the Accept header,
+        the first one otherwise, as flask-classy.
+
+        The timed requests (see `app.timings`) are dispatched by the view compiled with the
+        timings of its stages and of the representation."""
+        i = cls()
+        decorated = getattr(i, name)
+        for decorator in cls.decorators:
+            decorated = decorator(decorated)
+        plain_view = compile_view(decorated)
+        timed_view = compile_view(decorated, wrap=timings.timed)
+        mimetypes = list(cls.representations)
+        # the representations timed by their mimetype subtype, json for application/json
+        timed_representations = dict(
+            (mimetype, timings.timed(mimetype.rsplit('/', 1)[-1], represent))
+            for mimetype, represent in cls.representations.iteritems())
+
+        before_request = getattr(i, 'before_request', None)
+        before_view = getattr(i, 'before_' + name, None)
+        after_view = getattr(i, 'after_' + name, None)
+        after_request = getattr(i, 'after_request', None)
+
+        @wraps(plain_view)
+        def proxy(**forgettable_view_args):
+            # the view args of the request may be modified by the intervening functions
+            view_args = request.view_args
+            if before_request is not None:
+                response = before_request(name, **view_args)
+                if response is not None:
+                    return response
+            if before_view is not None:
+                response = before_view(**view_args)
+                if response is not None:
+                    return response
+
+            timed = current_timings() is not None
+            response = (timed_view if timed else plain_view)(**view_args)
+            if not isinstance(response, Response):
+                if isinstance(response, basestring) or not mimetypes:
+                    response = make_response(response)
+                else:
+                    mimetype = request.accept_mimetypes.best_match(mimetypes) or mimetypes[0]
+                    representations = timed_representations if timed else cls.representations
+                    response = representations[mimetype](*unpack(response))
+
+            if after_view is not None:
+                response = after_view(response)
+            if after_request is not None:
+                response = after_request(name, response)
+            return response
+
+        return proxy
+
 
 class TokenRequiredResource(Resource):
     """The base resource class that requires token authentication"""
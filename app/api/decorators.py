@@ -2,37 +2,45 @@
 
 """decorators for api resources"""
 
+import collections
 from functools import wraps
 
-from flask import current_app, _request_ctx_stack
-from flask_principal import Identity, identity_changed
+from flask import (current_app, request, has_request_context, _request_ctx_stack, Response,
+                   stream_with_context)
 from flask_jwt import current_identity, _jwt_required
-from webargs.flaskparser import use_args
+from marshmallow import ValidationError
+from webargs.core import argmap2schema
+from webargs.flaskparser import parser as webargs_parser
 
-from ..auth import (permissions_required as auth_permissions_required,
+from ..auth import (change_identity,
+                    permissions_required as auth_permissions_required,
                     permissions_accepted as auth_permissions_accepted,
                     roles_required as auth_roles_required,
                     roles_accepted as auth_roles_accepted)
-from ..exceptions import ApplicationException, UnauthorizedException, BadRequestException
-from ..pagination import OffsetPagination
+from ..exceptions import (ApplicationException, UnauthorizedException, BadRequestException,
+                          NotFoundException, ConflictException)
+from ..pagination import (OffsetPagination, CursorPagination, TimePagination, LazyData,
+                          iter_keyset)
+from ..policies import guard, parser, processor, get_policy, GUARD
 from . import (authenticated, token_authenticated, http_authenticated,
                session_authenticated)
+from .representations.json import get_dumps, json_default
+from .schemas import fields_to_dict
+from .streaming import ROW_STREAMS
 from .utils import extract_filters, marshal
 
 
 def anonymous_required(func):
     """Decorator that requires the user client must be anonymous."""
 
-    @wraps(func)
-    def decorated(*args, **kwargs):
+    def check(*args, **kwargs):
         if authenticated():
             raise BadRequestException(
                 'Not Anonymous',
                 description='the request is authenticated but anonymous is required'
             )
-        return func(*args, **kwargs)
 
-    return decorated
+    return guard('auth', check)(func)
 
 
 def token_auth_required(realm=None):
@@ -41,51 +49,43 @@ def token_auth_required(realm=None):
     :param realm: an optional realm
     """
 
-    def wrapper(func):
-        @wraps(func)
-        def decorated(*args, **kwargs):
-            _jwt_required(realm)
-            if current_identity and current_identity.is_authenticated():
-                app = current_app._get_current_object()
-                _request_ctx_stack.top.user = current_identity
-                identity_changed.send(app, identity=Identity(current_identity.id))
-                return func(*args, **kwargs)
-            raise UnauthorizedException('Invalid Token', description='token is invalid')
+    def check(*args, **kwargs):
+        _jwt_required(realm)
+        user = current_identity._get_current_object()
+        if user and user.is_authenticated():
+            _request_ctx_stack.top.user = user
+            change_identity(user)
+            return None
+        raise UnauthorizedException('Invalid Token', description='token is invalid')
 
-        return decorated
-
-    return wrapper
+    return guard('auth', check)
 
 
 def http_auth_required(func):
     """Decorator that protects endpoints using basic authentication."""
 
-    @wraps(func)
-    def decorated(*args, **kwargs):
-        if http_authenticated():
-            return func(*args, **kwargs)
-        raise UnauthorizedException(
-            'Invalid Basic Authentication',
-            description='basic authentication was invalid or not provided'
-        )
+    def check(*args, **kwargs):
+        if not http_authenticated():
+            raise UnauthorizedException(
+                'Invalid Basic Authentication',
+                description='basic authentication was invalid or not provided'
+            )
 
-    return decorated
+    return guard('auth', check)(func)
 
 
 def session_auth_required(func):
     """Decorator that protects endpoints using session authentication.
     Normally, we don't use this, just make it here the same support as flask-security"""
 
-    @wraps(func)
-    def decorated(*args, **kwargs):
-        if session_authenticated():
-            return func(*args, **kwargs)
-        raise UnauthorizedException(
-            'Invalid Session Authentication',
-            description='session authentication was invalid or not provided'
-        )
+    def check(*args, **kwargs):
+        if not session_authenticated():
+            raise UnauthorizedException(
+                'Invalid Session Authentication',
+                description='session authentication was invalid or not provided'
+            )
 
-    return decorated
+    return guard('auth', check)(func)
 
 
 # TODO(hoatle): consider to rename this to: `auth_accepted` to make it consistent with others
@@ -113,23 +113,20 @@ def auth_required(*auth_methods):
         'session': session_authenticated
     }
 
-    def wrapper(func):
-        @wraps(func)
-        def decorated(*args, **kwargs):
-            mechanisms = [login_mechanisms.get(method) for method in auth_methods]
-            for mechanism in mechanisms:
-                if mechanism and mechanism():
-                    return func(*args, **kwargs)
+    mechanisms = [login_mechanisms.get(method) for method in auth_methods]
 
-            raise UnauthorizedException(
-                'Invalid Authentication',
-                description='required {} authentication was invalid or not provided'.
-                format(' or '.join(auth_methods))
-            )
+    def check(*args, **kwargs):
+        for mechanism in mechanisms:
+            if mechanism and mechanism():
+                return None
 
-        return decorated
+        raise UnauthorizedException(
+            'Invalid Authentication',
+            description='required {} authentication was invalid or not provided'.
+            format(' or '.join(auth_methods))
+        )
 
-    return wrapper
+    return guard('auth', check)
 
 
 def permissions_required(*permissions):
@@ -212,6 +209,16 @@ def roles_accepted(*roles):
     return auth_roles_accepted(*roles, exception_handler=exception_handler)
 
 
+def _guard_passed(*args, **kwargs):
+    """The view guarded by the decorators of `one_of`, it marks the guard as passed"""
+    return _guard_passed
+
+
+def _guard_response(result):
+    """The response of a guard of `one_of`, None if it passed"""
+    return None if result is _guard_passed else result
+
+
 def one_of(*decorators):
     """Decorator helper to make sure one of the decorators must pass (no exception thrown)
     Example::
@@ -228,101 +235,291 @@ def one_of(*decorators):
     The current user must be anonymous user or admin user in order
     to create a new user.
 
+    The decorators guard a marker view, they are applied once and evaluated in order until one
+    passes, then the decorated function is run once, its exceptions are not the ones of the
+    guards. The guard policies are checked without the marker view.
+
     :param decorators: The decorators.
     """
-
-    def wrapper(func):
-        @wraps(func)
-        def decorated(*args, **kwargs):
-            exs = []
-            for idx, decorator in enumerate(decorators):
-                try:
-                    result = decorator(func)(*args, **kwargs)
-                    return result
-                except Exception as ex:
-                    if idx == (len(decorators) - 1):
-                        if not isinstance(ex, ApplicationException):
-                            # dirty hack of ex.error
-                            ex = ApplicationException(ex.message or getattr(ex, 'error', None),
-                                                      description='')
-                        for e in exs:
-                            if not isinstance(e, ApplicationException):
-                                e = ApplicationException(e.message or getattr(e, 'error', None) or
-                                                         getattr(e, 'name', None),
-                                                         description=getattr(e, 'data', None) or '')
-                            ex.message += ' or {}'.format(e.message) \
-                                if e.message is not None else ''
-                            ex.description += ' or {}'.format(e.description) \
-                                if ex.description and e.description \
-                                else '{}'.format(e.description or '')
-                        raise ex
-                    exs.append(ex)
-            return func(*args, **kwargs)
-
-        return decorated
-
-    return wrapper
+    checks = {}
+
+    def get_check(idx):
+        check = checks.get(idx)
+        if check is None:
+            guarded = decorators[idx](_guard_passed)
+            policy = get_policy(guarded)
+            if policy is not None and policy.kind == GUARD and \
+                    guarded.policy_wrapped is _guard_passed:
+                check = policy.step
+            else:
+                # a guard responding by itself is not passed
+                check = lambda *args, **kwargs: _guard_response(guarded(*args, **kwargs))
+            checks[idx] = check
+        return check
+
+    def check(*args, **kwargs):
+        exs = []
+        for idx in range(len(decorators)):
+            try:
+                return get_check(idx)(*args, **kwargs)
+            except Exception as ex:
+                if idx == (len(decorators) - 1):
+                    if not isinstance(ex, ApplicationException):
+                        # dirty hack of ex.error
+                        ex = ApplicationException(ex.message or getattr(ex, 'error', None),
+                                                  description='',
+                                                  status_code=getattr(ex, 'status_code', None))
+                    for e in exs:
+                        if not isinstance(e, ApplicationException):
+                            e = ApplicationException(e.message or getattr(e, 'error', None) or
+                                                     getattr(e, 'name', None),
+                                                     description=getattr(e, 'data', None) or '')
+                        ex.message += ' or {}'.format(e.message) \
+                            if e.message is not None else ''
+                        ex.description += ' or {}'.format(e.description) \
+                            if ex.description and e.description \
+                            else '{}'.format(e.description or '')
+                    raise ex
+                exs.append(ex)
+
+    return guard('one_of', check)
 
 
 def paginated(func):
     """paginated decorator to display the list of items from the query returned by the
     decorated function
+
+    The cursor-based pagination is used when `before` or `after` args are present, the time-based
+    pagination is used when `since` or `until` args are present, otherwise the offset-based
+    pagination is used. The cursor-based and offset-based ones provide the cursors of the page.
+
+    The large offset-based pages are lazy to be streamed, their paging is a callable.
     """
+    return processor('paginate', _paginate)(func)
 
-    @wraps(func)
-    def decorated(*args, **kwargs):
-        query, args_dict = func(*args, **kwargs)
 
-        if args_dict.get('one', False) is True:
-            data = [query.one()]
-            paging = {
-                'count': 1,
-                'offset': 0,
-                'limit': 1,
-                'previous': None,
-                'next': None
-            }
-        else:
-            pagination = OffsetPagination(query,
-                                          offset=args_dict.get('offset', None),
-                                          limit=args_dict.get('limit', None))
-            data = pagination.data
+def _paginate(result):
+    """Paginates the query of the result of a `paginated` function by its args"""
+    query, args_dict = result
+
+    if args_dict.get('one', False) is True:
+        data = [query.one()]
+        paging = {
+            'count': 1,
+            'offset': 0,
+            'limit': 1,
+            'previous': None,
+            'next': None
+        }
+    elif 'before' in args_dict or 'after' in args_dict:
+        pagination = CursorPagination(query,
+                                      before=args_dict.get('before', None),
+                                      after=args_dict.get('after', None),
+                                      limit=args_dict.get('limit', None),
+                                      sort=args_dict.get('sort', None))
+        data = pagination.data
+        paging = {
+            'cursors': {
+                'before': pagination.before,
+                'after': pagination.after
+            },
+            'limit': pagination.limit,
+            'previous': pagination.prev_url,
+            'next': pagination.next_url
+        }
+    elif 'since' in args_dict or 'until' in args_dict:
+        pagination = TimePagination(query,
+                                    since=args_dict.get('since', None),
+                                    until=args_dict.get('until', None),
+                                    limit=args_dict.get('limit', None),
+                                    time_key=args_dict.get('time_key', None),
+                                    since_id=args_dict.get('since_id', None),
+                                    until_id=args_dict.get('until_id', None))
+        data = pagination.data
+        paging = {
+            'limit': pagination.limit,
+            'previous': pagination.prev_url,
+            'next': pagination.next_url
+        }
+    else:
+        pagination = OffsetPagination(query,
+                                      offset=args_dict.get('offset', None),
+                                      limit=args_dict.get('limit', None),
+                                      sort=args_dict.get('sort', None),
+                                      count_mode=args_dict.get('count', None),
+                                      stream=True)
+        data = pagination.data
+
+        def make_paging():
             paging = {
-                'count': pagination.count,
+                'count_mode': pagination.count_mode,
                 'offset': pagination.offset,
                 'limit': pagination.limit,
+                'cursors': {
+                    'before': pagination.before,
+                    'after': pagination.after
+                },
                 'previous': pagination.prev_url,
                 'next': pagination.next_url
             }
+            if pagination.count is not None:
+                paging['count'] = pagination.count
+            return paging
 
-        return {
-            'data': data,
-            'paging': paging
-        }
+        # the paging of the lazy data is known once the data is streamed
+        paging = make_paging if isinstance(data, LazyData) else make_paging()
 
-    return decorated
+    return {
+        'data': data,
+        'paging': paging
+    }
 
 
 def marshal_with(schema=None, envelope=None):
-    """decorator for marshalling with marshmallow"""
+    """decorator for marshalling with marshmallow,
+    only the fields selected by the `fields` request arg are marshalled"""
+    def process(resp):
+        fields = request.args.get('fields') if has_request_context() else None
+        if isinstance(resp, tuple):
+            data, code, headers = resp
+            return marshal(data, schema, envelope, fields), code, headers
+        else:
+            return marshal(resp, schema, envelope, fields)
+
+    return processor('marshal', process)
+
+
+def marshal_with_data_envelope(schema):
+    """marshal with `data` envelope"""
+    return marshal_with(schema, envelope='data')
+
+
+def exported(schema):
+    """Decorator to stream all the items of the query in the `format` arg: ndjson (default) or csv.
+
+    The decorated function returns the query and the args, for example:
+
+    @exported(_user_schema)
+    @extract_args(export_args)
+    def export(self, args):
+        return auth_datastore.find_users(**args), args
+
+    The items are queried by windows of EXPORT_WINDOW_SIZE config items in the primary key order
+    and marshalled one at a time, only the selected fields if the `fields` arg is provided.
+    """
+    def process(result):
+        query, args_dict = result
+        config = current_app.config
+        stream_class = ROW_STREAMS[args_dict.get('format') or 'ndjson']
+        items = iter_keyset(query, config.get('EXPORT_WINDOW_SIZE', 1000))
+        stream = stream_class(items, schema, args_dict.get('fields'))
+        dumps = get_dumps(config.get('JSON_ENCODER', 'auto'))
+        chunks = stream.iter_encode(dumps, default=json_default, separators=(',', ':'))
+        return Response(stream_with_context(chunks), content_type=stream.content_type)
+
+    return processor('export', process)
+
+
+def batch_error(ex):
+    """Make the result of a failed batch item from the application exception"""
+    status_code, ex.status_code = ex.status_code, None
+    return {'status': status_code, 'error': ex.to_json()['error']}
+
+
+def batched(arg_map, status_code=200, error=None, conflict=None, max_items='BATCH_MAX_ITEMS'):
+    """Decorator to validate the json array body item by item with the arg map, the decorated
+    function receives the list of the valid items and the BATCH_CHUNK_SIZE config then returns the
+    list of their primary ids, None for the failed ones, False for the conflicting ones, for
+    example:
+
+    @batched(user_args, status_code=201, error=lambda item: ConflictException(...))
+    def batch_create(self, items, chunk_size):
+        return auth_datastore.bulk_create_users(items, chunk_size=chunk_size)
+
+    The results of all the items are returned in the request order:
+    {'data': [{'status': 201, 'id': 1}, {'status': 400, 'error': {...}}]}
+
+    :param arg_map the webargs arg map of an item
+    :param status_code the status code of the succeeded items
+    :param error the optional function making the application exception of a failed item,
+                 not found by default
+    :param conflict the optional function making the application exception of a conflicting
+                    item, conflict by default
+    :param max_items the config of the max number of items, BATCH_MAX_ITEMS by default
+    """
+    if error is None:
+        error = lambda item: NotFoundException('Not Found', description='item not found')
+    if conflict is None:
+        conflict = lambda item: ConflictException('Conflict', description='item conflicts')
+
     def wrapper(func):
         @wraps(func)
-        def decorated(*args, **kwargs):
-            resp = func(*args, **kwargs)
-            if isinstance(resp, tuple):
-                data, code, headers = resp
-                return marshal(data, schema, envelope), code, headers
-            else:
-                return marshal(resp, schema, envelope)
+        def decorated(resource, *args, **kwargs):
+            items = request.get_json(silent=True)
+            if not isinstance(items, list):
+                raise BadRequestException('Invalid Batch',
+                                          description='a json array of items is required')
+            max_count = current_app.config.get(max_items, 1000)
+            if len(items) > max_count:
+                raise BadRequestException('Invalid Batch',
+                                          description='max {} items are allowed'.format(max_count))
+
+            schema = argmap2schema(arg_map)()
+            results = [None] * len(items)
+            indexes, valid_items = [], []
+            for index, item in enumerate(items):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError('a json object is required')
+                    valid_items.append(schema.load(item).data)
+                    indexes.append(index)
+                except ValidationError as ex:
+                    results[index] = batch_error(BadRequestException(
+                        'Invalid Item', description='invalid fields', errors=[ex.messages]))
+                except ValueError as ex:
+                    results[index] = batch_error(BadRequestException('Invalid Item',
+                                                                     description=ex.message))
+
+            pids = func(resource, valid_items,
+                        current_app.config.get('BATCH_CHUNK_SIZE', 500), *args, **kwargs)
+            for index, item, pid in zip(indexes, valid_items, pids):
+                if pid is None:
+                    results[index] = batch_error(error(item))
+                elif pid is False:
+                    results[index] = batch_error(conflict(item))
+                else:
+                    results[index] = {'status': status_code, 'id': pid}
+
+            return {'data': results}
 
         return decorated
 
     return wrapper
 
 
-def marshal_with_data_envelope(schema):
-    """marshal with `data` envelope"""
-    return marshal_with(schema, envelope='data')
+def _args_parser(arg_map, req=None, locations=None, as_kwargs=False, validate=None):
+    """Makes the parse function of the webargs `use_args` decorator: the args parsed from the
+    request are added after the positional args, or to the kwargs if `as_kwargs`"""
+    locations = locations or webargs_parser.locations
+    # the schema of an arg map is made once
+    if isinstance(arg_map, collections.Mapping):
+        arg_map = argmap2schema(arg_map)()
+
+    def parse(args, kwargs):
+        parsed_args = webargs_parser.parse(arg_map, req=req, locations=locations,
+                                           validate=validate, force_all=as_kwargs)
+        if as_kwargs:
+            kwargs.update(parsed_args)
+            return args, kwargs
+        return args + (parsed_args,), kwargs
+
+    return parse
+
+
+def use_args(arg_map, req=None, locations=None, as_kwargs=False, validate=None):
+    """The `webargs.flaskparser.use_args` decorator as an args policy"""
+    return parser('args', _args_parser(arg_map, req=req, locations=locations,
+                                       as_kwargs=as_kwargs, validate=validate))
 
 
 def extract_args(arg_map, req=None, locations=None, as_kwargs=False, validate=None):
@@ -332,14 +529,22 @@ def extract_args(arg_map, req=None, locations=None, as_kwargs=False, validate=No
     for example: /api/v1.0/users?created_at__gt=2009-10-26T04:47:09Z
 
     then the filters will include: {'key': 'created_at', 'op': 'gt', 'value': '2009-10-26T04:47:09Z'}
+
+    the `fields` arg is parsed into the fields dict, for example: /api/v1.0/users?fields=id,email
+
+    then the fields will be: {'id': {}, 'email': {}}
     """
-    def wrapper(func):
-        @wraps(func)
-        @use_args(arg_map, req=req, locations=locations, as_kwargs=as_kwargs, validate=validate)
-        def decorated(resource, req_args, *args, **kwargs):
-            filters, req_args = extract_filters(req_args)
-            req_args['filters'] = filters
+    parse_args = _args_parser(arg_map, req=req, locations=locations, as_kwargs=as_kwargs,
+                              validate=validate)
 
-            return func(resource, req_args, *args, **kwargs)
-        return decorated
-    return wrapper
+    def parse(args, kwargs):
+        args, kwargs = parse_args(args, kwargs)
+        resource, req_args = args[:2]
+        filters, req_args = extract_filters(req_args)
+        req_args['filters'] = filters
+        if 'fields' in req_args:
+            req_args['fields'] = fields_to_dict(req_args['fields'])
+
+        return (resource, req_args) + args[2:], kwargs
+
+    return parser('args', parse)
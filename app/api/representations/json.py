@@ -1,12 +1,64 @@
 from __future__ import absolute_import
-from json import dumps
+from datetime import date, datetime
+import json
 
-from flask import make_response, current_app
+from flask import make_response, current_app, stream_with_context, Response
+
+from ..streaming import JSONStream
+
+
+def json_default(obj):
+    """Encode the objects not supported by the json encoders: datetimes and dates"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def _simplejson_dumps():
+    import simplejson  # C speedups are used when they are compiled
+
+    return simplejson.dumps
+
+
+# the encoder backends by names
+JSON_BACKENDS = {
+    'simplejson': _simplejson_dumps,
+    'json': lambda: json.dumps
+}
+
+_dumps_functions = {}
+
+
+def get_dumps(backend='auto', sort_keys=False):
+    """Get the dumps function of an encoder backend
+
+    The `auto` backend uses the stdlib C encoder, or the simplejson C encoder if installed
+    for the sorted keys as the stdlib falls back to its python encoder for them.
+
+    :param backend one of `auto`, `simplejson` or `json`
+    :param sort_keys if the keys are sorted
+    :return the dumps function
+    """
+    if backend == 'auto':
+        backend = 'simplejson' if sort_keys else 'json'
+        try:
+            return get_dumps(backend)
+        except ImportError:
+            return json.dumps
+
+    dumps = _dumps_functions.get(backend)
+    if dumps is None:
+        if backend not in JSON_BACKENDS:
+            raise ValueError('Invalid json encoder: {}'.format(backend))
+        dumps = _dumps_functions[backend] = JSON_BACKENDS[backend]()
+    return dumps
 
 
 def output_json(data, code, headers=None):
     """Makes a Flask response with a JSON encoded body"""
-    settings = current_app.config.get('RESTFUL_JSON', {})
+    # the config settings are copied, they must not be mutated
+    settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+    settings.setdefault('default', json_default)
 
     # If we're in debug mode, and the indent is not set, we set it to a
     # reasonable value here.  Note that this won't override any existing value
@@ -14,12 +66,20 @@ def output_json(data, code, headers=None):
     if current_app.debug:
         settings.setdefault('indent', 4)
         settings.setdefault('sort_keys', True)
+    else:
+        settings.setdefault('separators', (',', ':'))
+
+    dumps = get_dumps(current_app.config.get('JSON_ENCODER', 'auto'), settings.get('sort_keys'))
 
-    # always end the json dumps with a new line
-    # see https://github.com/mitsuhiko/flask/pull/1262
-    dumped = dumps(data, **settings) + '\n'
+    if isinstance(data, JSONStream):
+        # chunked response encoded while it is sent, within the request context
+        resp = Response(stream_with_context(data.iter_encode(dumps, **settings)), code)
+    else:
+        # always end the json dumps with a new line
+        # see https://github.com/mitsuhiko/flask/pull/1262
+        dumped = dumps(data, **settings) + '\n'
+        resp = make_response(dumped, code)
     headers = headers or {}
-    resp = make_response(dumped, code)
     resp.headers['Content-Type'] = 'application/json; charset=utf-8'
     resp.headers.extend(headers)
     return resp
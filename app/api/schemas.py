@@ -1,119 +1,277 @@
-from marshmallow import Schema as SchemaOrigin
+from marshmallow import Schema as SchemaOrigin, fields as ma_fields, class_registry
+from marshmallow.base import SchemaABC
 from marshmallow.schema import MarshalResult
-import re
+import copy
 
+from ..cache import LRUCache
 
-def fields_to_dict(fields):
-    """ FIXME:
-        https://www.debuggex.com/r/24QPqzm5EsR0e2bt
-        https://www.debuggex.com/r/0SjmBL55ySna0kFF
-        https://www.debuggex.com/r/Vh9qvHkCV4ZquS14
+
+class FieldSelector(object):
+    """Compiled `fields` expression, for example: `id,name,roles[0:5]{id,name}`
+
+    Each selected key maps to its sub selector with the optional slice of its value.
+    A selector is shared by the requests with the same expression, it must not be mutated.
     """
-    result = {}
 
-    if not fields or len(fields.strip()) == 0:
+    def __init__(self, fields=None, slice_range=None):
+        self.fields = fields if fields is not None else {}
+        self.slice_range = slice_range
+
+    def __nonzero__(self):
+        return len(self.fields) > 0
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    @classmethod
+    def from_dict(cls, fields_dict):
+        """Make the selector from a fields dict of :func:`fields_to_dict`"""
+        fields = {}
+        for key, value in fields_dict.iteritems():
+            if key == '__slice':
+                continue
+            fields[key] = cls.from_dict(value)
+        return cls(fields, fields_dict.get('__slice'))
+
+    def to_dict(self):
+        """Get the fields dict of the selector, slices are kept with the `__slice` key"""
+        result = {}
+        for key, selector in self.fields.iteritems():
+            value = selector.to_dict()
+            if selector.slice_range is not None:
+                value['__slice'] = selector.slice_range
+            result[key] = value
         return result
 
-    # look_behind_keys = re.findall('{(\w*?),', fields)
-    # look_behind_pattern_list = ['(?<!{' + k + ')' for k in look_behind_keys]
+    def scope(self, scope_key, keys):
+        """Get the selector applying to the `scope_key` value, other keys are kept"""
+        fields = dict((key, FieldSelector()) for key in keys)
+        fields[scope_key] = self
+        return FieldSelector(fields)
 
-    # # FIXME: '(?<!{[^,]*),<look_forward_pattern>' will trigger "look-behind requires
-    # # fixed-width pattern"
-    # look_behind_pattern = ''.join(look_behind_pattern_list)
+    def get_slice(self):
+        if self.slice_range is None:
+            return None
+        indexes = [int(index) if index.strip() else None for index in self.slice_range.split(':')]
+        return slice(*indexes)
 
-    # # FIXME: not support nested bracket: field{id,name,description{abc,def}}
-    # look_forward_pattern = '(?![a-zA-Z0-9,\}:\[\]]*?})'
+    def filter(self, origin_dict):
+        """Filter the selected keys of a dict, the nested dicts and lists are filtered by the sub
+        selectors, the None values are removed"""
+        result = {}
+        for key, selector in self.fields.iteritems():
+            value = origin_dict.get(key)
+            if value is None:
+                continue
 
-    # # sample pattern: '(?<!{id)(?<!{email),<look_forward_pattern>'
-    # re_pattern = look_behind_pattern + ',' + look_forward_pattern
+            if selector.fields:
+                if isinstance(value, dict):
+                    value = selector.filter(value)
+                elif isinstance(value, list):
+                    value = selector.filter_many(value)
 
-    splited_fields = []
-    word_block = ''
-    bracket_counter = 0
-    field_len = len(fields)
-    for index, word in enumerate(fields):
+            if selector.slice_range is not None:
+                value = value[selector.get_slice()]
 
-        if word == '{':
-            bracket_counter = bracket_counter + 1
+            result[key] = value
+        return result
 
-        if word == '}':
-            bracket_counter = bracket_counter - 1
-        
+    def filter_many(self, origin_list):
+        """Filter a list of dicts in one pass"""
+        if not self.fields:
+            return [origin_dict.copy() for origin_dict in origin_list]
+        return [self.filter(origin_dict) for origin_dict in origin_list]
 
-        # move to new word block
-        if word == ',' and bracket_counter == 0:
-            splited_fields.append(word_block)
-            word_block = ''
-        else:
-            word_block += word
-            
-        # add remaining word_block
-        if word_block != '' and index==field_len-1:
-            splited_fields.append(word_block)
 
-    for key in splited_fields:
-        key = key.strip()
-        value = {}
-        if key.find('{') > -1:
-            # get sub fields: field{<sub_fields>} and assign its value
-            sub_field = re.findall('{(.*)}', key)
-            value = fields_to_dict(sub_field[0])
-            # clean key
-            key = re.sub('{(.*)}', '', key)
+class FieldsParser(object):
+    """Recursive descent parser of the `fields` expression:
 
-        if key.find('[') > -1:
-            # get & set slide range: [a:b]
-            value['__slice'] = re.findall('\[(.*)\]', key)[0]
-            # clean key
-            key = re.sub('\[(.*)\]', '', key)
+    fields := field (',' field)*
+    field := name ('[' slice ']')? ('{' fields '}')? ('[' slice ']')?
+    """
 
-        result[key] = value
+    def __init__(self, expression):
+        self.expression = expression
+        self.pos = 0
 
-    return result
+    def error(self):
+        return ValueError('Invalid fields: {}'.format(self.expression))
 
+    def peek(self):
+        return self.expression[self.pos] if self.pos < len(self.expression) else None
 
+    def parse(self):
+        selector = self.parse_fields()
+        if self.peek() is not None:
+            raise self.error()
+        return selector
 
-def filter_dict_recursive(origin_dict, fields_dict):
-    result = {}
-    for key, value in fields_dict.iteritems():
+    def parse_fields(self):
+        fields = {}
+        while True:
+            key, selector = self.parse_field()
+            if key:
+                fields[key] = selector
+            if self.peek() != ',':
+                return FieldSelector(fields)
+            self.pos += 1
 
-        if origin_dict.get(key) is None:
-            continue
+    def parse_field(self):
+        start = self.pos
+        while self.peek() not in (None, ',', '{', '}', '[', ']'):
+            self.pos += 1
+        key = self.expression[start:self.pos].strip()
 
-        # exp: roles{id,name} -> key: `roles`, value: `{id,name}`
-        if type(value) is dict and len(value) > 0:
-            if type(origin_dict[key]) is dict:
-                result[key] = filter_dict_recursive(origin_dict[key], value)
-            elif type(origin_dict[key]) is list:
-                result[key] = [filter_dict_recursive(k, value) for k in origin_dict[key]]
-            else:
-                result[key] = origin_dict[key]
+        slice_range = self.parse_slice()
+        selector = FieldSelector()
+        if self.peek() == '{':
+            self.pos += 1
+            selector = self.parse_fields()
+            if self.peek() != '}':
+                raise self.error()
+            self.pos += 1
+        slice_range = self.parse_slice() or slice_range
+
+        if slice_range is not None:
+            if not key:
+                raise self.error()
+            selector.slice_range = slice_range
+            try:
+                selector.get_slice()
+            except (TypeError, ValueError):
+                raise self.error()
+        return key, selector
+
+    def parse_slice(self):
+        if self.peek() != '[':
+            return None
+        end = self.expression.find(']', self.pos)
+        if end == -1:
+            raise self.error()
+        slice_range = self.expression[self.pos + 1:end]
+        self.pos = end + 1
+        return slice_range
+
+
+_field_selectors = LRUCache(max_size=256, ttl=0)
+
+
+def compile_fields(fields):
+    """Compile the `fields` expression into the field selector memoized by the expression
+
+    :param fields the fields expression
+    :return the field selector
+    """
+    if not fields or len(fields.strip()) == 0:
+        return FieldSelector()
+
+    selector = _field_selectors.get(fields)
+    if selector is None:
+        selector = FieldsParser(fields).parse()
+        _field_selectors.set(fields, selector)
+    return selector
 
-        else:
-            result[key] = origin_dict[key]
 
-        if value.get('__slice') is not None:
-            slice_indexes = map(int, value.get('__slice').split(':'))
-            result[key] = result[key][slice(*slice_indexes)]
-    return result
+def make_field_selector(fields):
+    """Make the field selector from the fields expression, the fields dict or the selector"""
+    if isinstance(fields, FieldSelector):
+        return fields
+    if isinstance(fields, dict):
+        return FieldSelector.from_dict(fields)
+    return compile_fields(fields)
+
+
+def fields_to_dict(fields):
+    """Parse the fields expression into the fields dict,
+    for example: `id,roles[0:5]{id,name}` => {'id': {}, 'roles': {'__slice': '0:5', 'id': {},
+    'name': {}}}
+    """
+    return compile_fields(fields).to_dict()
+
+
+def filter_dict_recursive(origin_dict, fields_dict):
+    return FieldSelector.from_dict(fields_dict).filter(origin_dict)
 
 
 def filter_dict(origin_dict, fields=None):
-    fields_dict = fields_to_dict(fields)
+    selector = compile_fields(fields)
 
-    return origin_dict.copy() if len(fields_dict) == 0 else \
-        filter_dict_recursive(origin_dict, fields_dict)
+    return origin_dict.copy() if not selector else selector.filter(origin_dict)
 
 
 def filter_list(origin_list, fields=None):
-    return origin_list if fields is None else \
-        [filter_dict(obj, fields) for obj in origin_list]
+    return origin_list if fields is None else compile_fields(fields).filter_many(origin_list)
+
+
+def restrict_schema(schema, selector):
+    """Make a new schema instance of the same class serializing the selected fields only,
+    the nested schemas are restricted by their sub selectors.
+
+    :param schema the schema instance
+    :param selector the field selector
+    :return the restricted schema instance
+    """
+    only = tuple(key for key in selector if key in schema.declared_fields)
+    restricted = schema.__class__(only=only, many=schema.many, context=schema.context)
+
+    for key in only:
+        sub_selector = selector.fields[key]
+        if not sub_selector:
+            continue
+
+        field = restricted.declared_fields[key]
+        list_field = None
+        if isinstance(field, ma_fields.List):
+            list_field, field = field, field.container
+        if not isinstance(field, ma_fields.Nested):
+            continue
+
+        if field.only:
+            declared_only = (field.only,) if isinstance(field.only, basestring) else field.only
+            sub_selector = FieldSelector(dict((k, v) for k, v in sub_selector.fields.iteritems()
+                                              if k in declared_only))
+
+        nested = field.nested
+        if isinstance(nested, basestring):
+            nested = class_registry.get_class(nested)
+        if not isinstance(nested, SchemaABC):
+            nested = nested(many=field.many, exclude=field.exclude)
+
+        # fields are shallow copied by the schema instances, so they must not be mutated
+        nested_field = ma_fields.Nested(restrict_schema(nested, sub_selector),
+                                        many=field.many, attribute=field.attribute,
+                                        default=field.default)
+        if list_field is not None:
+            list_field = copy.copy(list_field)
+            list_field.container = nested_field
+            restricted.declared_fields[key] = list_field
+        else:
+            restricted.declared_fields[key] = nested_field
+
+    return restricted
 
 
 class Schema(SchemaOrigin):
+    #: the key of the field the `fields` selection applies to, for example: 'data' for the list
+    #: schemas so that `fields=id,email` selects the fields of the items, not of the envelope
+    fields_scope = None
+
     def dump(self, obj, many=None, update_fields=True, fields=None, **kwargs):
-        result, errors = super(Schema, self).dump(obj, many, update_fields, **kwargs)
-        data = filter_list(result, fields) if many is True else filter_dict(result, fields)
+        selector = make_field_selector(fields)
+
+        if not selector:
+            return super(Schema, self).dump(obj, many, update_fields, **kwargs)
+
+        if self.fields_scope:
+            selector = selector.scope(self.fields_scope, self.declared_fields)
+
+        # serialize the selected fields only then filter them in one pass for the slices
+        schema = restrict_schema(self, selector)
+        result, errors = super(Schema, schema).dump(obj, many, update_fields, **kwargs)
+        data = selector.filter_many(result) if many is True else selector.filter(result)
         return MarshalResult(data, errors)
 
     def dumps(self, obj, many=None, update_fields=True, fields=None, *args, **kwargs):
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""streaming of the large json responses and of the exports"""
+
+from abc import ABCMeta, abstractmethod
+import csv
+import io
+
+from .schemas import make_field_selector, restrict_schema
+
+
+class JSONStream(object):
+    """JSON document of a dict marshalled by a schema, encoded chunk by chunk.
+
+    The items of the `stream_key` value are serialized one at a time, the other values are
+    serialized after them so they may be callables evaluated once the items are iterated,
+    for example: the paging of a :class:`app.pagination.LazyData` page.
+    """
+
+    def __init__(self, obj, schema, stream_key='data', fields=None, buffer_size=100):
+        """
+        :param obj the dict to be marshalled
+        :param schema the schema of the dict, the `stream_key` field is a list of nested items
+        :param stream_key the key of the items to be streamed
+        :param fields the optional fields selection of the items
+        :param buffer_size the number of items encoded per chunk
+        """
+        self.obj = obj
+        self.schema = schema
+        self.stream_key = stream_key
+        self.selector = make_field_selector(fields)
+        self.buffer_size = buffer_size
+
+    def get_item_schema(self):
+        """Get the schema of the items, restricted by the fields selection if any"""
+        schema = self.schema
+        if self.selector:
+            schema = restrict_schema(schema, self.selector.scope(self.stream_key,
+                                                                 schema.declared_fields))
+        return schema.declared_fields[self.stream_key].container.schema
+
+    def iter_encode(self, dumps, **settings):
+        """Encode the document chunk by chunk
+
+        :param dumps the dumps function of the json encoder
+        :param settings the settings of the dumps function
+        """
+        item_schema = self.get_item_schema()
+        buffered = []
+        separator = ''
+
+        yield '{{{}:['.format(dumps(self.stream_key))
+        for item in self.obj[self.stream_key]:
+            data = item_schema.dump(item).data
+            if self.selector:
+                data = self.selector.filter(data)
+            buffered.append(separator + dumps(data, **settings))
+            separator = ','
+            if len(buffered) >= self.buffer_size:
+                yield ''.join(buffered)
+                buffered = []
+        buffered.append(']')
+        yield ''.join(buffered)
+
+        rest = dict((key, value() if callable(value) else value)
+                    for key, value in self.obj.iteritems() if key != self.stream_key)
+        rest_data = self.schema.dump(rest, fields=self.selector or None).data
+        rest_data.pop(self.stream_key, None)
+        if rest_data:
+            # append the other keys to the opened document
+            yield ',' + dumps(rest_data, **settings)[1:]
+        else:
+            yield '}'
+        yield '\n'
+
+
+class RowStream(object):
+    """Items marshalled by a schema one at a time, encoded row by row"""
+
+    __metaclass__ = ABCMeta
+
+    #: the content type of the encoded rows
+    content_type = None
+
+    def __init__(self, items, schema, fields=None, buffer_size=100):
+        """
+        :param items the iterable of the items
+        :param schema the schema of an item
+        :param fields the optional fields selection of the items
+        :param buffer_size the number of rows encoded per chunk
+        """
+        self.items = items
+        self.schema = schema
+        self.selector = make_field_selector(fields)
+        self.buffer_size = buffer_size
+
+    def iter_rows(self):
+        """Iterate the marshalled items, restricted by the fields selection if any"""
+        schema = restrict_schema(self.schema, self.selector) if self.selector else self.schema
+        for item in self.items:
+            data = schema.dump(item).data
+            yield self.selector.filter(data) if self.selector else data
+
+    def iter_encode(self, dumps, **settings):
+        """Encode the rows chunk by chunk
+
+        :param dumps the dumps function of the json encoder
+        :param settings the settings of the dumps function
+        """
+        buffered = []
+        for row in self.iter_rows():
+            buffered.append(self.encode_row(row, dumps, **settings))
+            if len(buffered) >= self.buffer_size:
+                yield ''.join(buffered)
+                buffered = []
+        if buffered:
+            yield ''.join(buffered)
+
+    @abstractmethod
+    def encode_row(self, row, dumps, **settings):
+        """Encode a marshalled row
+
+        :param row the marshalled item
+        :param dumps the dumps function of the json encoder
+        :param settings the settings of the dumps function
+        :return the encoded row
+        """
+        pass
+
+
+class NDJSONStream(RowStream):
+    """Newline delimited json rows, see: http://ndjson.org"""
+
+    content_type = 'application/x-ndjson; charset=utf-8'
+
+    def encode_row(self, row, dumps, **settings):
+        return dumps(row, **settings) + '\n'
+
+
+class CSVStream(RowStream):
+    """CSV rows with a header row of the selected columns, the nested values are json encoded"""
+
+    content_type = 'text/csv; charset=utf-8'
+
+    def __init__(self, items, schema, fields=None, buffer_size=100):
+        super(CSVStream, self).__init__(items, schema, fields, buffer_size)
+        declared_fields = schema.declared_fields
+        self.columns = sorted((key for key in declared_fields
+                               if not self.selector or key in self.selector),
+                              key=lambda key: declared_fields[key]._creation_index)
+        self.output = io.BytesIO()
+        self.writer = csv.writer(self.output)
+
+    def iter_encode(self, dumps, **settings):
+        yield self.encode_values(self.columns)
+        for chunk in super(CSVStream, self).iter_encode(dumps, **settings):
+            yield chunk
+
+    def encode_row(self, row, dumps, **settings):
+        values = []
+        for column in self.columns:
+            value = row.get(column)
+            if isinstance(value, (dict, list)):
+                value = dumps(value, **settings)
+            values.append(value)
+        return self.encode_values(values)
+
+    def encode_values(self, values):
+        """Encode a csv row, the writer output is reused for all the rows"""
+        self.writer.writerow([value.encode('utf-8') if isinstance(value, unicode) else value
+                              for value in values])
+        encoded = self.output.getvalue()
+        self.output.seek(0)
+        self.output.truncate()
+        return encoded
+
+
+# the row streams by export formats
+ROW_STREAMS = {
+    'ndjson': NDJSONStream,
+    'csv': CSVStream
+}
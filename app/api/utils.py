@@ -1,6 +1,8 @@
 import re
 
+from ..pagination import LazyData
 from ..utils import extract_dict, parse_number
+from .streaming import JSONStream
 
 
 SUPPORTED_OPS = frozenset(['eq', 'ne', 'lt', 'le', 'gt', 'ge', 'lk', 'nl', 'in', 'ni', 'ct', 'mc'])
@@ -50,10 +52,16 @@ def extract_filters(args):
     return filters, args
 
 
-def marshal(data, schema=None, envelope=None):
-    """Marshal data with marshmallow"""
+def marshal(data, schema=None, envelope=None, fields=None):
+    """Marshal data with marshmallow, only the selected fields if provided.
+    The data with the lazy items are marshalled into a json stream."""
+    if schema and envelope is None and isinstance(data, dict):
+        stream_key = schema.fields_scope or 'data'
+        if isinstance(data.get(stream_key), LazyData):
+            return JSONStream(data, schema, stream_key, fields)
+
     if schema:
-        result = schema.dump(data)  # TODO(hoatle): handle error?
+        result = schema.dump(data, fields=fields)  # TODO(hoatle): handle error?
         data = result.data
 
     if envelope:
@@ -19,7 +19,9 @@ import errors
 from .users import UserResource
 from .token import TokenResource
 from .roles import RoleResource
+from .timings import TimingResource
 
 UserResource.register(api_bp)
 TokenResource.register(api_bp)
 RoleResource.register(api_bp)
+TimingResource.register(api_bp)
@@ -1,6 +1,8 @@
 from webargs import fields
 
-from ..api.validators import Email, password
+from ..api.streaming import ROW_STREAMS
+from ..api.validators import Email, AnyOf, password
+from ..pagination import OffsetPagination, TimePagination
 
 user_args = {
     'email': fields.Str(validate=Email, required=True),
@@ -11,3 +13,34 @@ role_args = {
     'name': fields.Str(required=True),
     'description': fields.Str(required=True)
 }
+
+query_args = {
+    'q': fields.Str()
+}
+
+paging_args = {
+    'sort': fields.Str(),
+    'offset': fields.Int(),
+    'limit': fields.Int(),
+    'count': fields.Str(validate=AnyOf(OffsetPagination.count_modes)),
+    'before': fields.Str(),
+    'after': fields.Str(),
+    'since': fields.Str(),
+    'until': fields.Str(),
+    'since_id': fields.Int(),
+    'until_id': fields.Int(),
+    'time_key': fields.Str(validate=AnyOf(TimePagination.time_keys))
+}
+
+id_args = {
+    'id': fields.Int(required=True)
+}
+
+fields_args = {
+    'fields': fields.Str()
+}
+
+export_args = {
+    'format': fields.Str(validate=AnyOf(sorted(ROW_STREAMS))),
+    'fields': fields.Str()
+}
@@ -1,16 +1,17 @@
 from flask import url_for
 from flask_classy import route
 from webargs import fields
-from webargs.flaskparser import use_args
 
 from ..api import (TokenRequiredResource, marshal_with, marshal_with_data_envelope,
-                   permissions_required, paginated, make_empty_response)
-from ..api.decorators import extract_args
+                   permissions_required, paginated, make_empty_response, exported, batched)
+from ..api.decorators import extract_args, use_args
 from ..auth.permissions import admin_role_permission
+from ..exceptions import ConflictException
 from ..extensions import auth_datastore
+from ..utils import merge_dict
 
 from .schemas import RoleSchema, RoleListSchema
-from .args import role_args
+from .args import role_args, query_args, paging_args, fields_args, export_args, id_args
 
 _role_schema = RoleSchema()
 
@@ -19,6 +20,15 @@ search_args = {
     'description': fields.Str()
 }
 
+list_args = merge_dict(merge_dict(search_args, query_args), merge_dict(paging_args, fields_args))
+
+role_export_args = merge_dict(merge_dict(search_args, query_args), export_args)
+
+
+def _name_conflict(item):
+    return ConflictException('Conflict', description='name already exists: {}'
+                             .format(item['name']))
+
 
 class RoleResource(TokenRequiredResource):
 
@@ -26,10 +36,17 @@ class RoleResource(TokenRequiredResource):
     @permissions_required(admin_role_permission)
     @marshal_with(RoleListSchema())
     @paginated
-    @extract_args(search_args)
+    @extract_args(list_args)
     def list(self, args):
         return auth_datastore.find_roles(**args), args
 
+    @route('export', methods=['GET'])
+    @permissions_required(admin_role_permission)
+    @exported(_role_schema)
+    @extract_args(role_export_args)
+    def export(self, args):
+        return auth_datastore.find_roles(**args), args
+
     @marshal_with_data_envelope(_role_schema)
     def read(self, id):
         return auth_datastore.read_role(id)
@@ -40,11 +57,30 @@ class RoleResource(TokenRequiredResource):
     @use_args(role_args)
     def create(self, args):
         role = auth_datastore.create_role(**args)
-        location = url_for('.roles.read', _external=True, **{'id': role.id})
+        location = url_for('.roles:read', _external=True, **{'id': role.id})
         return role, 201, {
             'Location': location
         }
 
+    @route(':batch', methods=['POST'])
+    @permissions_required(admin_role_permission)
+    @batched(role_args, status_code=201, error=_name_conflict)
+    def batch_create(self, items, chunk_size):
+        return auth_datastore.bulk_create_roles(items, chunk_size=chunk_size)
+
+    @route(':batch', methods=['PUT'])
+    @permissions_required(admin_role_permission)
+    @batched(merge_dict(search_args, id_args), conflict=_name_conflict)
+    def batch_update(self, items, chunk_size):
+        return auth_datastore.bulk_update_roles(items, chunk_size=chunk_size)
+
+    @route(':batch', methods=['DELETE'])
+    @permissions_required(admin_role_permission)
+    @batched(id_args)
+    def batch_delete(self, items, chunk_size):
+        return auth_datastore.bulk_delete_roles([item['id'] for item in items],
+                                                chunk_size=chunk_size)
+
     @route('<id>', methods=['PUT'])
     @permissions_required(admin_role_permission)
     @marshal_with_data_envelope(_role_schema)
@@ -3,10 +3,17 @@ from marshmallow import fields
 from ..api.schemas import Schema
 
 
+class CursorsSchema(Schema):
+    before = fields.Str()
+    after = fields.Str()
+
+
 class PagingSchema(Schema):
     count = fields.Int()
+    count_mode = fields.Str()
     offset = fields.Int()
     limit = fields.Int()
+    cursors = fields.Nested(CursorsSchema)
     previous = fields.Str()
     next = fields.Str()
 
@@ -20,6 +27,8 @@ class RoleSchema(Schema):
 
 
 class RoleListSchema(Schema):
+    fields_scope = 'data'
+
     data = fields.List(fields.Nested(RoleSchema))
     paging = fields.Nested(PagingSchema)
 
@@ -35,5 +44,7 @@ class UserSchema(Schema):
 
 
 class UserListSchema(Schema):
+    fields_scope = 'data'
+
     data = fields.List(fields.Nested(UserSchema))
     paging = fields.Nested(PagingSchema)
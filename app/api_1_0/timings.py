@@ -0,0 +1,17 @@
+from ..api import AdminRoleRequiredResource, make_empty_response
+from ..extensions import password_verifier, timings
+
+
+class TimingResource(AdminRoleRequiredResource):
+    """The request timings of the process by endpoint and phase, see `app.timings`, with the
+    metrics of the password verifications of the process, see `app.auth.passwords`"""
+
+    route_base = 'timings'
+
+    def index(self):
+        return {'data': timings.get_stats(), 'passwords': password_verifier.get_metrics()}
+
+    def delete(self):
+        timings.reset()
+        password_verifier.reset_metrics()
+        return make_empty_response(204)
@@ -10,7 +10,9 @@ from .. import utils
 from ..api import (Resource, one_of, token_auth_required, http_auth_required, jwt_make_payload,
                    jwt_encode_payload, jwt_authenticate)
 from ..api.validators import NumberRange, Email, password
+from ..auth.tokens import TokenUser
 from ..exceptions import BadRequestException
+from ..extensions import auth_datastore
 
 _user_args = {
     'email': fields.Str(validate=Email, required=True),
@@ -52,7 +54,11 @@ class TokenResource(Resource):
         resources.
         """
         args = parser.parse(self.common_args)
-        return self._token_result(current_user, args.get('expires_in'))
+        user = current_user._get_current_object()
+        if isinstance(user, TokenUser):
+            # the renewed token carries the current roles and password of the user
+            user = auth_datastore.read_user(user.id)
+        return self._token_result(user, args.get('expires_in'))
 
     def create(self):
         """Login and return JWT token
@@ -2,16 +2,17 @@ from flask import url_for
 from flask_security import current_user
 from flask_classy import route
 from webargs import fields
-from webargs.flaskparser import use_args
 
-from ..auth import admin_role_permission, user_permission
+from ..auth import admin_role_permission, user_permission, can
 from ..api import (Resource, marshal_with, marshal_with_data_envelope, token_auth_required, one_of,
-                   anonymous_required, permissions_required, validators, paginated, extract_args)
+                   anonymous_required, permissions_required, validators, paginated, extract_args,
+                   exported, batched, use_args)
 from ..extensions import auth_datastore
-from ..exceptions import UnauthorizedException
+from ..exceptions import UnauthorizedException, ConflictException
+from ..utils import merge_dict
 
 from .schemas import UserSchema, UserListSchema, RoleListSchema
-from .args import user_args
+from .args import user_args, query_args, paging_args, fields_args, export_args, id_args
 
 _user_schema = UserSchema()
 _user_list_schema = UserListSchema()
@@ -23,6 +24,20 @@ search_args = {
     'active': fields.Boolean()
 }
 
+update_args = {
+    'email': fields.Str(validate=validators.Email()),
+    'active': fields.Boolean()
+}
+
+list_args = merge_dict(merge_dict(search_args, query_args), merge_dict(paging_args, fields_args))
+
+user_export_args = merge_dict(merge_dict(search_args, query_args), export_args)
+
+
+def _email_conflict(item):
+    return ConflictException('Conflict', description='email already exists: {}'
+                             .format(item['email']))
+
 
 class UserResource(Resource):
 
@@ -33,7 +48,7 @@ class UserResource(Resource):
 
         specified_user_permission = user_permission(long(user_id))
 
-        if not (specified_user_permission.can() or admin_role_permission.can()):
+        if not (can(specified_user_permission) or can(admin_role_permission)):
             description = '{} or {} required'.format(specified_user_permission,
                                                      admin_role_permission)
             raise UnauthorizedException('Invalid Permission',
@@ -45,10 +60,17 @@ class UserResource(Resource):
     @permissions_required(admin_role_permission)
     @marshal_with(_user_list_schema)
     @paginated
-    @extract_args(search_args)
+    @extract_args(list_args)
     def list(self, args):
         return auth_datastore.find_users(**args), args
 
+    @route('export', methods=['GET'])
+    @token_auth_required()
+    @permissions_required(admin_role_permission)
+    @exported(_user_schema)
+    @extract_args(user_export_args)
+    def export(self, args):
+        return auth_datastore.find_users(**args), args
 
     @token_auth_required()
     @marshal_with_data_envelope(_user_schema)
@@ -68,12 +90,32 @@ class UserResource(Resource):
             'Location': location
         }
 
+    @route(':batch', methods=['POST'])
+    @token_auth_required()
+    @permissions_required(admin_role_permission)
+    @batched(user_args, status_code=201, error=_email_conflict, max_items='BATCH_MAX_USERS')
+    def batch_create(self, items, chunk_size):
+        return auth_datastore.bulk_create_users(items, chunk_size=chunk_size)
+
+    @route(':batch', methods=['PUT'])
+    @token_auth_required()
+    @permissions_required(admin_role_permission)
+    @batched(merge_dict(update_args, id_args), conflict=_email_conflict)
+    def batch_update(self, items, chunk_size):
+        return auth_datastore.bulk_update_users(items, chunk_size=chunk_size)
+
+    @route(':batch', methods=['DELETE'])
+    @token_auth_required()
+    @permissions_required(admin_role_permission)
+    @batched(id_args)
+    def batch_delete(self, items, chunk_size):
+        return auth_datastore.bulk_delete_users([item['id'] for item in items],
+                                                chunk_size=chunk_size)
+
     @route('<id>', methods=['PUT'])
+    @token_auth_required()
     @marshal_with_data_envelope(_user_schema)
-    @use_args({
-        'email': fields.Str(validate=validators.Email()),
-        'active': fields.Boolean()
-    })
+    @use_args(update_args)
     def update(self, args, id):
         id = self._check_current_user_or_admin_role(id)
         return auth_datastore.update_user(id, **args)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 """main application entry point"""
+import logging
 import os
 
 from flask import Flask
@@ -8,7 +9,7 @@ from flask import Flask
 from .config import BaseConfig, MODES
 from .utils import INSTANCE_FOLDER_PATH
 from .blueprints import register_blueprints
-from .extensions import init_apps
+from .extensions import init_apps, timings, query_monitor
 from .errors import register_error_handlers
 
 
@@ -53,7 +54,8 @@ def _configure_app(app, config=None):
 
 def _configure_hooks(app):
     """configure hooks"""
-    pass
+    timings.init_app(app)
+    query_monitor.init_app(app)
 
 
 def _configure_blueprints(app):
@@ -67,8 +69,13 @@ def _configure_extensions(app):
 
 
 def _configure_logging(app):
-    """configure logging"""
-    pass
+    """configure logging of the app modules to stderr at the LOG_LEVEL config"""
+    logger = logging.getLogger('app')
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(app.config.get('LOG_FORMAT')))
+        logger.addHandler(handler)
+    logger.setLevel(app.config.get('LOG_LEVEL', logging.INFO))
 
 
 def _configure_template_filters(app):
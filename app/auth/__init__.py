@@ -4,4 +4,4 @@
 
 from .decorators import permissions_required, permissions_accepted, roles_required, roles_accepted
 from .permissions import (user_role_permission, admin_role_permission, user_permission,
-                          role_permission)
+                          role_permission, can, change_identity)
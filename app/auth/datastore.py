@@ -1,10 +1,16 @@
 from abc import abstractmethod, ABCMeta
 from datetime import datetime
 
-from flask_security.utils import encrypt_password
+from flask import current_app, has_app_context
+from flask_security.utils import encrypt_password, md5
+from sqlalchemy import inspect
+from sqlalchemy.orm import subqueryload
+from werkzeug.security import safe_str_cmp
 
+from ..cache import NullCache
 from ..datastore import SQLAlchemyDatastore
-from ..utils import fix_docs
+from .tokens import TokenUser
+from ..utils import fix_docs, extract_dict, chunked
 
 
 class AuthDatastore(object):
@@ -87,6 +93,48 @@ class AuthDatastore(object):
         """
         pass
 
+    @abstractmethod
+    def bulk_create_users(self, items, **kwargs):
+        """Creates the new users of the items in one transaction, the items conflicting on the
+        email are skipped.
+
+        .. versionadded:: 0.1.0
+
+        :param items: the list of the user dicts.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the created primary ids, None for the skipped items
+        """
+        pass
+
+    @abstractmethod
+    def bulk_update_users(self, items, **kwargs):
+        """Updates the existing users of the items by their primary ids in one transaction, the
+        items conflicting on the email are skipped.
+
+        .. versionadded:: 0.1.0
+
+        :param items: the list of the user dicts with their primary ids.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the updated primary ids, None for the not found items, False for the
+                conflicting items
+        """
+        pass
+
+    @abstractmethod
+    def bulk_delete_users(self, pids, **kwargs):
+        """Deletes the existing users by their primary ids in one transaction.
+
+        .. versionadded:: 0.1.0
+
+        :param pids: the list of the primary ids.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the deleted primary ids, None for the not found ones
+        """
+        pass
+
     # roles
     @abstractmethod
     def find_roles(self, q=None, filters=None, sort=None, offset=None, limit=None, **kwargs):
@@ -159,6 +207,48 @@ class AuthDatastore(object):
         """
         pass
 
+    @abstractmethod
+    def bulk_create_roles(self, items, **kwargs):
+        """Creates the new roles of the items in one transaction, the items conflicting on the
+        name are skipped.
+
+        .. versionadded:: 0.1.0
+
+        :param items: the list of the role dicts.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the created primary ids, None for the skipped items
+        """
+        pass
+
+    @abstractmethod
+    def bulk_update_roles(self, items, **kwargs):
+        """Updates the existing roles of the items by their primary ids in one transaction, the
+        items conflicting on the name are skipped.
+
+        .. versionadded:: 0.1.0
+
+        :param items: the list of the role dicts with their primary ids.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the updated primary ids, None for the not found items, False for the
+                conflicting items
+        """
+        pass
+
+    @abstractmethod
+    def bulk_delete_roles(self, pids, **kwargs):
+        """Deletes the existing roles by their primary ids in one transaction.
+
+        .. versionadded:: 0.1.0
+
+        :param pids: the list of the primary ids.
+        :param kwargs: the optional kwargs, for example: chunk_size
+
+        :return the list of the deleted primary ids, None for the not found ones
+        """
+        pass
+
     # @abstractmethod
     # def find_roles_from_user(self, user_id, q=None, filters=None, sort=None, offset=None,
     #                          limit=None, **kwargs):
@@ -189,6 +279,179 @@ class SQLAlchemyAuthDatastore(SQLAlchemyDatastore, AuthDatastore):
     """
     Implementation for AuthDataStore with SQLAlchemy
     """
+
+    eager_loads = {
+        'user': {'roles': subqueryload}
+    }
+
+    # the indexed columns of the users, any column of the small role table
+    sort_keys = {
+        'user': ('id', 'email', 'created_at', 'updated_at'),
+        'role': ('id', 'name', 'description', 'created_at', 'updated_at')
+    }
+
+    search_fields = {
+        'user': ('email',),
+        'role': ('name', 'description')
+    }
+
+    #: the well-known role names resolved from the role cache
+    cached_role_names = ('user', 'admin')
+
+    def __init__(self, db, identity_cache=None, role_cache=None, token_revocations=None):
+        super(SQLAlchemyAuthDatastore, self).__init__(db)
+        self.identity_cache = identity_cache if identity_cache is not None else NullCache()
+        self.role_cache = role_cache if role_cache is not None else NullCache()
+        self.token_revocations = token_revocations
+
+    # Identity cache
+    @staticmethod
+    def _identity_key(pid):
+        return 'user:{}'.format(pid)
+
+    def get_cached_user(self, pid, password_digest):
+        """Gets the user cached by :meth:`cache_user` without hitting the database, made of its
+        cached identity as the user of a stateless token.
+
+        :param pid: primary id of an user.
+        :param password_digest: the md5 digest of the user password the cache entry must match.
+
+        :return the cached `TokenUser` or None if not found or not matched
+        """
+        cached = self.identity_cache.get(self._identity_key(pid))
+        if cached is None or not safe_str_cmp(cached['pwd'], password_digest):
+            return None
+        return TokenUser(cached)
+
+    def cache_user(self, user):
+        """Caches the identity of a loaded user into the identity cache: its id, the md5 digest of
+        its password, its active flag and its role names, plain data only.
+
+        :param user: the loaded user.
+        """
+        self.identity_cache.set(self._identity_key(user.id), {
+            'sub': user.id,
+            'pwd': md5(user.password),
+            'active': bool(user.active),
+            'roles': [role.name for role in user.roles]
+        })
+
+    def uncache_user(self, pid):
+        """Removes a user from the identity cache.
+
+        :param pid: primary id of an user.
+        """
+        self.identity_cache.delete(self._identity_key(pid))
+
+    def uncache_users_after_commit(self, pids):
+        """Removes users from the identity cache once their changes are committed, a request
+        loading them meanwhile would cache them again as they were.
+
+        :param pids: the primary ids of the users.
+        """
+        pids = list(pids)
+        self.after_commit(lambda: [self.uncache_user(pid) for pid in pids])
+
+    def uncache_role_users_after_commit(self, pids):
+        """Removes the users linked to roles from the identity cache once the changes of the roles
+        are committed and revokes their stateless tokens, the cached users and the tokens carry
+        their roles.
+
+        :param pids: the primary ids of the roles.
+        """
+        user_role = inspect(self.get_model_class('user')).relationships['roles']
+        (_, user_column), = user_role.synchronize_pairs
+        (_, role_column), = user_role.secondary_synchronize_pairs
+        query = self.db.session.query(user_column).filter(role_column.in_(list(pids)))
+        self.invalidate_users(user_pid for user_pid, in query)
+
+    def revoke_user_tokens(self, pids):
+        """Revokes the stateless tokens of users (JWT_STATELESS config) in the current transaction:
+        their revocation times are written for the other processes, the users are added to the
+        token revocations of this process once committed.
+
+        :param pids: the primary ids of the users.
+        """
+        if not (has_app_context() and current_app.config.get('JWT_STATELESS')):
+            return
+        pids = sorted(set(pids))
+        table = self.get_model_class('token_revocation').__table__
+        revoked_at = datetime.utcnow()
+        for chunk in chunked(pids, 500):
+            self.db.session.execute(table.delete().where(table.c.user_id.in_(chunk)))
+            self.db.session.execute(table.insert(), [{'user_id': pid, 'revoked_at': revoked_at}
+                                                     for pid in chunk])
+        if self.token_revocations is not None:
+            self.after_commit(lambda: [self.token_revocations.add(pid) for pid in pids])
+
+    def invalidate_users(self, pids):
+        """Removes users from the identity cache and revokes their stateless tokens once their
+        changes are committed.
+
+        :param pids: the primary ids of the users.
+        """
+        pids = set(pids)
+        self.uncache_users_after_commit(pids)
+        self.revoke_user_tokens(pids)
+
+    def find_revoked_user_ids(self, since):
+        """Finds the primary ids of the users whose tokens were revoked since a time: the users
+        whose password was changed, updated since then by the index of the update times, and the
+        users updated, deleted or whose roles changed, by the index of the revocation times.
+
+        :param since: the utc datetime.
+
+        :return the list of the primary ids
+        """
+        user_class = self.get_model_class('user')
+        revocation_class = self.get_model_class('token_revocation')
+        query = self.db.session.query(user_class.id).filter(user_class.updated_at >= since,
+                                                            user_class.password_version > 0)
+        revoked_query = self.db.session.query(revocation_class.user_id) \
+            .filter(revocation_class.revoked_at >= since)
+        return [pid for pid, in query] + [pid for pid, in revoked_query]
+
+    # Role cache
+    @staticmethod
+    def _role_key(name):
+        return 'role:{}'.format(name)
+
+    def get_role_by_name(self, name):
+        """Gets a role by its name, the primary ids of the well-known roles are resolved from the
+        role cache, their roles are got by primary id from the identity map of the current
+        session or by the primary key.
+
+        :param name: the role name.
+
+        :return the role or None if not found
+        """
+        if name not in self.cached_role_names:
+            return self.find_roles(name=name).first()
+
+        cached = self.role_cache.get(self._role_key(name))
+        if cached is not None:
+            role = self.db.session.query(self.get_model_class('role')).get(cached['id'])
+            if role is not None and role.name == name:
+                return role
+
+        role = self.find_roles(name=name).first()
+        if role is not None:
+            self.role_cache.set(self._role_key(name), {'id': role.id, 'name': role.name})
+        return role
+
+    def uncache_roles(self):
+        """Removes the well-known roles from the role cache."""
+        for name in self.cached_role_names:
+            self.role_cache.delete(self._role_key(name))
+
+    def bulk_link_by_model_name(self, model_name, key, links, **kwargs):
+        super(SQLAlchemyAuthDatastore, self).bulk_link_by_model_name(model_name, key, links,
+                                                                     **kwargs)
+        if model_name == 'user' and key == 'roles':
+            self.invalidate_users(pid for pid, _ in links)
+        elif model_name == 'role' and key == 'users':
+            self.invalidate_users(user_pid for _, user_pid in links)
+
     # User
     def find_users(self, q=None, filters=None, **kwargs):
         accepted_filter_keys = ('email', 'active')
@@ -206,8 +469,10 @@ class SQLAlchemyAuthDatastore(SQLAlchemyDatastore, AuthDatastore):
         # TODO(hoatle): implement verification by signals
         kwargs['active'] = True
         kwargs['confirmed_at'] = datetime.utcnow()
-        user = self.create_by_model_name('user', accepted_keys, **kwargs)
-        user.roles.append(self.find_roles(name='user').first())
+        values = extract_dict(kwargs, extracted_keys=accepted_keys)
+        user = self.get_model_instance('user', **values)
+        user.roles.append(self.get_role_by_name('user'))
+        self.put(user)
         self.commit()
         return user
 
@@ -215,11 +480,41 @@ class SQLAlchemyAuthDatastore(SQLAlchemyDatastore, AuthDatastore):
         return self.read_by_model_name('user', pid, **kwargs)
 
     def update_user(self, pid, **kwargs):
-        return self.update_by_model_name('user', pid, **kwargs)
+        accepted_keys = ('email', 'active')
+        self.invalidate_users([pid])
+        return self.update_by_model_name('user', pid, accepted_keys, **kwargs)
 
     def delete_user(self, pid, **kwargs):
+        self.invalidate_users([pid])
         self.delete_by_model_name('user', pid, **kwargs)
 
+    def bulk_create_users(self, items, **kwargs):
+        accepted_keys = ('email', 'password', 'active', 'confirmed_at')
+        confirmed_at = datetime.utcnow()
+        items = [dict(item, password=encrypt_password(item['password']), active=True,
+                      confirmed_at=confirmed_at) for item in items]
+        pids = self.bulk_create_by_model_name('user', accepted_keys, items, 'email', **kwargs)
+        role = self.get_role_by_name('user')
+        self.bulk_link_by_model_name('user', 'roles',
+                                     [(pid, role.id) for pid in pids if pid is not None],
+                                     **kwargs)
+        self.commit()
+        return pids
+
+    def bulk_update_users(self, items, **kwargs):
+        accepted_keys = ('email', 'active')
+        self.invalidate_users(item['id'] for item in items)
+        pids = self.bulk_update_by_model_name('user', accepted_keys, items, unique_key='email',
+                                              **kwargs)
+        self.commit()
+        return pids
+
+    def bulk_delete_users(self, pids, **kwargs):
+        self.invalidate_users(pids)
+        pids = self.bulk_delete_by_model_name('user', pids, **kwargs)
+        self.commit()
+        return pids
+
     # Role
     def find_roles(self, q=None, filters=None, **kwargs):
         # TODO(hoatle): add this meta into Model instead?
@@ -242,11 +537,37 @@ class SQLAlchemyAuthDatastore(SQLAlchemyDatastore, AuthDatastore):
 
     def update_role(self, pid, **kwargs):
         accepted_keys = ('name', 'description')
-        return self.update_by_model_name('role', pid, accepted_keys)
+        self.uncache_roles()
+        self.uncache_role_users_after_commit([pid])
+        return self.update_by_model_name('role', pid, accepted_keys, **kwargs)
 
     def delete_role(self, pid, **kwargs):
+        self.uncache_roles()
+        self.uncache_role_users_after_commit([pid])
         self.delete_by_model_name('role', pid, **kwargs)
 
+    def bulk_create_roles(self, items, **kwargs):
+        accepted_keys = ('name', 'description')
+        pids = self.bulk_create_by_model_name('role', accepted_keys, items, 'name', **kwargs)
+        self.commit()
+        return pids
+
+    def bulk_update_roles(self, items, **kwargs):
+        accepted_keys = ('name', 'description')
+        self.uncache_roles()
+        self.uncache_role_users_after_commit(item['id'] for item in items)
+        pids = self.bulk_update_by_model_name('role', accepted_keys, items, unique_key='name',
+                                              **kwargs)
+        self.commit()
+        return pids
+
+    def bulk_delete_roles(self, pids, **kwargs):
+        self.uncache_roles()
+        self.uncache_role_users_after_commit(pids)
+        pids = self.bulk_delete_by_model_name('role', pids, **kwargs)
+        self.commit()
+        return pids
+
     # def find_roles_from_user(self, user_id, q=None, filters=None, sort=None, offset=None,
     #                          limit=None, **kwargs):
     #     # TODO
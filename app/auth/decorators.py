@@ -2,12 +2,14 @@
 
 """auth decorators"""
 
-from functools import wraps
 import inspect
 
 from flask import abort
 from flask_principal import PermissionDenied, Permission, RoleNeed
 
+from ..policies import guard
+from .permissions import can
+
 def permissions_required(*permissions, **opt_kwargs):
     """Decorator which specifies that a user must have all the specified permissions.
     Example::
@@ -24,22 +26,22 @@ def permissions_required(*permissions, **opt_kwargs):
 
     If the permission is a function, it will be called with action method args and kwargs
     """
-    def wrapper(func):
-        @wraps(func)
-        def decorated(*args, **kwargs):
-            for permission in permissions:
-                if inspect.isfunction(permission):
-                    permission = permission(args, kwargs)
-
-                if not permission.can():
-                    if opt_kwargs.get('http_exception'):
-                        abort(opt_kwargs['http_exception'], permission)
-                    if callable(opt_kwargs.get('exception_handler')):
-                        return opt_kwargs.get('exception_handler')(permission)
-                    raise PermissionDenied(permission)
-            return func(*args, **kwargs)
-        return decorated
-    return wrapper
+    # the permission functions are known once
+    resolved = [(permission, inspect.isfunction(permission)) for permission in permissions]
+
+    def check(*args, **kwargs):
+        for permission, is_function in resolved:
+            if is_function:
+                permission = permission(args, kwargs)
+
+            if not can(permission):
+                if opt_kwargs.get('http_exception'):
+                    abort(opt_kwargs['http_exception'], permission)
+                if callable(opt_kwargs.get('exception_handler')):
+                    return opt_kwargs.get('exception_handler')(permission)
+                raise PermissionDenied(permission)
+
+    return guard('permission', check)
 
 
 def permissions_accepted(*permissions, **opt_kwargs):
@@ -58,19 +60,17 @@ def permissions_accepted(*permissions, **opt_kwargs):
 
     If the permission is a function, it will be called with action method args and kwargs
     """
-    def wrapper(func):
-        @wraps(func)
-        def decorated(*args, **kwargs):
-            for permission in permissions:
-                if permission.can():
-                    return func(*args, **kwargs)
-            if opt_kwargs.get('http_exception'):
-                abort(opt_kwargs['http_exception'], permissions)
-            if callable(opt_kwargs.get('exception_handler')):
-                return opt_kwargs.get('exception_handler')(permissions)
-            raise PermissionDenied(permissions)
-        return decorated
-    return wrapper
+    def check(*args, **kwargs):
+        for permission in permissions:
+            if can(permission):
+                return None
+        if opt_kwargs.get('http_exception'):
+            abort(opt_kwargs['http_exception'], permissions)
+        if callable(opt_kwargs.get('exception_handler')):
+            return opt_kwargs.get('exception_handler')(permissions)
+        raise PermissionDenied(permissions)
+
+    return guard('permission', check)
 
 
 def roles_accepted(*roles, **opt_kwargs):
@@ -1,6 +1,8 @@
 from datetime import datetime
 
 from flask_security import RoleMixin, UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import NO_VALUE, NEVER_SET
 
 from ..extensions import db
 
@@ -15,8 +17,9 @@ class Role(db.Model, RoleMixin):
     id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
     name = db.Column(db.String(80), unique=True)
     description = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow,
+                           index=True)
 
     @staticmethod
     def insert_roles():
@@ -40,12 +43,31 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     email = db.Column(db.String(255), unique=True)
     password = db.Column(db.String(255))
+    # bumped by the password changes, carried by the stateless tokens
+    password_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     active = db.Column(db.Boolean())
     confirmed_at = db.Column(db.DateTime())
-    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow,
+                           index=True)
     roles = db.relationship('Role', secondary=roles_users,
                             backref=db.backref('users', lazy='dynamic'))
 
     def __repr__(self):
         return '<User(id="%s", email="%s")>' % (self.id, self.email)
+
+
+class TokenRevocation(db.Model):
+    """The last revocation of the stateless tokens of a user, kept once the user is deleted"""
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revoked_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return '<TokenRevocation(user_id="%s", revoked_at="%s")>' % (self.user_id, self.revoked_at)
+
+
+@event.listens_for(User.password, 'set', active_history=True)
+def bump_password_version(user, value, oldvalue, initiator):
+    """Bumps the password version when the password of an existing user is changed"""
+    if oldvalue not in (NO_VALUE, NEVER_SET) and value != oldvalue:
+        user.password_version = (user.password_version or 0) + 1
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+    passwords
+    ~~~~~~~~~
+
+    password verification of the jwt and basic authentications
+
+    The password hashes (bcrypt) are verified by a bounded pool of threads per process, the
+    verifications beyond the pool and its queue are rejected instead of piling up on the workers.
+
+    The hash times (with their wait for a thread) are the hash phase of the timed requests, the
+    metrics of the verifications of the process are served with the timings by /api/v1.0/timings.
+
+    The verified credentials are cached for a short time by the keyed HMAC of the user id, the
+    password hash and the password, so the repeated basic authentications are not hashed again.
+    The failed verifications are never cached, every guess costs a full hash. A changed password
+    changes the cache key, the previous entries can not match anymore.
+"""
+
+import hashlib
+import hmac
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
+
+from flask import current_app
+from flask_security.utils import encode_string, encrypt_password, get_hmac
+
+from ..cache import NullCache
+from ..exceptions import ServiceUnavailableException
+from ..timings import current_timings
+
+
+class PasswordVerifier(object):
+    """Verifies the passwords of the users by a bounded thread pool with a verified credential
+    cache, configured by the PASSWORD_VERIFY_* config.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, credential_cache=None, app=None):
+        self.credential_cache = credential_cache if credential_cache is not None else NullCache()
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self.pool = None
+        self.pool_pid = None
+        self.slots = None
+        self.lock = threading.Lock()
+        self.reset_metrics()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configures the pool by the PASSWORD_VERIFY_* config of the app.
+
+        .. versionadded:: 0.1.0
+
+        :param app: the Flask app.
+        """
+        self.workers = app.config.get('PASSWORD_VERIFY_WORKERS', 0)
+        self.queue_size = app.config.get('PASSWORD_VERIFY_QUEUE_SIZE', 0)
+        self.timeout = app.config.get('PASSWORD_VERIFY_TIMEOUT', None)
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size) \
+            if self.workers else None
+
+    def get_pool(self):
+        """Gets the thread pool of the current process, started at its first verification as the
+        threads do not survive the forks of the workers"""
+        if self.pool is None or self.pool_pid != os.getpid():
+            with self.lock:
+                if self.pool is None or self.pool_pid != os.getpid():
+                    self.pool = ThreadPool(self.workers)
+                    self.pool_pid = os.getpid()
+        return self.pool
+
+    def reset_metrics(self):
+        self.metrics = {
+            'verifications': 0,
+            'cache_hits': 0,
+            'rejections': 0,
+            'hash_seconds': 0.0,
+            'hash_seconds_max': 0.0
+        }
+
+    def record(self, name, value=1):
+        with self.lock:
+            self.metrics[name] += value
+
+    def record_hash(self, seconds):
+        with self.lock:
+            self.metrics['verifications'] += 1
+            self.metrics['hash_seconds'] += seconds
+            self.metrics['hash_seconds_max'] = max(self.metrics['hash_seconds_max'], seconds)
+        # the hash phase of the timed request, see `app.timings`
+        timings = current_timings()
+        if timings is not None:
+            timings.add('hash', seconds)
+
+    def get_metrics(self):
+        """Gets the snapshot of the metrics with the average hash time.
+
+        .. versionadded:: 0.1.0
+
+        :return the dict of the metrics
+        """
+        with self.lock:
+            metrics = dict(self.metrics)
+        verifications = metrics['verifications']
+        metrics['hash_seconds_avg'] = metrics['hash_seconds'] / verifications \
+            if verifications else 0.0
+        return metrics
+
+    @staticmethod
+    def credential_key(user, password):
+        """Makes the keyed HMAC of the credential of a user, keyed by the SECRET_KEY config"""
+        message = '\0'.join([str(user.id), encode_string(user.password), encode_string(password)])
+        return hmac.new(encode_string(current_app.config['SECRET_KEY']), message,
+                        hashlib.sha256).hexdigest()
+
+    def run(self, func, *args):
+        """Runs a hash function by the pool, in the current thread if there is no pool.
+
+        :raise ServiceUnavailableException if the pool and its queue are full, or if the
+               function timed out
+        """
+        started_at = time.time()
+        if self.slots is None:
+            result = func(*args)
+            self.record_hash(time.time() - started_at)
+            return result
+
+        slots = self.slots
+        if not slots.acquire(False):
+            self.record('rejections')
+            raise ServiceUnavailableException(
+                'Too Many Verifications',
+                description='the password verifications are saturated, retry later')
+        cancelled = threading.Event()
+
+        def verify():
+            # the slot is released once the job is done, a timed out verification still queued
+            # is not hashed anymore
+            try:
+                if not cancelled.is_set():
+                    return func(*args)
+            finally:
+                slots.release()
+
+        try:
+            result = self.get_pool().apply_async(verify).get(self.timeout)
+        except TimeoutError:
+            cancelled.set()
+            self.record('rejections')
+            raise ServiceUnavailableException(
+                'Verification Timeout', description='the password verification timed out')
+        self.record_hash(time.time() - started_at)
+        return result
+
+    def verify(self, password, user):
+        """Verifies the password of a user like `flask_security.utils.verify_and_update_password`:
+        the password hash is updated if its scheme is deprecated.
+
+        .. versionadded:: 0.1.0
+
+        :param password: the plaintext password.
+        :param user: the user.
+
+        :return True if the password is valid
+        """
+        if not password or not user.password:
+            return False
+
+        key = self.credential_key(user, password)
+        if self.credential_cache.get(key):
+            self.record('cache_hits')
+            return True
+
+        security = current_app.extensions['security']
+        pwd_context = security.pwd_context
+        secret = password if pwd_context.identify(user.password) == 'plaintext' \
+            else get_hmac(password)
+        verified, new_password = self.run(pwd_context.verify_and_update, secret, user.password)
+        if not verified:
+            return False
+
+        if new_password:
+            user.password = encrypt_password(password)
+            security.datastore.put(user)
+            key = self.credential_key(user, password)
+        self.credential_cache.set(key, True)
+        return True
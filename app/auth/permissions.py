@@ -1,4 +1,5 @@
-from flask_principal import RoleNeed, UserNeed, Permission
+from flask import current_app, g, has_app_context
+from flask_principal import RoleNeed, UserNeed, Permission, Identity, identity_changed
 
 
 user_role_permission = Permission(RoleNeed('user'))
@@ -16,3 +17,37 @@ def role_permission(name):
     perm = Permission(RoleNeed(name))
     role_permission.__repr__ = lambda: perm
     return perm
+
+
+def change_identity(user):
+    """Changes the identity of the request to the user, unless it is already loaded for the user:
+    the needs of an identity are loaded once per request.
+
+    :param user: the authenticated user.
+    """
+    identity = getattr(g, 'identity', None)
+    # the user of the loaded identity is the `current_user` proxy, the changed one is kept
+    if identity is not None and getattr(identity, 'changed_user', None) is user:
+        return
+    identity = Identity(user.id)
+    identity.changed_user = user
+    identity_changed.send(current_app._get_current_object(), identity=identity)
+
+
+def can(permission):
+    """Checks if the identity of the request has a permission, the results are memoized on the
+    identity by the needs and the excludes of the permissions.
+
+    :param permission: the permission.
+    """
+    identity = getattr(g, 'identity', None) if has_app_context() else None
+    # the subclasses may override the allows of the needs
+    if identity is None or type(permission) is not Permission:
+        return permission.can()
+
+    memo = identity.__dict__.setdefault('permission_memo', {})
+    key = (frozenset(permission.needs), frozenset(permission.excludes))
+    allowed = memo.get(key)
+    if allowed is None:
+        allowed = memo[key] = permission.can()
+    return allowed
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""auth signal receivers"""
+
+from flask_security.signals import password_changed, password_reset
+
+from ..extensions import auth_datastore, token_revocations
+
+
+@password_changed.connect
+@password_reset.connect
+def revoke_user_tokens(app, user, **kwargs):
+    """Revokes the tokens of a user whose password is changed by this process, the other
+    processes revoke them at their next refresh"""
+    auth_datastore.uncache_user(user.id)
+    token_revocations.add(user.id)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+    tokens
+    ~~~~~~
+
+    stateless jwt tokens, enabled by the JWT_STATELESS config
+
+    The tokens carry the role names of their user, the identity of a verified token is made of its
+    payload without loading its user.
+
+    The users whose tokens may be revoked are kept in a bloom filter: the users whose password was
+    changed, updated since the longest token lifetime (a password change bumps the password
+    version and the update time), the users updated, deleted or whose roles changed by the
+    datastore since then (their revocation times are kept), and the users revoked by this process.
+    The filter is refreshed from the datastore every TOKEN_REVOCATION_REFRESH_INTERVAL seconds with
+    the recent revocations and rebuilt every TOKEN_REVOCATION_REBUILD_INTERVAL seconds. The tokens
+    of the users in the filter, or in its false positives, are verified against their loaded user
+    as the stateful ones: a deleted user is rejected, the current roles apply.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import math
+import struct
+import threading
+import time
+
+
+class BloomFilter(object):
+    """Compact set of keys with false positives at the error rate once it holds its capacity"""
+
+    def __init__(self, capacity=10000, error_rate=0.01):
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(float(self.size) / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # double hashing of the 2 halves of the md5 digest
+        first, second = struct.unpack('>QQ', hashlib.md5(str(key)).digest())
+        return [(first + idx * second) % self.size for idx in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(key))
+
+
+class TokenRevocations(object):
+    """The bloom filter of the users whose tokens may be revoked, refreshed by a loader of the
+    primary ids of the users whose tokens were revoked since a time.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, loader=None, app=None):
+        self.loader = loader
+        self.capacity = 10000
+        self.error_rate = 0.01
+        self.window = timedelta(0)
+        self.refresh_interval = 30
+        self.rebuild_interval = 3600
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.refreshed_at = None
+        self.rebuilt_at = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configures the filter by the TOKEN_REVOCATION_* config of the app, the window is the
+        longest token lifetime.
+
+        .. versionadded:: 0.1.0
+
+        :param app: the Flask app.
+        """
+        config = app.config
+        self.capacity = config.get('TOKEN_REVOCATION_CAPACITY', 10000)
+        self.error_rate = config.get('TOKEN_REVOCATION_ERROR_RATE', 0.01)
+        self.refresh_interval = config.get('TOKEN_REVOCATION_REFRESH_INTERVAL', 30)
+        self.rebuild_interval = config.get('TOKEN_REVOCATION_REBUILD_INTERVAL', 3600)
+        leeway = config.get('JWT_LEEWAY', 0)
+        if not isinstance(leeway, timedelta):
+            leeway = timedelta(seconds=leeway)
+        self.window = config.get('JWT_EXPIRATION_DELTA_MAX', timedelta(0)) + leeway
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.refreshed_at = self.rebuilt_at = None
+
+    def add(self, pid):
+        """Adds a user whose tokens are revoked.
+
+        .. versionadded:: 0.1.0
+
+        :param pid: primary id of an user.
+        """
+        self.bloom.add(pid)
+
+    def refresh(self):
+        """Adds the users updated since the previous refresh, the filter is rebuilt with the users
+        updated within the window once the rebuild interval elapsed."""
+        now = time.time()
+        with self.lock:
+            if self.rebuilt_at is None or now - self.rebuilt_at >= self.rebuild_interval:
+                bloom = BloomFilter(self.capacity, self.error_rate)
+                since = datetime.utcnow() - self.window
+                self.rebuilt_at = now
+            else:
+                bloom = self.bloom
+                # overlapped by an interval for the transactions committed meanwhile
+                since = datetime.utcfromtimestamp(self.refreshed_at - self.refresh_interval)
+            for pid in self.loader(since):
+                bloom.add(pid)
+            self.bloom = bloom
+            self.refreshed_at = now
+
+    def __contains__(self, pid):
+        if self.refreshed_at is None or time.time() - self.refreshed_at >= self.refresh_interval:
+            self.refresh()
+        return pid in self.bloom
+
+
+TokenRole = namedtuple('TokenRole', ['name'])
+
+
+class TokenUser(object):
+    """The user of a stateless token made of its payload, with its id and its roles, or of an
+    identity cached by the same keys.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, payload):
+        self.id = payload['sub']
+        self.active = payload.get('active', True)
+        self.roles = [TokenRole(name) for name in payload['roles']]
+
+    def is_authenticated(self):
+        return True
+
+    def is_active(self):
+        return self.active
+
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return unicode(self.id)
+
+    def has_role(self, role):
+        name = getattr(role, 'name', role)
+        return any(token_role.name == name for token_role in self.roles)
+
+    def __repr__(self):
+        return '<TokenUser(id="%s")>' % self.id
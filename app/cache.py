@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+    cache
+    ~~~~~
+
+    pluggable cache backends
+
+    How to use:
+
+    - as a flask extension configured by the app config with a prefix:
+
+    identity_cache = Cache('IDENTITY_CACHE')
+    identity_cache.init_app(app)
+
+    with these config keys:
+
+    IDENTITY_CACHE_TYPE = 'lru'  # null, lru, redis or memcached
+    IDENTITY_CACHE_TTL = 60  # seconds
+    IDENTITY_CACHE_MAX_SIZE = 1024  # lru only
+    IDENTITY_CACHE_URL = 'redis://localhost:6379/0'  # redis or memcached only
+
+    the values of the redis caches are json serialized, plain data only.
+
+    - or with a backend directly:
+
+    cache = LRUCache(max_size=100, ttl=60)
+
+    and use the methods provided from BaseCache
+"""
+
+import json
+import time
+import threading
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+from werkzeug.contrib.cache import RedisCache
+
+
+class BaseCache(object):
+    """Abstract cache backend class.
+
+    .. versionadded:: 0.1.0
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key):
+        """Gets the cached value of a key.
+
+        .. versionadded:: 0.1.0
+
+        :param key: the key.
+        :return the cached value or None if not found or expired
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Caches a value by a key.
+
+        .. versionadded:: 0.1.0
+
+        :param key: the key.
+        :param value: the value.
+        :param ttl: the optional time to live in seconds, default is the cache ttl.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        """Deletes a key from the cache.
+
+        .. versionadded:: 0.1.0
+
+        :param key: the key.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Clears the cache.
+
+        .. versionadded:: 0.1.0
+        """
+        pass
+
+
+class NullCache(BaseCache):
+    """NullCache class that caches nothing.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(BaseCache):
+    """In-process and thread-safe cache with TTL expiration and LRU eviction.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        super(LRUCache, self).__init__(ttl)
+        if max_size <= 0:
+            raise ValueError('max_size is negative({}), should be positive'.format(max_size))
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                return None
+            # re-insert to mark the key as the most recently used
+            self._items[key] = item
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (expires_at, value)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)  # evict the least recently used key
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SharedCache(BaseCache):
+    """Cache shared between processes, backed by a werkzeug cache client
+    (for example: werkzeug.contrib.cache.RedisCache or MemcachedCache).
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, client, ttl=300, key_prefix=''):
+        super(SharedCache, self).__init__(ttl)
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.client.get(self.key_prefix + str(key))
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.key_prefix + str(key), value, timeout=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + str(key))
+
+    def clear(self):
+        self.client.clear()
+
+
+class _JSONRedisCache(RedisCache):
+    """RedisCache of json values instead of pickled ones, a value written to the shared server is
+    loaded as plain data only"""
+
+    def dump_object(self, value):
+        return json.dumps(value)
+
+    def load_object(self, value):
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+
+def _make_redis_client(url, **kwargs):
+    from redis import from_url
+
+    return _JSONRedisCache(host=from_url(url), **kwargs)
+
+
+def _make_memcached_client(url, **kwargs):
+    from werkzeug.contrib.cache import MemcachedCache
+
+    servers = url.split(',') if url else None
+    return MemcachedCache(servers=servers, **kwargs)
+
+
+def make_cache(cache_type, ttl=300, max_size=1024, url=None, key_prefix=''):
+    """Makes a cache backend instance
+
+    :param cache_type: one of null, lru, redis, memcached
+    :param ttl: time to live in seconds
+    :param max_size: the max number of items for lru cache type
+    :param url: the server url for redis, comma separated servers for memcached cache types
+    :param key_prefix: the key prefix for shared cache types
+
+    :return the cache backend instance
+    """
+    if cache_type is None or cache_type == 'null':
+        return NullCache(ttl)
+
+    if cache_type == 'lru':
+        return LRUCache(max_size=max_size, ttl=ttl)
+
+    if cache_type == 'redis':
+        return SharedCache(_make_redis_client(url, default_timeout=ttl), ttl, key_prefix)
+
+    if cache_type == 'memcached':
+        return SharedCache(_make_memcached_client(url, default_timeout=ttl), ttl, key_prefix)
+
+    raise ValueError('Invalid cache type: {}'.format(cache_type))
+
+
+class Cache(BaseCache):
+    """Cache extension configured by the app config keys with the provided prefix.
+    It caches nothing until it is initialized by :meth:`init_app`.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, config_prefix, app=None):
+        super(Cache, self).__init__()
+        self.config_prefix = config_prefix
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        prefix = self.config_prefix
+        self.backend = make_cache(config.get(prefix + '_TYPE'),
+                                  ttl=config.get(prefix + '_TTL', 300),
+                                  max_size=config.get(prefix + '_MAX_SIZE', 1024),
+                                  url=config.get(prefix + '_URL'),
+                                  key_prefix=prefix.lower() + ':')
+        self.ttl = self.backend.ttl
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
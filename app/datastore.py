@@ -18,10 +18,15 @@
 
 from abc import ABCMeta, abstractmethod
 
-from sqlalchemy import desc
+from flask import abort, current_app, g, has_request_context
+from sqlalchemy import desc, event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, load_only
 import inflection
 
-from .utils import extract_dict, add_filters
+from .query_shapes import QueryShapeRegistry, make_query_shape
+from .search import SEARCH_BACKENDS, register_search_indexes
+from .utils import extract_dict, apply_filter_plan, make_filter_plan, parse_sort, chunked
 
 
 class Datastore(object):
@@ -60,14 +65,55 @@ class Datastore(object):
         pass
 
 
+def _run_after_commit(session):
+    for func in session.info.pop('after_commit', ()):
+        func()
+
+
+def _discard_after_commit(session):
+    session.info.pop('after_commit', None)
+
+
+def _fold_key(key):
+    """Folds the case of a unique key of a case insensitive collation"""
+    return key.lower() if isinstance(key, basestring) else key
+
+
+def _keep_key(key):
+    return key
+
+
 class SQLAlchemyDatastore(Datastore):
     """SQLAlchemyDatastore class.
 
     .. versionadded:: 0.1.0
     """
 
-    def __init__(self, db):
+    #: the eager load strategies of the relationships by model names, for example:
+    #: {'user': {'roles': subqueryload}}
+    eager_loads = {}
+
+    #: the accepted sort keys by model names, for example: {'user': ('id', 'email')}, all the
+    #: columns of a model are accepted when it is not declared
+    sort_keys = {}
+
+    #: the searchable fields of the `q` parameter by model names, for example:
+    #: {'user': ('email',)}
+    search_fields = {}
+
+    #: the dialects comparing the unique keys case insensitively by their default collations
+    case_insensitive_dialects = ('mysql',)
+
+    def __init__(self, db, eager_loads=None, sort_keys=None, search_fields=None):
         super(SQLAlchemyDatastore, self).__init__(db)
+        if eager_loads is not None:
+            self.eager_loads = eager_loads
+        if sort_keys is not None:
+            self.sort_keys = sort_keys
+        if search_fields is not None:
+            self.search_fields = search_fields
+        self.search_backends = {}
+        self.query_shapes = QueryShapeRegistry(enabled=False)
         self.model_registry = {}
         classes, table_names = [], []
         for clazz in db.Model._decl_class_registry.values():
@@ -80,9 +126,70 @@ class SQLAlchemyDatastore(Datastore):
             if table[0] in table_names:
                 model = classes[table_names.index(table[0])]
                 self.model_registry[inflection.underscore(model.__name__)] = model
+        # the filters are applied by a dict lookup of the precompiled comparators
+        self.filter_plans = dict((model_name, make_filter_plan(model))
+                                 for model_name, model in self.model_registry.iteritems())
+        for model_name, fields in self.search_fields.iteritems():
+            register_search_indexes(self.get_model_class(model_name).__table__, fields)
+        if not event.contains(Session, 'after_commit', _run_after_commit):
+            event.listen(Session, 'after_commit', _run_after_commit)
+            event.listen(Session, 'after_rollback', _discard_after_commit)
+
+    def init_app(self, app):
+        """Registers the unit of work of the requests, enabled by the DATASTORE_UNIT_OF_WORK config:
+        the commits of a request are flushes and the request is committed once after its response
+        is made, or rolled back for an error response. The response of a failed commit is replaced
+        by the error response of its exception, the streamed bodies are read after the commit.
+        Configures the registry of the query shapes.
+
+        .. versionadded:: 0.1.0
+
+        :param app: the Flask app.
+        """
+        app.config.setdefault('DATASTORE_UNIT_OF_WORK', False)
+        app.after_request(self.end_unit_of_work)
+        self.query_shapes.init_app(app)
+
+    @staticmethod
+    def in_unit_of_work():
+        return has_request_context() and current_app.config.get('DATASTORE_UNIT_OF_WORK', False)
 
     def commit(self):
-        self.db.session.commit()
+        if self.in_unit_of_work():
+            self.db.session.flush()
+            g.datastore_flushed = True
+        else:
+            self.db.session.commit()
+
+    def after_commit(self, func):
+        """Calls a function once the current transaction of the session is committed, it is not
+        called if the transaction is rolled back.
+
+        .. versionadded:: 0.1.0
+
+        :param func: the function called without args.
+        """
+        self.db.session.info.setdefault('after_commit', []).append(func)
+
+    def end_unit_of_work(self, response):
+        """Commits the flushed changes of the request, rolls them back for an error response.
+
+        :param response: the response of the request.
+
+        :return the response, the error response of the exception if the commit failed
+        """
+        if getattr(g, 'datastore_flushed', False):
+            g.datastore_flushed = False
+            if response.status_code >= 400:
+                self.db.session.rollback()
+                return response
+            try:
+                self.db.session.commit()
+            except SQLAlchemyError as ex:
+                self.db.session.rollback()
+                # handled by the error handlers of the app and its blueprints
+                return current_app.make_response(current_app.handle_user_exception(ex))
+        return response
 
     def put(self, model):
         self.db.session.add(model)
@@ -98,15 +205,118 @@ class SQLAlchemyDatastore(Datastore):
     def get_model_instance(self, model_name, **fields):
         return self.get_model_class(model_name)(**fields)
 
+    def get_load_options(self, model_name, fields=None, sort=None):
+        """Gets the load options of a model: the eager load options of the declared relationships
+        and the load only option of the selected columns.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param fields: the optional selected fields (a fields dict or a sequence of field names),
+                       only the selected columns and relationships are loaded, all of them
+                       if not provided.
+        :param sort: the optional sorting string, the sort keys are always loaded.
+
+        :return the list of query options
+        """
+        model_class = self.get_model_class(model_name)
+        options = [strategy(getattr(model_class, key))
+                   for key, strategy in self.eager_loads.get(model_name, {}).iteritems()
+                   if not fields or key in fields]
+
+        if fields:
+            mapper = inspect(model_class)
+            keys = set(mapper.get_property_by_column(column).key
+                       for column in mapper.primary_key)
+            keys.update(fields)
+            if sort is not None:
+                keys.update(key for key, _ in parse_sort(sort))
+            options.append(load_only(*[key for key in keys if key in mapper.column_attrs]))
+
+        return options
+
+    def get_sort_keys(self, model_name):
+        """Gets the accepted sort keys of a model, its column keys when they are not declared.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        """
+        sort_keys = self.sort_keys.get(model_name)
+        if sort_keys is None:
+            sort_keys = inspect(self.get_model_class(model_name)).column_attrs.keys()
+        return sort_keys
+
+    def get_order_by(self, model_name, sort):
+        """Gets the order by clauses of a sorting string validated against the accepted sort keys.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param sort: the sorting string, for example: name,-description,id,+email
+
+        :return the list of order by clauses
+        """
+        model_class = self.get_model_class(model_name)
+        sort_keys = self.get_sort_keys(model_name)
+        order_by = []
+        for key, descending in parse_sort(sort):
+            if key not in sort_keys:
+                raise ValueError('Invalid sort key: {}'.format(key))
+            column = getattr(model_class, key)
+            order_by.append(desc(column) if descending else column)
+        return order_by
+
+    def get_search_backend(self, model_name):
+        """Gets the search backend of a model by the SEARCH_BACKEND config, `auto` is the
+        full-text search of the database if supported, the ngram search otherwise.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        """
+        name = current_app.config.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            mapper = inspect(self.get_model_class(model_name))
+            name = self.db.session.get_bind(mapper=mapper).dialect.name
+            if name not in SEARCH_BACKENDS:
+                name = 'ngram'
+
+        backend = self.search_backends.get(name)
+        if backend is None:
+            if name not in SEARCH_BACKENDS:
+                raise ValueError('Invalid search backend: {}'.format(name))
+            backend = self.search_backends[name] = SEARCH_BACKENDS[name]()
+        return backend
+
+    def invalidate_search(self, model_name):
+        """Invalidates the search data of a model after its rows were changed in bulk.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        """
+        for backend in self.search_backends.itervalues():
+            backend.invalidate(self.get_model_class(model_name))
+
     # Base CRUD
 
     def find_by_model_name(self, model_name, q=None, accepted_filter_keys=None, filters=None,
-                           sort=None, offset=None, limit=None, **kwargs):
+                           sort=None, offset=None, limit=None, fields=None, **kwargs):
 
         model_class = self.get_model_class(model_name)
-        query = model_class.query.from_self()
+        # filters and ordering apply to the mapped table directly, not to a subquery
+        query = self.db.session.query(model_class)
+        relevance = []
+        if q and model_name in self.search_fields:
+            query, relevance = self.get_search_backend(model_name).search(
+                query, model_class, self.search_fields[model_name], q)
+        load_options = self.get_load_options(model_name, fields, sort)
+        if load_options:
+            query = query.options(*load_options)
         if filters is not None and len(filters) > 0:
-            query = add_filters(query, filters, accepted_filter_keys)
+            query = apply_filter_plan(query, self.filter_plans[model_name], filters,
+                                      accepted_filter_keys)
         # {key:value,}
         filter_dict = extract_dict(kwargs, extracted_keys=accepted_filter_keys)
         if filter_dict is not None and len(filter_dict) > 0:
@@ -114,14 +324,21 @@ class SQLAlchemyDatastore(Datastore):
 
         if sort is not None:
             # sort is expected to be something like: name,-description,id,+email
-            sort_args = [
-                desc(v.strip()[1:]) if v.startswith('-') else
-                v.strip()[1:] if v.startswith('+') else
-                v.strip()
-                for v in sort.split(',')]
-            query = query.order_by(*sort_args)
+            order_by = self.get_order_by(model_name, sort)
+            sort_keys = parse_sort(sort)
+        else:
+            order_by, sort_keys = list(relevance), []
+        # the primary key breaks the ties, the pages and the subqueries of their eager loads
+        # select the same rows. It follows the direction of the last sort key, for an index scan
+        primary_key = self.get_primary_key(model_name)
+        if primary_key.key not in [key for key, _ in sort_keys]:
+            descending = sort_keys[-1][1] if sort_keys else False
+            order_by.append(desc(primary_key) if descending else primary_key)
+        query = query.order_by(*order_by)
 
         query = query.offset(offset).limit(limit)
+        # the accepted filter and sort keys are counted for `manage.py db suggest-indexes`
+        self.query_shapes.record(make_query_shape(model_name, filters, filter_dict, sort))
 
         return query
 
@@ -132,21 +349,278 @@ class SQLAlchemyDatastore(Datastore):
         self.commit()
         return model
 
-    def read_by_model_name(self, model_name, pid, **kwargs):
+    def read_by_model_name(self, model_name, pid, fields=None, **kwargs):
         model_class = self.get_model_class(model_name)
-        return model_class.query.get_or_404(pid)
+        query = model_class.query
+        load_options = self.get_load_options(model_name, fields)
+        if load_options:
+            query = query.options(*load_options)
+        return query.get_or_404(pid)
+
+    def supports_returning(self, model_name):
+        """Checks if the database of a model supports the `RETURNING` clause, for example:
+        PostgreSQL.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        """
+        bind = self.db.session.get_bind(mapper=inspect(self.get_model_class(model_name)))
+        return bind.dialect.implicit_returning
+
+    def make_update_returning(self, model_name, pid, values, pid_key='id'):
+        """Makes the update statement of a model returning all its columns, the `onupdate`
+        columns (`updated_at`) are set by the same statement.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param pid: the primary id of the model.
+        :param values: the updated values.
+        :param pid_key: the key of the primary id.
+
+        :return the update statement
+        """
+        table = inspect(self.get_model_class(model_name)).local_table
+        return table.update().where(table.c[pid_key] == pid).values(values) \
+            .returning(*table.c)
 
     def update_by_model_name(self, model_name, pid, accepted_keys, pid_key='id', **kwargs):
+        """Updates a model by its primary id without reading it again: with one `UPDATE ...
+        RETURNING` statement when supported, or by setting the values of the model instance
+        loaded from the identity map or the database.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param pid: the primary id of the model.
+        :param accepted_keys: the accepted keys of the kwargs.
+        :param pid_key: the key of the primary id.
+        :param kwargs: the updated values.
+
+        :return the updated model
+        """
+        model_class = self.get_model_class(model_name)
         values = extract_dict(kwargs, extracted_keys=accepted_keys)
-        self.get_model_class(model_name).query.filter_by(**{pid_key: pid}).update(values)
+        session = self.db.session
+
+        if values and self.supports_returning(model_name):
+            result = session.execute(self.make_update_returning(model_name, pid, values,
+                                                                pid_key))
+            # the returned row replaces the state of the identity mapped instance if any
+            models = list(session.query(model_class).populate_existing().instances(result))
+            if not models:
+                abort(404)
+            model = models[0]
+            self.invalidate_search(model_name)
+        else:
+            query = session.query(model_class)
+            if pid_key == self.get_primary_key(model_name).key:
+                model = query.get(pid)  # from the identity map when the model is already loaded
+            else:
+                model = query.filter_by(**{pid_key: pid}).first()
+            if model is None:
+                abort(404)
+            for key, value in values.iteritems():
+                setattr(model, key, value)
+
         self.commit()
-        return self.read_by_model_name(model_name, pid)  # TODO(hoatle): avoid this?
+        return model
 
     def delete_by_model_name(self, model_name, pid, **kwargs):
         model = self.read_by_model_name(model_name, pid, **kwargs)
         self.delete(model)
         self.commit()
 
+    # Bulk CRUD, all the chunks are executed in the current transaction, it is not committed
+
+    def get_key_folder(self, model_name):
+        """Gets the function folding the unique keys of a model as its database compares them: the
+        case is folded on the dialects of `case_insensitive_dialects` whose default collations are
+        case insensitive, the keys are kept as they are otherwise.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        """
+        bind = self.db.session.get_bind(mapper=inspect(self.get_model_class(model_name)))
+        return _fold_key if bind.dialect.name in self.case_insensitive_dialects else _keep_key
+
+    def get_primary_key(self, model_name):
+        model_class = self.get_model_class(model_name)
+        return getattr(model_class, inspect(model_class).primary_key[0].key)
+
+    def bulk_create_by_model_name(self, model_name, accepted_keys, items, unique_key,
+                                  chunk_size=500):
+        """Creates the models of the items with one multi-row insert statement per chunk.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param accepted_keys: the accepted keys of the items.
+        :param items: the list of the item dicts.
+        :param unique_key: the unique key of the model to skip the conflicting items and to look up
+                           the primary ids of the created models, the keys are compared as the
+                           database does, see :meth:`get_key_folder`.
+        :param chunk_size: the number of items per statement.
+
+        :return the list of the created primary ids, None for the conflicting items
+        """
+        model_class = self.get_model_class(model_name)
+        primary_key = self.get_primary_key(model_name)
+        unique_column = getattr(model_class, unique_key)
+        fold_key = self.get_key_folder(model_name)
+        session = self.db.session
+        seen = set()
+        pids = []
+
+        for chunk in chunked(items, chunk_size):
+            values = [extract_dict(item, extracted_keys=accepted_keys) for item in chunk]
+            keys = [value.get(unique_key) for value in values]
+            seen.update(fold_key(key) for key, in session.query(unique_column)
+                        .filter(unique_column.in_(keys)))
+
+            created_keys = []
+            mappings = []
+            for key, value in zip(keys, values):
+                key = fold_key(key)
+                if key in seen:
+                    created_keys.append(None)
+                    continue
+                seen.add(key)
+                created_keys.append(key)
+                mappings.append(value)
+
+            created = {}
+            if mappings:
+                session.bulk_insert_mappings(model_class, mappings)
+                created = dict((fold_key(key), pid) for key, pid in
+                               session.query(unique_column, primary_key)
+                               .filter(unique_column.in_([value[unique_key]
+                                                          for value in mappings])))
+            pids.extend(created.get(key) for key in created_keys)
+
+        self.invalidate_search(model_name)
+        return pids
+
+    def bulk_link_by_model_name(self, model_name, key, links, chunk_size=500):
+        """Links the models to their related models of a many-to-many relationship with one
+        multi-row insert statement per chunk.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param key: the key of the many-to-many relationship.
+        :param links: the list of (primary id, related primary id) tuples.
+        :param chunk_size: the number of links per statement.
+        """
+        relationship = inspect(self.get_model_class(model_name)).relationships[key]
+        (_, local_column), = relationship.synchronize_pairs
+        (_, remote_column), = relationship.secondary_synchronize_pairs
+        for chunk in chunked(links, chunk_size):
+            self.db.session.execute(relationship.secondary.insert(),
+                                    [{local_column.key: pid, remote_column.key: related_pid}
+                                     for pid, related_pid in chunk])
+
+    def _find_existing_pids(self, model_name, pids):
+        primary_key = self.get_primary_key(model_name)
+        return set(pid for pid, in self.db.session.query(primary_key)
+                   .filter(primary_key.in_(pids)))
+
+    def _find_owners(self, model_name, unique_key, items, fold_key):
+        """Finds the primary ids of the models owning the unique keys of the items, by folded key"""
+        primary_key = self.get_primary_key(model_name)
+        unique_column = getattr(self.get_model_class(model_name), unique_key)
+        keys = [item[unique_key] for item in items if item.get(unique_key) is not None]
+        if not keys:
+            return {}
+        return dict((fold_key(key), pid) for key, pid in
+                    self.db.session.query(unique_column, primary_key)
+                    .filter(unique_column.in_(keys)))
+
+    def bulk_update_by_model_name(self, model_name, accepted_keys, items, pid_key='id',
+                                  unique_key=None, chunk_size=500):
+        """Updates the models of the items by their primary ids with one executemany update
+        statement per chunk.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param accepted_keys: the accepted keys of the items.
+        :param items: the list of the item dicts with their primary ids.
+        :param pid_key: the key of the primary id.
+        :param unique_key: the optional unique key of the model to skip the items conflicting with
+                           the other models or items, the keys are compared as the database
+                           does, see :meth:`get_key_folder`.
+        :param chunk_size: the number of items per statement.
+
+        :return the list of the updated primary ids, None for the not found items, False for the
+                conflicting items
+        """
+        model_class = self.get_model_class(model_name)
+        fold_key = self.get_key_folder(model_name)
+        owners = {}
+        pids = []
+
+        for chunk in chunked(items, chunk_size):
+            existing = self._find_existing_pids(model_name, [item[pid_key] for item in chunk])
+            if unique_key is not None:
+                owners.update(self._find_owners(model_name, unique_key, chunk, fold_key))
+            mappings = []
+            for item in chunk:
+                pid = item[pid_key]
+                if pid not in existing:
+                    pids.append(None)
+                    continue
+                if unique_key is not None and item.get(unique_key) is not None:
+                    key = fold_key(item[unique_key])
+                    if owners.setdefault(key, pid) != pid:
+                        pids.append(False)
+                        continue
+                pids.append(pid)
+                values = extract_dict(item, extracted_keys=accepted_keys)
+                if values:
+                    values[pid_key] = pid
+                    mappings.append(values)
+            if mappings:
+                self.db.session.bulk_update_mappings(model_class, mappings)
+
+        self.invalidate_search(model_name)
+        return pids
+
+    def bulk_delete_by_model_name(self, model_name, pids, chunk_size=500):
+        """Deletes the models by their primary ids with one delete statement per chunk, their
+        many-to-many links are deleted first.
+
+        .. versionadded:: 0.1.0
+
+        :param model_name: the model name.
+        :param pids: the list of the primary ids.
+        :param chunk_size: the number of primary ids per statement.
+
+        :return the list of the deleted primary ids, None for the not found ones
+        """
+        model_class = self.get_model_class(model_name)
+        primary_key = self.get_primary_key(model_name)
+        relationships = [relationship for relationship in inspect(model_class).relationships
+                         if relationship.secondary is not None]
+        deleted = []
+
+        for chunk in chunked(pids, chunk_size):
+            existing = self._find_existing_pids(model_name, chunk)
+            deleted.extend(pid if pid in existing else None for pid in chunk)
+            if not existing:
+                continue
+            for relationship in relationships:
+                for _, column in relationship.synchronize_pairs:
+                    self.db.session.execute(relationship.secondary.delete()
+                                            .where(column.in_(list(existing))))
+            self.db.session.query(model_class).filter(primary_key.in_(list(existing))) \
+                .delete(synchronize_session=False)
+
+        self.invalidate_search(model_name)
+        return deleted
+
 
 class MongoEngineDatastore(Datastore):
     """MongoEngineDatastore class.
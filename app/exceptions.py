@@ -54,3 +54,17 @@ class NotFoundException(ApplicationException):
     def __init__(self, *args, **kwargs):
         kwargs['status_code'] = 404
         super(NotFoundException, self).__init__(*args, **kwargs)
+
+
+class ConflictException(ApplicationException):
+
+    def __init__(self, *args, **kwargs):
+        kwargs['status_code'] = 409
+        super(ConflictException, self).__init__(*args, **kwargs)
+
+
+class ServiceUnavailableException(ApplicationException):
+
+    def __init__(self, *args, **kwargs):
+        kwargs['status_code'] = 503
+        super(ServiceUnavailableException, self).__init__(*args, **kwargs)
@@ -13,9 +13,16 @@ from flask_cors import CORS
 from flask_jwt import JWT
 
 from .auth.datastore import SQLAlchemyAuthDatastore
+from .auth.passwords import PasswordVerifier
+from .auth.tokens import TokenRevocations
+from .cache import Cache
+from .queries import QueryMonitor
+from .timings import Timings
 
 
-__all__ = ['init_apps', 'heroku', 'db', 'migrate', 'mail', 'auth_datastore']
+__all__ = ['init_apps', 'heroku', 'db', 'migrate', 'mail', 'identity_cache', 'count_cache',
+           'role_cache', 'credential_cache', 'auth_datastore', 'password_verifier',
+           'token_revocations', 'timings', 'query_monitor']
 
 heroku = Heroku()
 db = SQLAlchemy()
@@ -24,11 +31,24 @@ mail = Mail()
 security = Security()
 cors = CORS()
 jwt = JWT()
+identity_cache = Cache('IDENTITY_CACHE')
+count_cache = Cache('COUNT_CACHE')
+role_cache = Cache('ROLE_CACHE')
+credential_cache = Cache('CREDENTIAL_CACHE')
+password_verifier = PasswordVerifier(credential_cache)
+timings = Timings()
+query_monitor = QueryMonitor()
 
 # models must be imported before datastore initialization
 from .auth.models import User, Role
 
-auth_datastore = SQLAlchemyAuthDatastore(db)
+token_revocations = TokenRevocations()
+auth_datastore = SQLAlchemyAuthDatastore(db, identity_cache=identity_cache, role_cache=role_cache,
+                                         token_revocations=token_revocations)
+token_revocations.loader = auth_datastore.find_revoked_user_ids
+
+# the signal receivers need the extensions
+from .auth import signals  # noqa
 
 
 def init_apps(app):
@@ -45,6 +65,13 @@ def init_apps(app):
     security.init_app(app, SQLAlchemyUserDatastore(db, User, Role))
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
     jwt.init_app(app)
+    identity_cache.init_app(app)
+    count_cache.init_app(app)
+    role_cache.init_app(app)
+    credential_cache.init_app(app)
+    password_verifier.init_app(app)
+    token_revocations.init_app(app)
+    auth_datastore.init_app(app)
 
     admin = Admin(name='flask-boilerplate')
     # add admin model views
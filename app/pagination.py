@@ -1,37 +1,432 @@
 """pagination for sqlalchemy"""
 
+import base64
+import hashlib
+import json
+from datetime import datetime
+from numbers import Number
+
 from flask import current_app, request, url_for
+from sqlalchemy import and_, or_, inspect
+from sqlalchemy.orm import undefer
+from sqlalchemy.types import DateTime
+
+from .extensions import count_cache
+from .utils import merge_dict, parse_sort
+
+
+def get_limit(limit=None):
+    """Get the official limit from the provided limit and the PAGINATION_LIMIT config
+
+    :param limit optional limit
+    :return the official limit
+    """
+    pagination_limit = current_app.config.get('PAGINATION_LIMIT', 25)
+
+    if limit is None:
+        return pagination_limit
+    elif limit <= 0:
+        raise ValueError('limit is negative({}), should be positive'.format(limit))
+    return limit if limit <= pagination_limit else pagination_limit
+
+
+def page_url(**params):
+    """Construct the page url of the current request with the provided paging params,
+    None params are removed from the url"""
+    args = merge_dict(request.view_args, request.values.to_dict())
+    args.update(params)
+    args = dict((key, value) for key, value in args.iteritems() if value is not None)
+    return url_for(request.endpoint, _external=True, **args)
+
+
+def encode_cursor(values):
+    """Encode the list of values into an opaque cursor"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')))
+
+
+def decode_cursor(cursor, columns):
+    """Decode the opaque cursor into the list of values of the provided columns"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    return [parse_datetime(value) if isinstance(column.type, DateTime) and value is not None
+            else value for column, value in zip(columns, values)]
+
 
-from .utils import merge_dict
+def get_cursor_keys(query, sort=None):
+    """Get the model class and the cursor keys of the query from the sort string
+
+    :param query the query instance
+    :param sort optional sorting string of the query (sort='+a,-b,c')
+
+    :return the tuple of the model class and the list of (key, descending) tuples, the primary
+            key is appended if missing to make the order unique
+    """
+    model_class = query.column_descriptions[0]['type']  # assuming
+    primary_key = inspect(model_class).primary_key[0]
+    keys = parse_sort(sort)
+    if primary_key.key not in [key for key, _ in keys]:
+        keys.append((primary_key.key, False))
+    return model_class, keys
+
+
+def make_cursor(item, keys):
+    """Make the opaque cursor of the item from the list of (key, descending) cursor keys"""
+    return encode_cursor([getattr(item, key) for key, _ in keys])
+
+
+def keyset_criterion(columns, values, descendings):
+    """(a > x) or (a = x and b > y) or (a = x and b = y and c > z)... the rows after the values in
+    the order of the columns, with the comparators swapped for the descending columns
+
+    :param columns the list of the columns
+    :param values the list of the values of the columns
+    :param descendings the list of the descending flags of the columns
+    """
+    criteria = []
+    for idx, (column, descending) in enumerate(zip(columns, descendings)):
+        equals = [columns[i] == values[i] for i in range(idx)]
+        equals.append(column < values[idx] if descending else column > values[idx])
+        criteria.append(and_(*equals))
+    return or_(*criteria)
+
+
+def parse_datetime(value):
+    """Parse the ISO 8601 string (as from datetime.isoformat()) into a datetime"""
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            pass
+    raise ValueError('Invalid datetime: {}'.format(value))
+
+
+def parse_time(value):
+    """Parse the unix timestamp or the ISO 8601 string into an utc datetime"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, Number):
+        return datetime.utcfromtimestamp(value)
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (TypeError, ValueError):
+        return parse_datetime(value)
 
 
-# TODO(hoatle): implement this
 class CursorPagination(object):
-    """cursor-based pagination,
-    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4"""
-    def __init__(self, query, before=None, after=None, limit=None):
-        pass
+    """cursor-based (keyset) pagination,
+    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4
+
+    The cursors are encoded from the sort key values and the primary key of the first and the
+    last item of the page, the next page is queried with range predicates on these values
+    instead of OFFSET. The sort keys are expected to be not nullable.
+    """
+
+    def __init__(self, query, before=None, after=None, limit=None, sort=None):
+        """initialize the cursor based pagination
+        :param query the query instance
+        :param before optional cursor, items before it are returned
+        :param after optional cursor, items after it are returned, used if both are provided
+        :param limit optional limit
+        :param sort optional sorting string of the query (sort='+a,-b,c')
+        """
+        self.limit = get_limit(limit)
+
+        model_class, keys = get_cursor_keys(query, sort)
+        self.keys = keys
+        self.columns = [getattr(model_class, key) for key, _ in keys]
+        self.backward = not after and bool(before)
+        cursor = after or before
+
+        order_by = [
+            column.desc() if descending != self.backward else column.asc()
+            for column, (_, descending) in zip(self.columns, keys)
+        ]
+        query = query.offset(None).limit(None).order_by(None).order_by(*order_by)
+
+        if cursor:
+            values = decode_cursor(cursor, self.columns)
+            query = query.filter(self._keyset_criterion(keys, values))
+
+        data = query.limit(self.limit + 1).all()
+        self.has_more = len(data) > self.limit
+        data = data[:self.limit]
+        if self.backward:
+            data.reverse()
+
+        self.data = data
+        self.cursor = cursor
+        self.before = make_cursor(data[0], keys) if data else None
+        self.after = make_cursor(data[-1], keys) if data else None
+
+    def _keyset_criterion(self, keys, values):
+        """the keyset criterion with the comparators swapped for backward paging"""
+        return keyset_criterion(self.columns, values,
+                                [descending != self.backward for _, descending in keys])
+
+    @property
+    def has_prev(self):
+        """Check if the pagination has a previous page"""
+        return self.has_more if self.backward else bool(self.cursor)
+
+    @property
+    def has_next(self):
+        """Check if the pagination has a next page"""
+        return bool(self.cursor) if self.backward else self.has_more
+
+    @property
+    def prev_url(self):
+        """Get the previous page url if any"""
+        if self.has_prev and self.before:
+            return page_url(before=self.before, after=None, offset=None, limit=self.limit)
+        return None
+
+    @property
+    def next_url(self):
+        """Get the next page url if any"""
+        if self.has_next and self.after:
+            return page_url(after=self.after, before=None, offset=None, limit=self.limit)
+        return None
 
 
-# TODO(hoatle): implement this
 class TimePagination(object):
     """time-based pagination,
-    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4"""
-    def __init__(self, query, since=None, until=None, limit=None):
-        pass
+    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4
+
+    The items are queried with range predicates on the time key column: `since` and `until` are
+    exclusive bounds. With `since` only, the items are sorted from the oldest to the newest to
+    poll for the changes, otherwise from the newest to the oldest.
+
+    The items are ordered by their primary key after their time, the page urls carry the primary
+    id of the bound item with its time (`since_id` and `until_id`): the bounds are keyset
+    criteria on both so that the items sharing the same time are never skipped nor loaded beyond
+    the limit.
+    """
+
+    time_keys = ('created_at', 'updated_at')
+
+    def __init__(self, query, since=None, until=None, limit=None, time_key=None, since_id=None,
+                 until_id=None):
+        """initialize the time based pagination
+        :param query the query instance
+        :param since optional unix timestamp or ISO 8601 time, items after it are returned
+        :param until optional unix timestamp or ISO 8601 time, items before it are returned
+        :param limit optional limit
+        :param time_key optional time key, one of `time_keys`, default is the first one
+        :param since_id optional primary id, the items at the since time after it are returned
+        :param until_id optional primary id, the items at the until time before it are returned
+        """
+        self.limit = get_limit(limit)
+        self.time_key = time_key or self.time_keys[0]
+
+        if self.time_key not in self.time_keys:
+            raise ValueError('Invalid time key: {}'.format(self.time_key))
+
+        self.since = parse_time(since) if since else None
+        self.until = parse_time(until) if until else None
+        self.since_id = since_id if self.since is not None else None
+        self.until_id = until_id if self.until is not None else None
+        self.ascending = self.since is not None and self.until is None
+
+        model_class = query.column_descriptions[0]['type']  # assuming
+        column = getattr(model_class, self.time_key)
+        self.primary_key = getattr(model_class, inspect(model_class).primary_key[0].key)
+
+        # the time key may be deferred by the selected fields
+        query = query.offset(None).limit(None).order_by(None).options(undefer(self.time_key))
+        if self.since is not None:
+            query = query.filter(self._bound(column, self.since, self.since_id, False))
+        if self.until is not None:
+            query = query.filter(self._bound(column, self.until, self.until_id, True))
+        if self.ascending:
+            query = query.order_by(column.asc(), self.primary_key.asc())
+        else:
+            query = query.order_by(column.desc(), self.primary_key.desc())
+
+        items = query.limit(self.limit + 1).all()
+        self.has_more = len(items) > self.limit
+        self.data = items[:self.limit]
+
+    def _bound(self, column, time, pid, descending):
+        """the exclusive bound of the time, of the time and the primary id if any"""
+        if pid is None:
+            return column < time if descending else column > time
+        return keyset_criterion([column, self.primary_key], [time, pid], [descending] * 2)
+
+    def _time(self, item):
+        return getattr(item, self.time_key)
+
+    def _pid(self, item):
+        return getattr(item, self.primary_key.key)
+
+    @property
+    def has_prev(self):
+        """Check if the pagination has a previous page, the previous page of the newest items
+        is used to poll for the newer items"""
+        return len(self.data) > 0
+
+    @property
+    def has_next(self):
+        """Check if the pagination has a next page"""
+        return self.has_more
+
+    @property
+    def prev_url(self):
+        """Get the previous page url if any"""
+        if not self.has_prev:
+            return None
+        first = self.data[0]
+        if self.ascending:
+            return self.page_url(until=self._time(first).isoformat(), until_id=self._pid(first))
+        return self.page_url(since=self._time(first).isoformat(), since_id=self._pid(first))
+
+    @property
+    def next_url(self):
+        """Get the next page url if any"""
+        if not self.has_next:
+            return None
+        last = self.data[-1]
+        if self.ascending:
+            return self.page_url(since=self._time(last).isoformat(), since_id=self._pid(last))
+        return self.page_url(until=self._time(last).isoformat(), until_id=self._pid(last),
+                             since=self.since.isoformat() if self.since else None,
+                             since_id=self.since_id)
+
+    def page_url(self, since=None, until=None, since_id=None, until_id=None):
+        """Construct the page url from the provided since and until, with their primary ids"""
+        return page_url(since=since, until=until, since_id=since_id, until_id=until_id,
+                        time_key=self.time_key, offset=None, limit=self.limit)
+
+
+def count_key(query):
+    """Get the count cache key of the query from its statement and params,
+    the queries with the same filter signature share the same key"""
+    compiled = query.statement.compile()
+    signature = u'{}:{!r}'.format(compiled, sorted(compiled.params.items()))
+    return 'count:' + hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+def order_by_primary_key(query):
+    """Order the query by its primary key after its ordering, unless its ordering has it already,
+    so that the rows have one order only"""
+    model_class = query.column_descriptions[0]['type']  # assuming
+    primary_key = inspect(model_class).primary_key[0]
+    order_by = query._order_by or ()  # pylint: disable=protected-access
+    if any(getattr(clause, 'element', clause).compare(primary_key) for clause in order_by):
+        return query
+    return query.order_by(getattr(model_class, inspect(model_class)
+                                  .get_property_by_column(primary_key).key))
+
+
+class LazyData(object):
+    """The items of a page loaded window by window while they are iterated, so that the memory
+    stays flat whatever the limit is. Only the first and the last items are kept.
+
+    The windows are queried with offset and limit instead of `yield_per` to keep the eager loads
+    of the query which are not compatible with `yield_per`. The query is ordered by its primary key
+    last, the windows would skip or repeat the rows of a same sort key otherwise.
+    """
+
+    def __init__(self, query, offset, limit, window_size=100):
+        self.query = query
+        self.offset = offset
+        self.limit = limit
+        self.window_size = window_size
+        self.first = None
+        self.last = None
+        self.count = 0
+        self.has_more = False
+
+    def __iter__(self):
+        self.count = 0
+        offset = self.offset
+        remaining = self.limit + 1  # one more item to know if there are more items
+        query = order_by_primary_key(self.query)
+        while remaining > 0:
+            size = min(self.window_size, remaining)
+            items = query.offset(offset).limit(size).all()
+            for item in items:
+                if self.count == self.limit:
+                    self.has_more = True
+                    return
+                if self.count == 0:
+                    self.first = item
+                self.last = item
+                self.count += 1
+                yield item
+            if len(items) < size:
+                return
+            offset += size
+            remaining -= size
+
+
+def iter_keyset(query, window_size=1000):
+    """Iterate all the items of the query window by window in the primary key order, each window
+    is queried with a range predicate on the last primary key instead of OFFSET so that its cost
+    does not grow with the depth and only one window is loaded at once.
+
+    :param query the query instance
+    :param window_size the number of items loaded at once
+    """
+    model_class = query.column_descriptions[0]['type']  # assuming
+    primary_key = getattr(model_class, inspect(model_class).primary_key[0].key)
+    query = query.offset(None).limit(None).order_by(None).order_by(primary_key.asc())
+
+    window_query = query
+    while True:
+        items = window_query.limit(window_size).all()
+        for item in items:
+            yield item
+        if len(items) < window_size:
+            return
+        window_query = query.filter(primary_key > getattr(items[-1], primary_key.key))
 
 
 class OffsetPagination(object):
     """offset-based pagination,
-    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4"""
+    see: https://developers.facebook.com/docs/graph-api/using-graph-api/v2.4
+
+    The count modes:
 
-    def __init__(self, query, offset=None, limit=None):
+    - exact: the total count is queried for every page
+    - estimate: the total count is cached by the filter signature of the query in the count
+      cache for its TTL, so the count may be out of date
+    - none: the total count is not queried, it is None
+
+    With the estimate and none modes, `has_next` is derived by fetching one more item.
+
+    When the limit reaches the stream threshold, the data is a :class:`LazyData` to be streamed,
+    `has_next` and the cursors are known once the data is iterated.
+    """
+
+    count_modes = ('exact', 'estimate', 'none')
+
+    def __init__(self, query, offset=None, limit=None, sort=None, count_mode='exact',
+                 stream=False):
         """initialize the offset based pagination
         :param query the query instance
         :param offset optional offset
         :param limit official limit
+        :param sort optional sorting string of the query (sort='+a,-b,c') for the cursors
+        :param count_mode optional count mode, one of `count_modes`, default is exact
+        :param stream optional, if the data may be streamed, it is lazy from the STREAM_THRESHOLD
+                      config limit then it is loaded by STREAM_WINDOW_SIZE config items at once
         """
-        pagination_limit = current_app.config.get('PAGINATION_LIMIT', 25)
+        self.limit = get_limit(limit)
+        self.query = query
+        self.sort = sort
+        self.count_mode = count_mode or 'exact'
+        self.lazy = False
+
+        if stream:
+            stream_threshold = current_app.config.get('STREAM_THRESHOLD')
+            self.lazy = stream_threshold is not None and self.limit >= stream_threshold
 
         if offset is None:
             self.offset = 0
@@ -40,15 +435,51 @@ class OffsetPagination(object):
         else:
             self.offset = offset
 
-        if limit is None:
-            self.limit = pagination_limit
-        elif limit <= 0:
-            raise ValueError('limit is negative({}), should be positive'.format(limit))
+        if self.count_mode not in self.count_modes:
+            raise ValueError('Invalid count mode: {}'.format(self.count_mode))
+
+        if self.count_mode == 'exact':
+            # the ordering is useless to count the rows
+            self.count = query.offset(None).limit(None).order_by(None).count()
+        else:
+            self.count = self._estimate_count() if self.count_mode == 'estimate' else None
+
+        if self.lazy:
+            self.data = LazyData(query.offset(None).limit(None), self.offset, self.limit,
+                                 current_app.config.get('STREAM_WINDOW_SIZE', 100))
+        elif self.count_mode == 'exact':
+            self.data = query.offset(self.offset).limit(self.limit).all()
+            self.has_more = (self.offset + self.limit) < self.count
         else:
-            self.limit = limit if limit <= pagination_limit else pagination_limit
+            items = query.offset(self.offset).limit(self.limit + 1).all()
+            self.has_more = len(items) > self.limit
+            self.data = items[:self.limit]
+
+    def _estimate_count(self):
+        """Get the cached count of the query or query and cache it"""
+        query = self.query.offset(None).limit(None).order_by(None)
+        key = count_key(query)
+        count = count_cache.get(key)
+        if count is None:
+            count = query.count()
+            count_cache.set(key, count)
+        return count
 
-        self.count = query.offset(None).limit(None).count()
-        self.data = query.offset(self.offset).limit(self.limit).all()
+    @property
+    def before(self):
+        """Get the cursor of the first item of the page to switch to the cursor-based pagination"""
+        first = self.data.first if self.lazy else (self.data[0] if self.data else None)
+        if first is not None:
+            return make_cursor(first, get_cursor_keys(self.query, self.sort)[1])
+        return None
+
+    @property
+    def after(self):
+        """Get the cursor of the last item of the page to switch to the cursor-based pagination"""
+        last = self.data.last if self.lazy else (self.data[-1] if self.data else None)
+        if last is not None:
+            return make_cursor(last, get_cursor_keys(self.query, self.sort)[1])
+        return None
 
     @property
     def has_prev(self):
@@ -58,7 +489,7 @@ class OffsetPagination(object):
     @property
     def has_next(self):
         """Check if the pagination has a next page"""
-        return (self.offset + self.limit) < self.count
+        return self.data.has_more if self.lazy else self.has_more
 
     @property
     def prev_url(self):
@@ -79,7 +510,4 @@ class OffsetPagination(object):
     @staticmethod
     def page_url(offset, limit):
         """Construct the page url from the provided offset and limit"""
-        args = merge_dict(request.view_args, request.values.to_dict())
-        args['offset'] = offset
-        args['limit'] = limit
-        return url_for(request.endpoint, _external=True, **args)
+        return page_url(offset=offset, limit=limit)
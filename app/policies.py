@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+    policies
+    ~~~~~~~~
+
+    the view decorators declaring a policy: a guard checking the args of the view before it, a
+    parser adding the parsed args to them, or a processor of the result of the view
+
+    The policy decorators nest as the usual decorators. `compile_view` flattens a chain of them
+    into one dispatch function when the resources are registered: the guards and the parsers are
+    run in the declared order, then the view, then the processors from the innermost one, without
+    a nested call per decorator. A decorator which is not a policy ends the chain, it is called as
+    the view.
+"""
+
+from collections import namedtuple
+from functools import wraps
+import inspect
+
+
+GUARD = 'guard'
+PARSER = 'parser'
+PROCESSOR = 'processor'
+BIND = 'bind'
+
+#: the declared policy of a decorated view, the step is the check, parse or process function
+Policy = namedtuple('Policy', ['kind', 'name', 'step'])
+
+
+# the decorated functions only close over the decorated one and the policy, flask-classy looks for
+# the argspec of the view in their closure
+def _declare(policy, func, decorated):
+    decorated.policy = policy
+    decorated.policy_wrapped = func
+    return decorated
+
+
+def guard(name, check):
+    """Makes the decorator running the check with the args of the view before it.
+
+    .. versionadded:: 0.1.0
+
+    :param name: the name of the policy, for example: auth or permission.
+    :param check: the function called with the args of the view, it raises or returns the
+                  response of the view instead of None to deny.
+    """
+    policy = Policy(GUARD, name, check)
+
+    def wrapper(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            response = policy.step(*args, **kwargs)
+            if response is not None:
+                return response
+            return func(*args, **kwargs)
+
+        return _declare(policy, func, decorated)
+
+    return wrapper
+
+
+def parser(name, parse):
+    """Makes the decorator parsing the args of the view.
+
+    .. versionadded:: 0.1.0
+
+    :param name: the name of the policy, for example: args.
+    :param parse: the function called with the args tuple and the kwargs dict of the view, it
+                  returns the new ones.
+    """
+    policy = Policy(PARSER, name, parse)
+
+    def wrapper(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            args, kwargs = policy.step(args, kwargs)
+            return func(*args, **kwargs)
+
+        return _declare(policy, func, decorated)
+
+    return wrapper
+
+
+def processor(name, process):
+    """Makes the decorator processing the result of the view.
+
+    .. versionadded:: 0.1.0
+
+    :param name: the name of the policy, for example: paginate or marshal.
+    :param process: the function called with the result of the view, it returns the new one.
+    """
+    policy = Policy(PROCESSOR, name, process)
+
+    def wrapper(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            return policy.step(func(*args, **kwargs))
+
+        return _declare(policy, func, decorated)
+
+    return wrapper
+
+
+def get_policy(func):
+    """Gets the declared policy of a decorated view, a bound method is not a policy by itself"""
+    if inspect.ismethod(func):
+        return None
+    return getattr(func, 'policy', None)
+
+
+def compile_view(view, wrap=None):
+    """Flattens the chain of the policy decorators of a view into one dispatch function, the
+    bound methods are bound by the dispatch.
+
+    The `stages` of the dispatch function are the names of its policies in the run order, with
+    `call` for the view.
+
+    .. versionadded:: 0.1.0
+
+    :param view: the decorated view.
+    :param wrap: the optional function wrapping the steps and the view by their stage name,
+                 for example: `Timings.timed`.
+
+    :return the dispatch function, or the view if it has no policy and nothing to wrap
+    """
+    steps, processors, stages = [], [], []
+    func = view
+    while True:
+        if inspect.ismethod(func) and func.__self__ is not None and get_policy(func.__func__):
+            steps.append((BIND, None, func.__self__, ()))
+            func = func.__func__
+            continue
+        policy = get_policy(func)
+        if policy is None:
+            break
+        if policy.kind == PROCESSOR:
+            processors.append(policy)
+        else:
+            # the processors declared out of a guard process its response
+            steps.append((policy.kind, policy.name, policy.step, tuple(reversed(processors))))
+            stages.append(policy.name)
+        func = func.policy_wrapped
+
+    if func is view and wrap is None:
+        return view
+
+    processors.reverse()
+    stages += ['call'] + [policy.name for policy in processors]
+    if wrap is None:
+        wrap = lambda name, step: step
+    steps = tuple((kind, step if kind == BIND else wrap(name, step),
+                   tuple(wrap(outer.name, outer.step) for outer in outer_processors))
+                  for kind, name, step, outer_processors in steps)
+    processors = tuple(wrap(policy.name, policy.step) for policy in processors)
+    call = wrap('call', func)
+
+    @wraps(view)
+    def dispatch(*args, **kwargs):
+        for kind, step, outer_processors in steps:
+            if kind is GUARD:
+                response = step(*args, **kwargs)
+                if response is not None:
+                    for process in outer_processors:
+                        response = process(response)
+                    return response
+            elif kind is PARSER:
+                args, kwargs = step(args, kwargs)
+            else:
+                args = (step,) + args
+        result = call(*args, **kwargs)
+        for process in processors:
+            result = process(result)
+        return result
+
+    dispatch.__dict__.pop('policy', None)
+    dispatch.__dict__.pop('policy_wrapped', None)
+    dispatch.stages = stages
+    return dispatch
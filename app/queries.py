@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+    queries
+    ~~~~~~~
+
+    sql query monitoring of the requests, enabled by the QUERIES_ENABLED config
+
+    The queries executed by the engines are timed by their before/after_cursor_execute events.
+    The queries of a request are counted by statement, the statements executed QUERIES_REPEATED
+    times or more by a request are logged as repeated with its endpoint, a repeated statement is
+    the usual sign of a N+1 query (a query per item of a page instead of a query per page). The
+    queries slower than QUERIES_SLOW seconds are logged with the endpoint of their request.
+
+    The time of the queries of the timed requests is their db phase, see `app.timings`.
+
+    `QueryMonitor.capture` counts the queries of a block, see
+    `tests.integration.IntegrationTestCase.assertMaxQueries`.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+from flask import request, _request_ctx_stack
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .timings import current_timings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries(object):
+    """The number, the time and the statements of the queries of a request or a block, the
+    queries slower than the optional slow_query seconds are logged.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, slow_query=None):
+        self.slow_query = slow_query
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """Gets the statements executed at least threshold times.
+
+        .. versionadded:: 0.1.0
+
+        :param threshold: the minimum number of executions.
+
+        :return the list of the statements and their count, the most executed first
+        """
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+def _one_line(statement):
+    return ' '.join(statement.split())
+
+
+# the queries of the blocks of `QueryMonitor.capture` by thread
+_local = threading.local()
+
+
+def _captures():
+    return getattr(_local, 'captures', ())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # the start time is kept by the execution context, discarded with it if the statement fails
+    if context is not None and (_captures() or current_queries() is not None or
+                                current_timings() is not None):
+        context._query_started_at = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, '_query_started_at', None)
+    if started_at is None:
+        return
+    del context._query_started_at
+    seconds = time.time() - started_at
+
+    queries = current_queries()
+    if queries is not None:
+        queries.add(statement, seconds)
+        if queries.slow_query is not None and seconds >= queries.slow_query:
+            logger.warning('slow query of %s, %.1f ms: %s', request.endpoint, seconds * 1000,
+                           _one_line(statement))
+    for capture in _captures():
+        capture.add(statement, seconds)
+    timings = current_timings()
+    if timings is not None:
+        timings.add('db', seconds)
+
+
+def current_queries():
+    """Gets the queries of the current request, None if they are not monitored
+
+    .. versionadded:: 0.1.0
+    """
+    top = _request_ctx_stack.top
+    return getattr(top, 'queries', None) if top is not None else None
+
+
+class QueryMonitor(object):
+    """Counts the queries of the requests and logs the slow and the repeated ones, configured by
+    the QUERIES_* config.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query = None
+        self.repeated_threshold = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configures the monitor by the QUERIES_* config, listens to the engines and registers
+        the request hooks.
+
+        .. versionadded:: 0.1.0
+
+        :param app: the Flask app.
+        """
+        self.enabled = app.config.get('QUERIES_ENABLED', False)
+        self.slow_query = app.config.get('QUERIES_SLOW')
+        self.repeated_threshold = app.config.get('QUERIES_REPEATED')
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        if self.enabled:
+            _request_ctx_stack.top.queries = RequestQueries(self.slow_query)
+
+    def finish(self, response):
+        queries = current_queries()
+        if queries is not None and self.repeated_threshold:
+            for statement, count in queries.repeated(self.repeated_threshold):
+                logger.warning('repeated query of %s, %d times: %s', request.endpoint, count,
+                               _one_line(statement))
+        return response
+
+    @contextmanager
+    def capture(self):
+        """Counts the queries of the block executed by the current thread.
+
+        .. versionadded:: 0.1.0
+
+        :return the `RequestQueries` of the block
+        """
+        queries = RequestQueries()
+        if not hasattr(_local, 'captures'):
+            _local.captures = []
+        _local.captures.append(queries)
+        try:
+            yield queries
+        finally:
+            _local.captures.remove(queries)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+    query_shapes
+    ~~~~~~~~~~~~
+
+    registry of the shapes of the list queries: the equality filter keys, the range filter keys
+    and the sort keys of a model, counted by hits.
+
+    The counts of each process are written by a background thread into its own json file, next
+    to the QUERY_SHAPES_FILE config (in the instance folder by default), every
+    QUERY_SHAPES_FLUSH_INTERVAL seconds. The files of all the processes are merged, then
+    :func:`suggest_indexes` turns them into the composite indexes of the hit shapes, see
+    `manage.py db suggest-indexes`. Remove the files to reset the counts.
+"""
+
+from collections import Counter, namedtuple
+import json
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import inspect
+
+from .utils import parse_sort
+
+
+class QueryShape(namedtuple('QueryShape', ['model_name', 'equal_keys', 'range_keys',
+                                           'sort_keys'])):
+    """The shape of a list query, the keys are sorted tuples except the sort keys which keep
+    their order"""
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+    @classmethod
+    def from_dict(cls, shape_dict):
+        return cls(str(shape_dict['model_name']),
+                   *[tuple(str(key) for key in shape_dict[name]) for name in cls._fields[1:]])
+
+
+def make_query_shape(model_name, filters=None, filter_dict=None, sort=None):
+    """Make the shape of a list query.
+
+    :param model_name the model name
+    :param filters the accepted filters list of dict items with keys: (key, op, value)
+    :param filter_dict the accepted equality filters dict
+    :param sort the sorting string
+
+    :return the query shape
+    """
+    equal_keys = set(filter_dict or ())
+    range_keys = set()
+    for op_item in filters or ():
+        if op_item.get('op') == 'eq':
+            equal_keys.add(op_item['key'])
+        else:
+            range_keys.add(op_item['key'])
+    sort_keys = tuple(key for key, _ in parse_sort(sort))
+    return QueryShape(model_name, tuple(sorted(equal_keys)),
+                      tuple(sorted(range_keys - equal_keys)), sort_keys)
+
+
+class QueryShapeRegistry(object):
+    """Counts the hits of the query shapes in memory, the counts of each process are written into
+    its own json file by a background thread, out of the requests"""
+
+    def __init__(self, path=None, flush_interval=60, enabled=True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.counts = Counter()
+        self.changed = False
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configures the registry by the QUERY_SHAPES_* config of the app.
+
+        :param app: the Flask app.
+        """
+        self.enabled = app.config.get('QUERY_SHAPES_ENABLED', True)
+        self.path = app.config.get('QUERY_SHAPES_FILE') or \
+            os.path.join(app.instance_path, 'query_shapes.json')
+        self.flush_interval = app.config.get('QUERY_SHAPES_FLUSH_INTERVAL', 60)
+
+    def get_process_path(self):
+        """Get the file of the counts of the current process, query_shapes.<pid>.json"""
+        root, ext = os.path.splitext(self.path)
+        return '{}.{}{}'.format(root, os.getpid(), ext)
+
+    def record(self, shape):
+        """Counts a hit of a query shape, the flushing thread of the process is started at its
+        first hit."""
+        if not self.enabled:
+            return
+        if self.path and self.pid != os.getpid():
+            self.start()
+        with self.lock:
+            self.counts[shape] += 1
+            self.changed = True
+
+    def start(self):
+        """Starts the flushing thread of the current process, as the threads do not survive the
+        forks of the workers, the counts of the parent process are not counted again."""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.counts = Counter()
+            self.changed = False
+        thread = threading.Thread(target=self.run, name='query-shapes-{}'.format(self.pid))
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        # the counts of a previous process of the same pid are kept
+        counts = self.read_file(self.get_process_path())
+        with self.lock:
+            self.counts.update(counts)
+        while self.pid == os.getpid():
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    @staticmethod
+    def read_file(path):
+        counts = Counter()
+        if os.path.exists(path):
+            with open(path) as shapes_file:
+                for item in json.load(shapes_file):
+                    counts[QueryShape.from_dict(item)] += item['hits']
+        return counts
+
+    def get_paths(self):
+        """Get the existing files of the counts: the file of the path itself, then the files of
+        the processes"""
+        if not self.path:
+            return []
+        directory, name = os.path.split(self.path)
+        root, ext = os.path.splitext(name)
+        pattern = re.compile(r'{}\.\d+{}$'.format(re.escape(root), re.escape(ext)))
+        names = sorted(name for name in os.listdir(directory or '.') if pattern.match(name)) \
+            if os.path.isdir(directory or '.') else []
+        return [path for path in [self.path] if os.path.exists(path)] + \
+            [os.path.join(directory, name) for name in names]
+
+    def read(self, exclude=None):
+        """Read the merged counts of the files.
+
+        :param exclude the optional file left out
+        :return the counter of the query shapes
+        """
+        counts = Counter()
+        for path in self.get_paths():
+            if path != exclude:
+                counts.update(self.read_file(path))
+        return counts
+
+    def flush(self):
+        """Writes the counts of the process into its file if they changed since the last flush,
+        the file is replaced atomically. The counts are written once the process is started."""
+        with self.lock:
+            if not self.changed or not self.path or self.pid != os.getpid():
+                return
+            counts = Counter(self.counts)
+            self.changed = False
+
+        path = self.get_process_path()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = '{}.tmp'.format(path)
+        with open(temp_path, 'w') as shapes_file:
+            json.dump([dict(shape.to_dict(), hits=hits) for shape, hits in counts.items()],
+                      shapes_file, indent=2, sort_keys=True)
+        os.rename(temp_path, path)
+
+    def load(self):
+        """Gets the merged counts of the files, the counts of the current process from the memory.
+
+        :return the counter of the query shapes
+        """
+        counts = self.read(exclude=self.get_process_path() if self.pid == os.getpid() else None)
+        with self.lock:
+            counts.update(self.counts)
+        return counts
+
+
+IndexSuggestion = namedtuple('IndexSuggestion', ['name', 'table_name', 'columns', 'hits'])
+
+
+def _existing_indexes(table):
+    """Get the column key tuples of the indexes, the unique constraints and the primary key"""
+    indexes = [tuple(column.key for column in index.columns) for index in table.indexes]
+    indexes.extend(tuple(column.key for column in constraint.columns)
+                   for constraint in table.constraints if hasattr(constraint, 'columns'))
+    indexes.extend((column.key,) for column in table.columns if column.unique or column.index)
+    return indexes
+
+
+def _is_covered(columns, indexes):
+    """Check if the columns are a prefix of an index"""
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def suggest_indexes(counts, datastore, min_hits=1):
+    """Suggest the composite indexes of the query shapes hit at least `min_hits` times: the
+    equality keys first, then the sort keys, then a range key; and the indexes of the join
+    tables of the eager loaded relationships of the hit models.
+
+    The indexes covered by the existing ones or by another suggestion are left out.
+
+    :param counts the counter of the query shapes
+    :param datastore the SQLAlchemy datastore of the models
+    :param min_hits the minimum hits of the query shapes
+
+    :return the list of the index suggestions
+    """
+    candidates = Counter()
+    tables = {}
+
+    for shape, hits in counts.iteritems():
+        model_class = datastore.get_model_class(shape.model_name)
+        if model_class is None or hits < min_hits:
+            continue
+        mapper = inspect(model_class)
+        table = mapper.local_table
+        column_keys = set(column.key for column in table.columns)
+
+        range_keys = [key for key in shape.range_keys if key not in shape.sort_keys][:1]
+        columns = []
+        for key in shape.equal_keys + shape.sort_keys + tuple(range_keys):
+            if key in column_keys and key not in columns:
+                columns.append(key)
+        if columns:
+            tables[table.name] = table
+            candidates[(table.name, tuple(columns))] += hits
+
+        for key in datastore.eager_loads.get(shape.model_name, {}):
+            relationship = mapper.relationships[key]
+            if relationship.secondary is None:
+                continue
+            columns = [column.key for _, column in relationship.synchronize_pairs] + \
+                [column.key for _, column in relationship.secondary_synchronize_pairs]
+            tables[relationship.secondary.name] = relationship.secondary
+            candidates[(relationship.secondary.name, tuple(columns))] += hits
+
+    suggestions = []
+    for (table_name, columns), hits in candidates.most_common():
+        indexes = _existing_indexes(tables[table_name])
+        others = [other for (other_table, other), _ in candidates.iteritems()
+                  if other_table == table_name and other != columns]
+        if _is_covered(columns, indexes) or _is_covered(columns, others):
+            continue
+        name = 'ix_{}_{}'.format(table_name, '_'.join(columns))
+        suggestions.append(IndexSuggestion(name, table_name, list(columns), hits))
+    return suggestions
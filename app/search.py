@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+    search
+    ~~~~~~
+
+    full-text search backends of the `q` parameter
+
+    - mysql: MATCH ... AGAINST on a FULLTEXT index
+    - postgresql: tsvector @@ tsquery on a GIN expression index
+    - ngram: in-process trigram index, for SQLite and the tests
+
+    The search indexes of the searchable fields are created with the tables by
+    :func:`register_search_indexes`, the terms are matched by word prefixes and the results are
+    ranked by relevance.
+"""
+
+from abc import ABCMeta, abstractmethod
+from collections import defaultdict
+import re
+import threading
+
+from flask import current_app
+from sqlalchemy import DDL, Float, case, event, false, func, inspect, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement, literal
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_words(text):
+    """Parse the lower case words of a text, the other characters are separators"""
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+class SearchBackend(object):
+    """Abstract search backend class.
+
+    .. versionadded:: 0.1.0
+    """
+
+    __metaclass__ = ABCMeta
+
+    #: the dialect name of the search index, None if there is no index in the database
+    dialect = None
+
+    @staticmethod
+    def index_ddl(table, fields):
+        """Gets the DDL creating the search index of the fields of a table.
+
+        .. versionadded:: 0.1.0
+
+        :param table: the table.
+        :param fields: the searchable fields.
+        """
+        return None
+
+    @abstractmethod
+    def search(self, query, model_class, fields, terms):
+        """Filters a query by the search terms.
+
+        .. versionadded:: 0.1.0
+
+        :param query: the query of the model.
+        :param model_class: the model class.
+        :param fields: the searchable fields.
+        :param terms: the search terms.
+
+        :return the tuple of the filtered query and the order by clauses of the relevance
+        """
+        pass
+
+    def invalidate(self, model_class):
+        """Invalidates the search data of a model after its rows were changed in bulk.
+
+        .. versionadded:: 0.1.0
+
+        :param model_class: the model class.
+        """
+        pass
+
+
+class MatchAgainst(ColumnElement):
+    """MySQL full-text relevance: MATCH (columns) AGAINST (terms IN BOOLEAN MODE)"""
+
+    type = Float()
+
+    def __init__(self, columns, terms):
+        self.columns = columns
+        self.terms = literal(terms)
+
+
+@compiles(MatchAgainst, 'mysql')
+def compile_match_against(element, compiler, **kwargs):
+    return 'MATCH ({}) AGAINST ({} IN BOOLEAN MODE)'.format(
+        ', '.join(compiler.process(column, **kwargs) for column in element.columns),
+        compiler.process(element.terms, **kwargs))
+
+
+class MySQLFullTextSearch(SearchBackend):
+    """MySQL (InnoDB 5.6+) full-text search, every word is required as a prefix"""
+
+    dialect = 'mysql'
+
+    @staticmethod
+    def index_ddl(table, fields):
+        return DDL('CREATE FULLTEXT INDEX ix_{}_search ON %(fullname)s ({})'.format(
+            table.name, ', '.join(fields)))
+
+    def search(self, query, model_class, fields, terms):
+        words = parse_words(terms)
+        if not words:
+            return query.filter(false()), []
+
+        relevance = MatchAgainst([getattr(model_class, field) for field in fields],
+                                 ' '.join('+{}*'.format(word) for word in words))
+        return query.filter(relevance > 0), [relevance.desc()]
+
+
+class PostgreSQLFullTextSearch(SearchBackend):
+    """PostgreSQL full-text search, every word is required as a prefix.
+
+    The documents are made of the same expression as the index so that it is used, with the
+    `simple` text search configuration as the fields are names and emails. The non-word
+    characters of the documents are replaced by spaces before they are parsed: the parser keeps an
+    email or a host name as one lexeme, its words are split as the words of the terms are by
+    :func:`parse_words`.
+    """
+
+    dialect = 'postgresql'
+
+    @staticmethod
+    def index_ddl(table, fields):
+        document = " || ' ' || ".join("coalesce({}, '')".format(field) for field in fields)
+        return DDL("CREATE INDEX ix_{}_search ON %(fullname)s USING gin "
+                   "(to_tsvector('simple', regexp_replace({}, '\\W+', ' ', 'g')))"
+                   .format(table.name, document))
+
+    def search(self, query, model_class, fields, terms):
+        words = parse_words(terms)
+        if not words:
+            return query.filter(false()), []
+
+        document = None
+        for field in fields:
+            column = func.coalesce(getattr(model_class, field), literal_column("''"))
+            document = column if document is None else document + literal_column("' '") + column
+        document = func.regexp_replace(document, literal_column("'\\W+'"),
+                                       literal_column("' '"), literal_column("'g'"))
+        vector = func.to_tsvector(literal_column("'simple'"), document)
+        tsquery = func.to_tsquery(literal_column("'simple'"),
+                                  ' & '.join('{}:*'.format(word) for word in words))
+        return query.filter(vector.op('@@')(tsquery)), [func.ts_rank(vector, tsquery).desc()]
+
+
+def make_ngrams(text, prefix=False):
+    """Make the trigrams of the words of a text, the words are padded like pg_trgm does so that
+    the short words and the word starts have their own trigrams.
+
+    :param text: the text.
+    :param prefix: if the words are prefixes, their ends are not padded then.
+    """
+    ngrams = set()
+    for word in parse_words(text):
+        padded = '  ' + word + ('' if prefix else ' ')
+        ngrams.update(padded[idx:idx + 3] for idx in range(len(padded) - 2))
+    return ngrams
+
+
+class NGramIndex(object):
+    """In-process inverted index of the trigrams of the documents by their primary ids"""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def add(self, pid, text):
+        """Indexes the text of a document, replacing its previous text if any"""
+        ngrams = make_ngrams(text)
+        with self.lock:
+            self._remove(pid)
+            self.documents[pid] = ngrams
+            for ngram in ngrams:
+                self.postings[ngram].add(pid)
+
+    def remove(self, pid):
+        with self.lock:
+            self._remove(pid)
+
+    def _remove(self, pid):
+        for ngram in self.documents.pop(pid, ()):
+            pids = self.postings[ngram]
+            pids.discard(pid)
+            if not pids:
+                del self.postings[ngram]
+
+    def search(self, terms, min_score=1.0, max_results=1000):
+        """Searches the documents sharing the trigrams of the terms, the words of the terms are
+        matched as prefixes.
+
+        :param terms: the search terms.
+        :param min_score: the minimum ratio of the trigrams of the terms found in a document,
+                          lower than 1 to tolerate the typos.
+        :param max_results: the maximum number of the results.
+
+        :return the list of the primary ids ranked by score then by similarity to the terms
+        """
+        ngrams = make_ngrams(terms, prefix=True)
+        if not ngrams:
+            return []
+
+        shared = defaultdict(int)
+        with self.lock:
+            for ngram in ngrams:
+                for pid in self.postings.get(ngram, ()):
+                    shared[pid] += 1
+            ranked = []
+            for pid, count in shared.iteritems():
+                score = float(count) / len(ngrams)
+                if score >= min_score:
+                    similarity = float(count) / (len(ngrams) + len(self.documents[pid]) - count)
+                    ranked.append((-score, -similarity, pid))
+
+        ranked.sort()
+        return [pid for _, _, pid in ranked[:max_results]]
+
+
+class NGramSearch(SearchBackend):
+    """In-process trigram search of the databases without full-text indexes.
+
+    The index of a model is built from its table at its first search, then it is updated by the
+    inserts, updates and deletes of the model instances and invalidated by the bulk changes. It
+    is local to the process and it may keep the changes of the rolled back transactions, the
+    matched primary ids are filtered by the database so the missing rows are never returned.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.fields = {}
+        self.listened = set()
+        self.lock = threading.Lock()
+
+    def get_index(self, query, model_class, fields):
+        index = self.indexes.get(model_class)
+        if index is not None:
+            return index
+
+        with self.lock:
+            index = self.indexes.get(model_class)
+            if index is not None:
+                return index
+
+            self.listen(model_class)
+            self.fields[model_class] = fields
+            index = NGramIndex()
+            primary_key = inspect(model_class).primary_key[0]
+            columns = [getattr(model_class, field) for field in fields]
+            for row in query.session.query(primary_key, *columns).yield_per(1000):
+                index.add(row[0], ' '.join(value for value in row[1:] if value))
+            self.indexes[model_class] = index
+        return index
+
+    def listen(self, model_class):
+        """Listens to the changes of the model instances and of its table"""
+        if model_class in self.listened:
+            return
+        self.listened.add(model_class)
+
+        for name in ('after_insert', 'after_update'):
+            event.listen(model_class, name, self.index_instance)
+        event.listen(model_class, 'after_delete', self.remove_instance)
+        for name in ('after_create', 'after_drop'):
+            event.listen(model_class.__table__, name,
+                         lambda *args, **kwargs: self.invalidate(model_class))
+
+    def index_instance(self, mapper, connection, target):
+        index = self.indexes.get(mapper.class_)
+        if index is not None:
+            fields = self.fields[mapper.class_]
+            index.add(mapper.primary_key_from_instance(target)[0],
+                      ' '.join(getattr(target, field) or '' for field in fields))
+
+    def remove_instance(self, mapper, connection, target):
+        index = self.indexes.get(mapper.class_)
+        if index is not None:
+            index.remove(mapper.primary_key_from_instance(target)[0])
+
+    def invalidate(self, model_class):
+        self.indexes.pop(model_class, None)
+
+    def search(self, query, model_class, fields, terms):
+        pids = self.get_index(query, model_class, fields).search(
+            terms, current_app.config.get('SEARCH_NGRAM_MIN_SCORE', 1.0),
+            current_app.config.get('SEARCH_NGRAM_MAX_RESULTS', 1000))
+        if not pids:
+            return query.filter(false()), []
+
+        primary_key = getattr(model_class, inspect(model_class).primary_key[0].key)
+        rank = case(dict((pid, idx) for idx, pid in enumerate(pids)), value=primary_key)
+        return query.filter(primary_key.in_(pids)), [rank]
+
+
+# the search backends by names, the databases of the other dialects are searched by ngram
+SEARCH_BACKENDS = {
+    'mysql': MySQLFullTextSearch,
+    'postgresql': PostgreSQLFullTextSearch,
+    'ngram': NGramSearch
+}
+
+
+def register_search_indexes(table, fields):
+    """Registers the creation of the search indexes of the fields with the table for the
+    dialects of the search backends.
+
+    :param table: the table.
+    :param fields: the searchable fields.
+    """
+    for backend_class in SEARCH_BACKENDS.itervalues():
+        ddl = backend_class.index_ddl(table, fields)
+        if ddl is not None:
+            event.listen(table, 'after_create', ddl.execute_if(dialect=backend_class.dialect))
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+    timings
+    ~~~~~~~
+
+    request timings by phase, enabled by the TIMINGS_ENABLED config
+
+    The phases of the api requests are the stages of their compiled views (see `app.policies`):
+    auth (the jwt decoding and the user loading), permission, args, call (the view), paginate,
+    marshal, then json (the encoding of the response), db: the queries executed meanwhile
+    (timed by `app.queries`), and hash: the password verifications (timed by
+    `app.auth.passwords`), they overlap the other phases. The total is the time from the start
+    of the request to its response, the streamed bodies are not timed.
+
+    The timings of a request are returned by the `Server-Timing` header if TIMINGS_HEADER and
+    aggregated per endpoint and phase in histograms of the process, see /api/v1.0/timings.
+    The requests slower than TIMINGS_SLOW_REQUEST seconds are logged with their phases.
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from flask import request, _request_ctx_stack
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings(object):
+    """The seconds and the number of calls of the phases of a request.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases = OrderedDict()
+        self.calls = {}
+
+    def add(self, phase, seconds, calls=1):
+        """Adds the time of a phase, the times of its calls are summed.
+
+        .. versionadded:: 0.1.0
+
+        :param phase: the name of the phase.
+        :param seconds: the duration in seconds.
+        :param calls: the number of calls.
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def server_timing(self, total):
+        """Makes the value of the Server-Timing header, in milliseconds.
+
+        .. versionadded:: 0.1.0
+
+        :param total: the total seconds of the request.
+        """
+        metrics = []
+        for phase, seconds in self.phases.items():
+            desc = ';desc="{} queries"'.format(self.calls[phase]) if phase == 'db' else ''
+            metrics.append('{}{};dur={:.3f}'.format(phase, desc, seconds * 1000))
+        metrics.append('total;dur={:.3f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+
+class Histogram(object):
+    """Histogram of durations by buckets doubling from 0.1 ms, with the number of calls.
+
+    .. versionadded:: 0.1.0
+    """
+
+    BOUNDS = [0.0001 * 2 ** idx for idx in range(18)]  # 0.1 ms to 13 s
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.calls = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, calls=1):
+        idx = 0
+        while idx < len(self.BOUNDS) and seconds > self.BOUNDS[idx]:
+            idx += 1
+        self.buckets[idx] += 1
+        self.count += 1
+        self.calls += calls
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, ratio):
+        """Estimates a percentile by the upper bound of its bucket, the max at most"""
+        rank = ratio * self.count
+        cumulated = 0
+        for idx, count in enumerate(self.buckets):
+            cumulated += count
+            if count and cumulated >= rank:
+                return min(self.BOUNDS[idx], self.max) if idx < len(self.BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'calls_mean': float(self.calls) / self.count if self.count else 0.0,
+            'mean_ms': self.sum * 1000 / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p90_ms': self.percentile(0.9) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000
+        }
+
+
+def current_timings():
+    """Gets the timings of the current request, None if it is not timed
+
+    .. versionadded:: 0.1.0
+    """
+    top = _request_ctx_stack.top
+    return getattr(top, 'timings', None) if top is not None else None
+
+
+class Timings(object):
+    """The timings of the requests aggregated per endpoint and phase, configured by the
+    TIMINGS_* config.
+
+    .. versionadded:: 0.1.0
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.header = False
+        self.slow_request = None
+        self.histograms = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configures the timings by the TIMINGS_* config and registers the request hooks.
+
+        .. versionadded:: 0.1.0
+
+        :param app: the Flask app.
+        """
+        self.enabled = app.config.get('TIMINGS_ENABLED', False)
+        self.header = app.config.get('TIMINGS_HEADER', False)
+        self.slow_request = app.config.get('TIMINGS_SLOW_REQUEST')
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        if self.enabled:
+            _request_ctx_stack.top.timings = RequestTimings()
+
+    def timed(self, phase, func):
+        """Wraps a function to add its time to the phase of the timed requests.
+
+        .. versionadded:: 0.1.0
+
+        :param phase: the name of the phase.
+        :param func: the function.
+        """
+        def timed_func(*args, **kwargs):
+            timings = current_timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            started_at = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(phase, time.time() - started_at)
+
+        return timed_func
+
+    def finish(self, response):
+        timings = current_timings()
+        if timings is None:
+            return response
+        total = time.time() - timings.started_at
+        endpoint = request.endpoint
+        if endpoint is not None:
+            self.record(endpoint, timings, total)
+        if self.header:
+            response.headers['Server-Timing'] = timings.server_timing(total)
+        if self.slow_request is not None and total >= self.slow_request:
+            logger.warning('slow request %s %s: %s', request.method, request.path,
+                           timings.server_timing(total))
+        return response
+
+    def record(self, endpoint, timings, total):
+        """Records the timings of a request of an endpoint into its histograms.
+
+        .. versionadded:: 0.1.0
+
+        :param endpoint: the endpoint of the request.
+        :param timings: the `RequestTimings` of the request.
+        :param total: the total seconds of the request.
+        """
+        phases = list(timings.phases.items()) + [('total', total)]
+        with self.lock:
+            for phase, seconds in phases:
+                histogram = self.histograms.get((endpoint, phase))
+                if histogram is None:
+                    histogram = self.histograms[endpoint, phase] = Histogram()
+                histogram.record(seconds, timings.calls.get(phase, 1))
+
+    def get_stats(self):
+        """Gets the statistics of the histograms by endpoint and phase.
+
+        .. versionadded:: 0.1.0
+
+        :return the dict of the endpoints to the dicts of their phases to their statistics
+        """
+        stats = {}
+        with self.lock:
+            for (endpoint, phase), histogram in self.histograms.items():
+                stats.setdefault(endpoint, {})[phase] = histogram.to_dict()
+        return stats
+
+    def reset(self):
+        """Clears the histograms.
+
+        .. versionadded:: 0.1.0
+        """
+        with self.lock:
+            self.histograms = {}
@@ -5,6 +5,8 @@
 import os
 import collections
 
+from sqlalchemy import inspect, String
+
 
 INSTANCE_FOLDER_PATH = os.path.join('/tmp', 'instance')
 
@@ -127,6 +129,104 @@ def add_filters(query, op_sequence, accepted_keys):
     return query
 
 
+# the comparator methods of the column attributes by filter operators
+FILTER_OPERATORS = {
+    'eq': '__eq__',
+    'ne': '__ne__',
+    'lt': '__lt__',
+    'le': '__le__',
+    'gt': '__gt__',
+    'ge': '__ge__',
+    'in_': 'in_',
+    'notin_': 'notin_'
+}
+
+# the filter operators of the string columns only
+STRING_FILTER_OPERATORS = {
+    'like': 'like',
+    'notlike': 'notlike',
+    'contains': 'contains',
+    'match': 'match'
+}
+
+
+def make_filter_plan(model_class):
+    """Make the filter plan of a model: the comparators of its columns by keys and operators,
+    for example: {'name': {'eq': Role.name.__eq__, 'like': Role.name.like, ...}, ...}
+
+    :param model_class the model class
+
+    :return the filter plan dict
+    """
+    plan = {}
+    for column_property in inspect(model_class).column_attrs:
+        column = getattr(model_class, column_property.key)
+        operators = FILTER_OPERATORS
+        if isinstance(column_property.columns[0].type, String):
+            operators = merge_dict(operators, STRING_FILTER_OPERATORS)
+        plan[column_property.key] = dict((operator, getattr(column, name))
+                                         for operator, name in operators.iteritems())
+    return plan
+
+
+def apply_filter_plan(query, plan, op_sequence, accepted_keys):
+    """Add the filters of the accepted keys to a query with the comparators of a filter plan.
+
+    :param query existing query
+    :param plan the filter plan of the query model from :func:`make_filter_plan`
+    :param op_sequence sequence of op_item: {"key": <fieldname>, "op": <operator>, "value": <value>}
+    :param accepted_keys the sequence of accepted keys
+
+    :return the updated query with added filters
+    """
+    if not accepted_keys:
+        return query
+
+    criteria = []
+    for op_item in op_sequence:
+        key = op_item.get('key')
+        if key not in accepted_keys:
+            continue
+
+        comparators = plan.get(key)
+        if comparators is None:
+            raise ValueError('Invalid filter column: {}'.format(key))
+
+        operator = op_item.get('op')
+        comparator = comparators.get(operator)
+        if comparator is None:
+            raise ValueError('Invalid filter operator: {}'.format(operator))
+
+        criteria.append(comparator(op_item.get('value')))
+
+    return query.filter(*criteria) if criteria else query
+
+
+def parse_sort(sort):
+    """Parse the sort string into a list of (key, descending) tuples
+
+    :param sort sorting string, for example: name,-description,id,+email
+
+    :return the list of (key, descending) tuples, for example:
+            [('name', False), ('description', True), ('id', False), ('email', False)]
+    """
+    if not sort:
+        return []
+
+    result = []
+    for key in sort.split(','):
+        key = key.strip()
+        if not key:
+            continue
+        if key.startswith('-'):
+            result.append((key[1:], True))
+        elif key.startswith('+'):
+            result.append((key[1:], False))
+        else:
+            result.append((key, False))
+    return result
+
+
 # thanks to http://stackoverflow.com/questions/8100166/inheriting-methods-docstrings-in-python
 def fix_docs(cls):
     for name, func in vars(cls).items():
@@ -144,3 +244,9 @@ def parse_number(s):
         return float(s)
     except ValueError:
         return int(s) if s.isdigit() else s
+
+
+def chunked(sequence, size):
+    """Split the sequence into the lists of `size` items, the last one may be shorter"""
+    sequence = list(sequence)
+    return [sequence[idx:idx + size] for idx in range(0, len(sequence), size)]
@@ -1,7 +1,7 @@
-from factory import Sequence, LazyAttribute, post_generation
+from factory import Sequence, post_generation
 from factory.alchemy import SQLAlchemyModelFactory
 
-from app.iorad.models import Role, User
+from app.auth.models import Role, User
 from app.extensions import db
 
 
@@ -21,10 +21,9 @@ class UserFactory(SQLAlchemyModelFactory):
         model = User
         sqlalchemy_session = db.session
 
-    first_name = 'John'
-    last_name = 'Doe'
-    email = LazyAttribute(lambda user:
-                          '{0}.{1}@example.com'.format(user.first_name, user.last_name).lower())
+    email = Sequence(lambda n: 'user%s@example.com' % n)
+    password = 'password'
+    active = True
 
     @post_generation
     def roles(self, created, extracted, **kwargs):
@@ -32,4 +31,4 @@ class UserFactory(SQLAlchemyModelFactory):
             return
         if extracted:
             for role in extracted:
-                self.roles.add(role)
+                self.roles.append(role)
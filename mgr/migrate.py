@@ -1,10 +1,16 @@
 """extends flask_migrate"""
 
-from flask_script import prompt_bool
+import os
+
+from alembic.script import ScriptDirectory
+from alembic.util import rev_id
+from flask import current_app
+from flask_script import Command, Option, prompt_bool
 from flask_migrate import MigrateCommand
 from sqlalchemy_utils import database_exists, create_database, drop_database
 
-from app.extensions import db
+from app.extensions import db, auth_datastore
+from app.query_shapes import suggest_indexes as make_index_suggestions
 from db import seeds
 
 
@@ -44,3 +50,52 @@ def reset():
     This is equivalent to $ manage.py db drop && manage.py db setup"""
     drop()
     setup()
+
+
+def suggest_indexes(directory=None, min_hits=1, message=None, sql=False):
+    """Generate a migration of the composite indexes of the recorded query shapes."""
+    counts = auth_datastore.query_shapes.load()
+    suggestions = make_index_suggestions(counts, auth_datastore, min_hits=min_hits)
+    if not suggestions:
+        print 'no index to suggest from {} query shapes'.format(len(counts))
+        return
+
+    upgrades = ['op.create_index({!r}, {!r}, {!r}, unique=False)'.format(
+        suggestion.name, suggestion.table_name, suggestion.columns) for suggestion in suggestions]
+    downgrades = ['op.drop_index({!r}, table_name={!r})'.format(
+        suggestion.name, suggestion.table_name) for suggestion in reversed(suggestions)]
+    if sql:
+        for suggestion in suggestions:
+            print 'CREATE INDEX {} ON {} ({});  -- {} hits'.format(
+                suggestion.name, suggestion.table_name, ', '.join(suggestion.columns),
+                suggestion.hits)
+        return
+
+    config = current_app.extensions['migrate'].migrate.get_config(directory)
+    script_directory = ScriptDirectory.from_config(config)
+    if not os.path.exists(script_directory.versions):
+        os.makedirs(script_directory.versions)
+    script = script_directory.generate_revision(
+        rev_id(), message or 'add the indexes of the query shapes', head='head',
+        upgrades='\n    '.join(upgrades), downgrades='\n    '.join(downgrades))
+    print 'generated {}'.format(script.path)
+
+
+class SuggestIndexes(Command):
+    """Generate a migration of the composite indexes of the recorded query shapes."""
+
+    option_list = (
+        Option('-d', '--directory', dest='directory', default=None,
+               help="migration script directory (default is 'migrations')"),
+        Option('--min-hits', dest='min_hits', type=int, default=1,
+               help='minimum hits of the query shapes (default is 1)'),
+        Option('-m', '--message', dest='message', default=None),
+        Option('--sql', dest='sql', action='store_true', default=False,
+               help='print the CREATE INDEX statements instead of generating a migration'),
+    )
+
+    def run(self, directory=None, min_hits=1, message=None, sql=False):
+        suggest_indexes(directory, min_hits, message, sql)
+
+
+MigrateCommand.add_command('suggest-indexes', SuggestIndexes())
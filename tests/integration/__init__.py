@@ -1,12 +1,13 @@
 """integration tests"""
 
+from contextlib import contextmanager
 import unittest
 from nose.plugins.attrib import attr
 from sqlalchemy_utils import database_exists, create_database
 
 from app import create_app
 from app.config import TestConfig
-from app.extensions import db
+from app.extensions import db, query_monitor
 
 from . import fixtures
 
@@ -29,3 +30,16 @@ class IntegrationTestCase(unittest.TestCase):
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
+
+    @contextmanager
+    def assertMaxQueries(self, max_count):
+        """Asserts the block executes max_count queries at most, for example:
+
+        with self.assertMaxQueries(2):
+            self.client.get('/api/v1.0/roles', headers=headers)
+        """
+        with query_monitor.capture() as queries:
+            yield queries
+        self.assertLessEqual(queries.count, max_count,
+                             '{} queries, {} expected at most:\n{}'.format(
+                                 queries.count, max_count, '\n'.join(queries.statements)))
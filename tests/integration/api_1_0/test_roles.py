@@ -1,10 +1,22 @@
 import json
 
+from app.extensions import auth_datastore
 from tests.integration import IntegrationTestCase
 
 
 class RoleResourceTestCase(IntegrationTestCase):
 
+    def get_admin_headers(self):
+        # int seconds are expected by jwt_make_payload
+        self.app.config['JWT_LEEWAY'] = 0
+        # kept in the identity map of the session shared with the test client requests
+        self.admin = auth_datastore.create_user(email='admin@example.com', password='123456')
+        self.admin.roles.append(auth_datastore.find_roles(name='admin').first())
+        auth_datastore.commit()
+        rv = self.client.post('/api/v1.0/token', data={'email': 'admin@example.com',
+                                                       'password': '123456'})
+        return {'Authorization': 'JWT ' + json.loads(rv.data)['token']}
+
     def test_index_invalid_auth(self):
         rv = self.client.get('/api/v1.0/roles')
         self.assertEqual(rv.status_code, 401)
@@ -17,7 +29,13 @@ class RoleResourceTestCase(IntegrationTestCase):
         pass
 
     def test_index_valid_perm(self):
-        pass
+        headers = self.get_admin_headers()
+
+        # the count and the page
+        with self.assertMaxQueries(2):
+            rv = self.client.get('/api/v1.0/roles', headers=headers)
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(len(json.loads(rv.data)['data']), 2)
 
     def test_create_invalid_auth(self):
         rv = self.client.post('/api/v1.0/roles')
@@ -31,7 +49,14 @@ class RoleResourceTestCase(IntegrationTestCase):
         pass
 
     def test_create_valid_perm(self):
-        pass
+        rv = self.client.post('/api/v1.0/roles', headers=self.get_admin_headers(),
+                              data={'name': 'editor', 'description': 'the editors'})
+        self.assertEqual(rv.status_code, 201)
+        role = json.loads(rv.data)['data']
+        self.assertEqual((role['name'], role['description']), ('editor', 'the editors'))
+        self.assertEqual(rv.headers['Location'],
+                         'http://localhost/api/v1.0/roles/{}'.format(role['id']))
+        self.assertEqual(auth_datastore.read_role(role['id']).name, 'editor')
 
 
     def test_show_invalid_auth(self):
@@ -1,11 +1,96 @@
-"""performance tests"""
+# -*- coding: utf-8 -*-
 
+"""performance tests, run with `make test-perf`
+
+The reported results of the run are written to the PERF_RESULTS json file, if set, to be compared
+with a baseline results file by `make compare-perf`, see `tests.performance.compare`.
+"""
+
+import json
+import math
+import os
+import platform
+import timeit
 import unittest
 
 from nose.plugins.attrib import attr
 
 
+# the reported results of the run by name
+results = {}
+
+
+def teardown_package():
+    path = os.getenv('PERF_RESULTS')
+    if path and results:
+        with open(path, 'w') as result_file:
+            json.dump({'python': platform.python_version(), 'results': results}, result_file,
+                      indent=2, sort_keys=True)
+        print('{} results written to {}'.format(len(results), path))
+
+
+def percentile(samples, ratio):
+    """Get the nearest-rank percentile of the sorted samples"""
+    return samples[max(0, int(math.ceil(ratio * len(samples))) - 1)]
+
+
 @attr('perf')
 class PerformanceTestCase(unittest.TestCase):
-    """Base PerformanceTestCase"""
-    pass
+    """base PerformanceTestCase"""
+
+    repeat = 3
+    number = 10
+
+    def benchmark(self, func, number=None, repeat=None):
+        """Get the best time of a call of func in seconds
+
+        :param func the function to be benchmarked
+        :param number the optional number of calls per repeat
+        :param repeat the optional number of repeats
+        """
+        number = number or self.number
+        return min(timeit.repeat(func, number=number, repeat=repeat or self.repeat)) / number
+
+    def measure(self, func, number=None, warmup=None):
+        """Time each call of func to get the throughput and the latency percentiles
+
+        :param func the function to be measured
+        :param number the optional number of timed calls
+        :param warmup the optional number of untimed calls before, a tenth of number by default
+        :return the dict of the statistics, the durations in milliseconds
+        """
+        number = number or self.number
+        for _ in range(number // 10 if warmup is None else warmup):
+            func()
+
+        timer = timeit.default_timer
+        samples = []
+        started_at = timer()
+        for _ in range(number):
+            call_started_at = timer()
+            func()
+            samples.append(timer() - call_started_at)
+        total = timer() - started_at
+
+        samples.sort()
+        return {
+            'count': number,
+            'throughput': number / total,
+            'mean_ms': sum(samples) * 1000 / number,
+            'p50_ms': percentile(samples, 0.5) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000,
+            'max_ms': samples[-1] * 1000
+        }
+
+    @classmethod
+    def report(cls, name, seconds):
+        """Print and record the benchmark result"""
+        print('{}: {:.3f} ms'.format(name, seconds * 1000))
+        results['{}: {}'.format(cls.__name__, name)] = {'mean_ms': seconds * 1000}
+
+    @classmethod
+    def report_stats(cls, name, stats):
+        """Print and record the statistics of `measure`"""
+        print('{}: {:.0f}/s, p50 {:.3f} ms, p99 {:.3f} ms'.format(
+            name, stats['throughput'], stats['p50_ms'], stats['p99_ms']))
+        results['{}: {}'.format(cls.__name__, name)] = stats
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""compare the results of a performance run with a baseline run, for example:
+
+$ python -m tests.performance.compare perf-baseline.json perf-results.json --tolerance 0.2
+
+The results are compared by their p50, or their mean for the `benchmark` results. The results
+slower than the baseline by more than the tolerance ratio are regressions, the exit status is 1
+if any.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path) as result_file:
+        return json.load(result_file)['results']
+
+
+def get_latency(result):
+    return result.get('p50_ms', result.get('mean_ms'))
+
+
+def compare(baseline, results, tolerance):
+    """Compare the results with the baseline
+
+    :param baseline the baseline results by name
+    :param results the results by name
+    :param tolerance the ratio of slowdown tolerated
+    :return the list of the (name, baseline ms, ms, ratio) of the regressions
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            print('{}: new'.format(name))
+            continue
+        before, after = get_latency(baseline[name]), get_latency(results[name])
+        ratio = after / before if before else 1.0
+        regressed = ratio > 1 + tolerance
+        print('{}: {:.3f} ms -> {:.3f} ms ({:+.1f}%){}'.format(
+            name, before, after, (ratio - 1) * 100, ' REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append((name, before, after, ratio))
+    for name in sorted(set(baseline) - set(results)):
+        print('{}: missing'.format(name))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='compare performance results with a baseline')
+    arg_parser.add_argument('baseline', help='the baseline results json file')
+    arg_parser.add_argument('results', help='the results json file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='the ratio of slowdown tolerated, 0.2 by default')
+    args = arg_parser.parse_args(argv)
+
+    regressions = compare(load_results(args.baseline), load_results(args.results),
+                          args.tolerance)
+    print('{} regressions'.format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""benchmark of the api requests at several dataset sizes
+
+The app is created by the test config against the PERF_DATABASE_URL database (in memory SQLite
+by default), it is seeded by `db.factories` for each of the PERF_SIZES sizes: as many users and
+roles, in the recreated tables. The throughput and the latency percentiles of the requests
+are reported per size.
+"""
+
+from itertools import count, cycle
+import json
+import logging
+import os
+
+from tests.performance import PerformanceTestCase
+
+
+class ApiTestCase(PerformanceTestCase):
+
+    sizes = [int(size) for size in os.getenv('PERF_SIZES', '100,1000,10000').split(',')]
+    number = 200
+
+    @classmethod
+    def setUpClass(cls):
+        from app import create_app
+
+        cls.app = create_app('test')
+        cls.app.config.update(SQLALCHEMY_DATABASE_URI=os.getenv('PERF_DATABASE_URL', 'sqlite://'),
+                              # int seconds are expected by jwt_make_payload
+                              JWT_LEEWAY=0)
+        # encoded as in production, without the indent of the debug mode
+        cls.app.debug = False
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        cls.client = cls.app.test_client()
+        # the seeding is not logged item by item
+        logging.getLogger('factory').setLevel(logging.INFO)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def seed(self, size):
+        from flask_security.utils import encrypt_password
+
+        from app.auth.models import Role
+        from app.extensions import db
+        from db.factories import RoleFactory, UserFactory
+
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        admin_role = Role.query.filter_by(name='admin').first()
+        UserFactory(email='admin@example.com', password=encrypt_password('123456'),
+                    roles=[admin_role])
+        roles = RoleFactory.create_batch(size)
+        UserFactory.create_batch(size, roles=roles[:2])
+        db.session.commit()
+        db.session.remove()
+
+    def request(self, method, url, status_code=200, headers=None, **kwargs):
+        """Make the function requesting the url and checking the status code of the response"""
+        headers = dict(self.headers, **(headers or {}))
+        send = getattr(self.client, method)
+
+        def request_url():
+            rv = send(url() if callable(url) else url, headers=headers, **kwargs)
+            self.assertEqual(rv.status_code, status_code, rv.data)
+            return rv
+
+        return request_url
+
+    def login(self):
+        self.headers = {}
+        rv = self.request('post', '/api/v1.0/token', data={'email': 'admin@example.com',
+                                                           'password': '123456'})()
+        self.headers = {'Authorization': 'JWT ' + json.loads(rv.data)['token']}
+
+    def measure_requests(self, name, size, func, number=None, warmup=None):
+        self.report_stats('{}, {} items'.format(name, size), self.measure(func, number, warmup))
+
+    def test_token(self):
+        for size in self.sizes:
+            self.seed(size)
+            self.login()
+            self.measure_requests('POST /api/v1.0/token', size, self.request(
+                'post', '/api/v1.0/token', data={'email': 'admin@example.com',
+                                                 'password': '123456'}))
+            self.measure_requests('GET /api/v1.0/token/show', size,
+                                  self.request('get', '/api/v1.0/token/show'))
+
+    def test_users(self):
+        from app.auth.models import User
+
+        for size in self.sizes:
+            self.seed(size)
+            self.login()
+            user_ids = cycle([user_id for user_id, in User.query.with_entities(User.id)])
+            self.measure_requests('GET /api/v1.0/users', size,
+                                  self.request('get', '/api/v1.0/users'))
+            self.measure_requests('GET /api/v1.0/users/<id>', size, self.request(
+                'get', lambda: '/api/v1.0/users/{}'.format(next(user_ids))))
+
+    def test_roles(self):
+        for size in self.sizes:
+            self.seed(size)
+            self.login()
+            names = count()
+            role_ids = []
+
+            def create_role():
+                name = 'bench{}'.format(next(names))
+                rv = self.request('post', '/api/v1.0/roles', 201,
+                                  data={'name': name, 'description': name})()
+                role_ids.append(json.loads(rv.data)['data']['id'])
+
+            # as many roles are created as deleted
+            warmup = self.number // 10
+            self.measure_requests('POST /api/v1.0/roles', size, create_role, warmup=warmup)
+            read_ids, update_ids, delete_ids = cycle(role_ids), cycle(role_ids), iter(role_ids)
+            self.measure_requests('GET /api/v1.0/roles', size,
+                                  self.request('get', '/api/v1.0/roles'))
+            self.measure_requests('GET /api/v1.0/roles/<id>', size, self.request(
+                'get', lambda: '/api/v1.0/roles/{}'.format(next(read_ids))))
+            self.measure_requests('PUT /api/v1.0/roles/<id>', size, self.request(
+                'put', lambda: '/api/v1.0/roles/{}'.format(next(update_ids)),
+                data={'description': 'updated'}))
+            self.measure_requests('DELETE /api/v1.0/roles/<id>', size, self.request(
+                'delete', lambda: '/api/v1.0/roles/{}'.format(next(delete_ids))), warmup=warmup)
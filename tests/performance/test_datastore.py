@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""benchmark of the list queries of app.datastore on a large user table
+
+The users are inserted into the PERF_DATABASE_URL database (in memory SQLite by default), up to
+PERF_USERS rows (10000 by default), the rows of a database file are kept for the next runs. Opt in
+to a large table with a throwaway database, for example:
+
+    PERF_DATABASE_URL=sqlite:////tmp/perf.db PERF_USERS=1000000 make test-perf
+
+The query plans and the latencies are reported before and after dropping the `from_self()`
+subquery of find_by_model_name.
+"""
+
+from datetime import datetime, timedelta
+import os
+
+from sqlalchemy import desc
+
+from tests.performance import PerformanceTestCase
+
+
+class FindUsersTestCase(PerformanceTestCase):
+
+    rows = int(os.getenv('PERF_USERS', 10000))
+    chunk_size = 10000
+    repeat = 3
+    number = 5
+
+    @classmethod
+    def setUpClass(cls):
+        from app import create_app
+        from app.extensions import db
+        from app.auth.models import User
+
+        cls.app = create_app('test')
+        cls.app.config.update(SQLALCHEMY_DATABASE_URI=os.getenv('PERF_DATABASE_URL', 'sqlite://'))
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+        count = User.query.count()
+        started_at = datetime(2016, 1, 1)
+        for offset in range(count, cls.rows, cls.chunk_size):
+            db.session.execute(User.__table__.insert(), [
+                {'email': 'user{}@example.com'.format(idx), 'password': 'password',
+                 'active': idx % 10 != 0, 'created_at': started_at + timedelta(seconds=idx),
+                 'updated_at': started_at + timedelta(seconds=idx)}
+                for idx in range(offset, min(offset + cls.chunk_size, cls.rows))])
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        from app.extensions import db
+
+        db.session.remove()
+        cls.app_context.pop()
+
+    @staticmethod
+    def find_users_from_self(sort, offset, limit, **kwargs):
+        """The list query wrapped in the `from_self()` subquery, as before"""
+        from app.auth.models import User
+        from app.extensions import auth_datastore
+
+        query = User.query.from_self().options(*auth_datastore.get_load_options('user'))
+        query = query.filter_by(**kwargs)
+        if sort == '-created_at':
+            query = query.order_by(desc(User.created_at))
+        return query.offset(offset).limit(limit)
+
+    @staticmethod
+    def explain(query):
+        from app.extensions import db
+
+        dialect = db.engine.dialect
+        compiled = query.statement.compile(dialect=dialect)
+        params = compiled.params
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+        return [' | '.join(str(value) for value in row)
+                for row in db.engine.execute(prefix + unicode(compiled), params)]
+
+    def benchmark_queries(self, name, before, after):
+        for label, query in (('before', before), ('after', after)):
+            print('{} ({}):'.format(name, label))
+            for line in self.explain(query):
+                print('    ' + line)
+            self.report('    page', self.benchmark(lambda: query.all()))
+
+            count_query = query.offset(None).limit(None)
+            if label == 'after':
+                count_query = count_query.order_by(None)  # as counted by OffsetPagination
+            self.report('    count', self.benchmark(lambda: count_query.count(), number=1))
+
+    def test_sort_created_at(self):
+        from app.extensions import auth_datastore
+
+        args = {'sort': '-created_at', 'offset': 1000, 'limit': 25}
+        self.benchmark_queries('sort=-created_at', self.find_users_from_self(**args),
+                               auth_datastore.find_users(**args))
+
+    def test_filter_active(self):
+        from app.extensions import auth_datastore
+
+        args = {'sort': '-created_at', 'offset': 0, 'limit': 25, 'active': False}
+        self.benchmark_queries('active=false&sort=-created_at', self.find_users_from_self(**args),
+                               auth_datastore.find_users(**args))
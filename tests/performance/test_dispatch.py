@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""benchmark of the dispatch overhead of the policy decorators compiled by app.policies"""
+
+from flask import Flask
+from flask_classy import FlaskView, route
+
+from tests.performance import PerformanceTestCase
+
+
+class DispatchTestCase(PerformanceTestCase):
+
+    number = 10000
+
+    @staticmethod
+    def make_resource(base):
+        """Makes a resource of a view with as many policies as the user list endpoint, the policies
+        do nothing to measure the dispatch only"""
+        from app.policies import guard, parser, processor
+
+        class DispatchResource(base):
+            trailing_slash = False
+            decorators = [guard('auth', lambda *args, **kwargs: None)]
+
+            @route('', methods=['GET'])
+            @guard('permission', lambda *args, **kwargs: None)
+            @processor('marshal', lambda result: result)
+            @processor('paginate', lambda result: result)
+            @parser('args', lambda args, kwargs: (args + ({},), kwargs))
+            def list(self, args):
+                return {'data': []}
+
+        return DispatchResource
+
+    def test_compile_view(self):
+        from app.policies import compile_view
+
+        view = self.make_resource(object)().list
+        for decorator in self.make_resource(object).decorators:
+            view = decorator(view)
+        compiled = compile_view(view)
+        self.assertEqual(compiled.stages, ['auth', 'permission', 'args', 'call', 'paginate',
+                                           'marshal'])
+        self.assertEqual(compiled(), view())
+
+        nested = self.benchmark(view)
+        flat = self.benchmark(compiled)
+        self.report('nested decorators', nested)
+        self.report('compiled dispatch', flat)
+
+    def test_proxy(self):
+        from app.api import Resource
+
+        def make_client(base):
+            app = Flask(__name__)
+            resource = self.make_resource(base)
+            resource.representations = Resource.representations
+            resource.register(app, route_base='/dispatch')
+            return app.test_client()
+
+        for name, base in (('flask-classy', FlaskView), ('resource', Resource)):
+            client = make_client(base)
+            self.assertEqual(client.get('/dispatch').status_code, 200)
+            self.report('{} request'.format(name),
+                        self.benchmark(lambda: client.get('/dispatch'), number=1000))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""benchmark of the json encoder backends of app.api.representations.json"""
+
+from datetime import datetime
+import json
+
+from tests.performance import PerformanceTestCase
+
+
+class Role(object):
+
+    def __init__(self, idx):
+        self.id = idx
+        self.name = 'role{}'.format(idx)
+        self.description = 'role {} description'.format(idx)
+        self.created_at = self.updated_at = datetime(2016, 1, 1)
+
+
+class User(object):
+
+    def __init__(self, idx, roles):
+        self.id = idx
+        self.email = 'user{}@example.com'.format(idx)
+        self.active = True
+        self.confirmed_at = self.created_at = self.updated_at = datetime(2016, 1, 1)
+        self.roles = roles
+
+
+class JsonBackendsTestCase(PerformanceTestCase):
+
+    def setUp(self):
+        from app.api.representations.json import JSON_BACKENDS, get_dumps, json_default
+
+        self.backends = {}
+        for backend in sorted(JSON_BACKENDS):
+            try:
+                self.backends[backend] = get_dumps(backend)
+            except ImportError:
+                print('{} is not installed'.format(backend))
+        self.settings = {'separators': (',', ':'), 'default': json_default}
+
+    @staticmethod
+    def make_payload(size):
+        from app.api_1_0.schemas import UserListSchema
+
+        roles = [Role(1), Role(2)]
+        users = [User(idx, roles) for idx in range(size)]
+        paging = {'count': size, 'offset': 0, 'limit': size, 'previous': None, 'next': None}
+        return UserListSchema().dump({'data': users, 'paging': paging}).data
+
+    def benchmark_backends(self, size):
+        payload = self.make_payload(size)
+        expected = json.loads(json.dumps(payload))
+
+        # the stdlib C encoder is not used with sort_keys
+        for sort_keys in (False, True):
+            settings = dict(self.settings, sort_keys=sort_keys)
+            for backend, dumps in sorted(self.backends.items()):
+                self.assertEqual(json.loads(dumps(payload, **settings)), expected)
+                seconds = self.benchmark(lambda: dumps(payload, **settings))
+                self.report('{} UserListSchema items, {}, sort_keys={}'.format(size, backend,
+                                                                              sort_keys), seconds)
+
+    def test_user_list_25(self):
+        self.benchmark_backends(25)
+
+    def test_user_list_1000(self):
+        self.benchmark_backends(1000)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""microbenchmarks of the request args, fields and response helpers of app.api"""
+
+from tests.performance import PerformanceTestCase
+from tests.performance.test_json import Role, User
+
+
+class UtilsTestCase(PerformanceTestCase):
+
+    number = 2000
+    fields = 'id,email,roles[0:5]{id,name}'
+
+    @staticmethod
+    def make_page(size):
+        roles = [Role(1), Role(2)]
+        users = [User(idx, roles) for idx in range(size)]
+        return {'data': users,
+                'paging': {'count': size, 'offset': 0, 'limit': size, 'previous': None,
+                           'next': None}}
+
+    def test_extract_filters(self):
+        from app.api.utils import extract_filters
+
+        args = {'email__ct': 'example.com', 'id__in': '1,2,3', 'active__eq': '1',
+                'created_at__ge': '2016-01-01', 'sort': '-created_at', 'offset': 0, 'limit': 25}
+        filters, args = extract_filters(args)
+        self.assertEqual((len(filters), sorted(args)), (4, ['limit', 'offset', 'sort']))
+        self.report_stats('extract_filters, 4 filters',
+                          self.measure(lambda: extract_filters(args), self.number))
+
+    def test_fields_to_dict(self):
+        from app.api.schemas import FieldsParser, fields_to_dict
+
+        self.assertEqual(fields_to_dict(self.fields), FieldsParser(self.fields).parse().to_dict())
+        self.report_stats('fields_to_dict, memoized',
+                          self.measure(lambda: fields_to_dict(self.fields)))
+        self.report_stats('fields_to_dict, parsed',
+                          self.measure(lambda: FieldsParser(self.fields).parse().to_dict()))
+
+    def test_marshal(self):
+        from app.api.utils import marshal
+        from app.api_1_0.schemas import UserListSchema
+
+        schema = UserListSchema()
+        for size in (25, 1000):
+            page = self.make_page(size)
+            number = max(20, self.number // size)
+            self.report_stats('marshal UserListSchema, {} items'.format(size),
+                              self.measure(lambda: marshal(page, schema), number))
+            self.report_stats('marshal UserListSchema, {} items, fields={}'.format(
+                size, self.fields), self.measure(lambda: marshal(page, schema, fields=self.fields),
+                                                 number))
+
+    def test_output_json(self):
+        from app import create_app
+        from app.api.representations.json import output_json
+        from app.api_1_0.schemas import UserListSchema
+
+        app = create_app('test')
+        # encoded as in production, without the indent of the debug mode
+        app.debug = False
+        with app.test_request_context():
+            for size in (25, 1000):
+                data = UserListSchema().dump(self.make_page(size)).data
+                self.assertEqual(output_json(data, 200).status_code, 200)
+                self.report_stats('output_json UserListSchema, {} items'.format(size),
+                                  self.measure(lambda: output_json(data, 200),
+                                               max(20, self.number // size)))
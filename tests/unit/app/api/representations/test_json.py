@@ -1,3 +1,6 @@
+from datetime import datetime
+import json
+
 from mock import patch, MagicMock
 from nose.plugins.attrib import attr
 
@@ -11,7 +14,7 @@ class JsonTestCase(UnitTestCase):
     @patch('app.api.representations.json.make_response')
     def test_output_json(self, mock_make_response, mock_current_app):
         settings = {}
-        mock_current_app.config.get.return_value = settings
+        mock_current_app.config = {'RESTFUL_JSON': settings}
         mock_current_app.debug = False
 
         mock_output = MagicMock()
@@ -21,7 +24,8 @@ class JsonTestCase(UnitTestCase):
         from app.api.representations.json import output_json
 
         data = {
-            'hello': 'world'
+            'hello': 'world',
+            'created_at': datetime(2016, 1, 1, 10, 20, 30)
         }
         code = 200
         headers = {
@@ -35,14 +39,17 @@ class JsonTestCase(UnitTestCase):
 
         mock_output.headers.__setitem__.called_once_with('Content-Type', 'application/json')
         mock_output.headers.extend.assert_called_once_with(headers)
-        self.assertTrue(mock_make_response.call_count, 1)
-        mock_current_app.config.get.assert_called_once_with('RESTFUL_JSON', {})
+        dumped, code = mock_make_response.call_args[0]
+        self.assertEqual(json.loads(dumped), {'hello': 'world',
+                                              'created_at': '2016-01-01T10:20:30'})
+        self.assertNotIn(' ', dumped)
+        self.assertEqual(code, 200)
 
     @patch('app.api.representations.json.current_app')
     @patch('app.api.representations.json.make_response')
     def test_output_json_debug(self, mock_make_response, mock_current_app):
         settings = {}
-        mock_current_app.config.get.return_value = settings
+        mock_current_app.config = {'RESTFUL_JSON': settings, 'JSON_ENCODER': 'json'}
         mock_current_app.debug = True
 
         mock_output = MagicMock()
@@ -61,12 +68,54 @@ class JsonTestCase(UnitTestCase):
 
         output = output_json(data, code, headers)
 
-        self.assertEqual(settings.get('indent'), 4)
-        self.assertEqual(settings.get('sort_keys'), True)
+        # the config settings are never mutated
+        self.assertEqual(settings, {})
 
         self.assertEqual(output, mock_output)
 
         mock_output.headers.__setitem__.called_once_with('Content-Type', 'application/json')
         mock_output.headers.extend.assert_called_once_with(headers)
-        self.assertTrue(mock_make_response.call_count, 1)
-        mock_current_app.config.get.assert_called_once_with('RESTFUL_JSON', {})
+        mock_make_response.assert_called_once_with('{\n    "hello": "world"\n}\n', 200)
+
+    @patch('app.api.representations.json.current_app')
+    def test_output_json_stream(self, mock_current_app):
+        from flask import Flask
+        from app.api.representations.json import output_json
+        from app.api.streaming import JSONStream
+
+        mock_current_app.config = {}
+        mock_current_app.debug = False
+
+        stream = MagicMock(spec=JSONStream)
+        stream.iter_encode.return_value = iter(['{"data":[', '1,2', ']', '}', '\n'])
+
+        with Flask(__name__).test_request_context():
+            resp = output_json(stream, 200, {'X-APPLICATION': 'Flask'})
+
+            self.assertTrue(resp.is_streamed)
+            self.assertEqual(resp.headers['Content-Type'], 'application/json; charset=utf-8')
+            self.assertEqual(resp.headers['X-APPLICATION'], 'Flask')
+            self.assertEqual(resp.get_data(), '{"data":[1,2]}\n')
+
+    def test_get_dumps(self):
+        from app.api.representations.json import get_dumps
+
+        self.assertIs(get_dumps('json'), json.dumps)
+        self.assertIs(get_dumps('auto'), json.dumps)
+
+        with patch.dict('app.api.representations.json._dumps_functions', clear=True), \
+                patch.dict('app.api.representations.json.JSON_BACKENDS',
+                           {'simplejson': MagicMock(side_effect=ImportError)}):
+            self.assertIs(get_dumps('auto', sort_keys=True), json.dumps)
+
+        with self.assertRaises(ValueError) as ve:
+            get_dumps('unknown')
+        self.assertEqual(ve.exception.message, 'Invalid json encoder: unknown')
+
+    def test_json_default(self):
+        from app.api.representations.json import json_default
+
+        self.assertEqual(json_default(datetime(2016, 1, 1)), '2016-01-01T00:00:00')
+
+        with self.assertRaises(TypeError):
+            json_default(object())
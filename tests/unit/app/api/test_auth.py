@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 """tests for app.api.auth"""
-from mock import patch, call
+from mock import MagicMock, patch, call
 
 from tests.unit import UnitTestCase
 from app.api.auth import (token_authenticated, http_authenticated, session_authenticated,
@@ -27,20 +27,43 @@ class AuthTestCase(UnitTestCase):
         self.assertTrue(verify_token_auth('test'), 'verify_token_auth() should be True')
         mock_jwt_required.assert_called_once_with('test')
 
-    @patch('app.api.auth._check_http_auth')
-    def test_verify_http_auth(self, mock_check_http_auth):
+    @patch('app.api.auth.change_identity')
+    @patch('app.api.auth._request_ctx_stack')
+    @patch('app.api.auth.password_verifier')
+    @patch('app.api.auth.auth_datastore')
+    @patch('app.api.auth.request')
+    def test_verify_http_auth(self, mock_request, mock_datastore, mock_password_verifier,
+                              mock_request_ctx_stack, mock_change_identity):
         from app.api.auth import verify_http_auth
 
-        mock_check_http_auth.return_value = True
+        mock_request.authorization = None
+        self.assertFalse(verify_http_auth(), 'verify_http_auth() should be False')
+        self.assertFalse(mock_datastore.find_users.called)
+
+        mock_request.authorization = MagicMock(username='email', password='password')
+        mock_password_verifier.verify.return_value = False
+
+        self.assertFalse(verify_http_auth(), 'verify_http_auth() should be False')
+        mock_datastore.find_users.assert_called_once_with(email='email')
+        user = mock_datastore.find_users.return_value.first.return_value
+        mock_password_verifier.verify.assert_called_once_with('password', user)
+        self.assertFalse(mock_change_identity.called)
+
+        mock_password_verifier.verify.return_value = True
+
+        mock_datastore.db.session.is_modified.return_value = False
 
         self.assertTrue(verify_http_auth(), 'verify_http_auth() should be True')
-        mock_check_http_auth.assert_called_once_with()
+        self.assertFalse(mock_datastore.commit.called)
+        self.assertEqual(mock_request_ctx_stack.top.user, user)
+        mock_change_identity.assert_called_once_with(user)
 
-        mock_check_http_auth.reset_mock()
-        mock_check_http_auth.return_value = False
+        # the updated password hash is committed
+        mock_datastore.db.session.is_modified.return_value = True
 
-        self.assertFalse(verify_http_auth(), 'verify_http_auth() should be False')
-        mock_check_http_auth.assert_called_once_with()
+        self.assertTrue(verify_http_auth(), 'verify_http_auth() should be True')
+        mock_datastore.db.session.is_modified.assert_called_with(user)
+        mock_datastore.commit.assert_called_once_with()
 
     @patch('app.api.auth.verify_token_auth')
     @patch('app.api.auth.g')
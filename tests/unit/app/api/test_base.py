@@ -20,39 +20,40 @@ class BaseTestCase(CurrentAppMockMixin, UnitTestCase):
         self.assertIsNone(user)
         mock_datastore.find_users.assert_called_once_with(email='email')
 
-    @patch('app.api.base.utils')
+    @patch('app.api.base.password_verifier')
     @patch('app.api.base.auth_datastore')
-    def test_jwt_authenticate_not_verified(self, mock_datastore, mock_utils):
+    def test_jwt_authenticate_not_verified(self, mock_datastore, mock_password_verifier):
         from app.api.base import jwt_authenticate
 
         mock_datastore.find_users.return_value.first.return_value = 'user'
-        mock_utils.verify_and_update_password.return_value = False
+        mock_password_verifier.verify.return_value = False
 
         user = jwt_authenticate('email', 'password')
 
         self.assertIsNone(user)
         mock_datastore.find_users.assert_called_once_with(email='email')
-        mock_utils.verify_and_update_password.assert_called_once_with('password', 'user')
+        mock_password_verifier.verify.assert_called_once_with('password', 'user')
 
-    @patch('app.api.base.utils')
+    @patch('app.api.base.password_verifier')
     @patch('app.api.base.auth_datastore')
-    def test_jwt_authenticate_verified(self, mock_datastore, mock_utils):
+    def test_jwt_authenticate_verified(self, mock_datastore, mock_password_verifier):
         from app.api.base import jwt_authenticate
 
         mock_datastore.find_users.return_value.first.return_value = 'found'
-        mock_utils.verify_and_update_password.return_value = True
+        mock_password_verifier.verify.return_value = True
 
         user = jwt_authenticate('email', 'password')
 
         self.assertEqual(user, 'found')
         mock_datastore.find_users.assert_called_once_with(email='email')
-        mock_utils.verify_and_update_password.assert_called_once_with('password', 'found')
+        mock_password_verifier.verify.assert_called_once_with('password', 'found')
 
     @patch('app.api.base.safe_str_cmp')
     @patch('app.api.base.auth_datastore')
     def test_jwt_load_user_anonymous(self, mock_datastore, mock_safe_str_cmp):
         from app.api.base import jwt_load_user, md5, AnonymousUser
 
+        mock_datastore.get_cached_user.return_value = None
         mock_datastore.read_user.return_value = None
 
         payload = {
@@ -63,8 +64,10 @@ class BaseTestCase(CurrentAppMockMixin, UnitTestCase):
         user = jwt_load_user(payload)
 
         self.assertTrue(isinstance(user, AnonymousUser))
+        mock_datastore.get_cached_user.assert_called_once_with(payload['sub'], payload['pwd'])
         mock_datastore.read_user.assert_called_once_with(payload['sub'])
         mock_safe_str_cmp.assert_not_called()
+        self.assertFalse(mock_datastore.cache_user.called)
 
     @patch('app.api.base.auth_datastore')
     def test_jwt_load_user_verified(self, mock_datastore):
@@ -72,6 +75,7 @@ class BaseTestCase(CurrentAppMockMixin, UnitTestCase):
         from app.auth.models import User
 
         returned_user = User(password='password')
+        mock_datastore.get_cached_user.return_value = None
         mock_datastore.read_user.return_value = returned_user
 
         payload = {
@@ -83,6 +87,47 @@ class BaseTestCase(CurrentAppMockMixin, UnitTestCase):
 
         self.assertEqual(user, returned_user)
         mock_datastore.read_user.assert_called_once_with(payload['sub'])
+        mock_datastore.cache_user.assert_called_once_with(returned_user)
+
+    @patch('app.api.base.auth_datastore')
+    def test_jwt_load_user_cached(self, mock_datastore):
+        from app.api.base import jwt_load_user, md5
+
+        mock_datastore.get_cached_user.return_value = 'cached'
+
+        payload = {
+            'sub': 1,
+            'pwd': md5('password')
+        }
+
+        user = jwt_load_user(payload)
+
+        self.assertEqual(user, 'cached')
+        mock_datastore.get_cached_user.assert_called_once_with(payload['sub'], payload['pwd'])
+        self.assertFalse(mock_datastore.read_user.called)
+        self.assertFalse(mock_datastore.cache_user.called)
+
+    @patch('app.api.base.token_revocations', new=[2])
+    @patch('app.api.base.auth_datastore')
+    def test_jwt_load_user_stateless(self, mock_datastore):
+        from app.api.base import jwt_load_user, md5
+        from app.auth.tokens import TokenUser
+
+        self.base_mock_current_app.config['JWT_STATELESS'] = True
+        mock_datastore.get_cached_user.return_value = 'cached'
+
+        user = jwt_load_user({'sub': 1, 'pwd': md5('password'), 'roles': ['user']})
+
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.id, 1)
+        self.assertTrue(user.has_role('user'))
+        self.assertFalse(user.has_role('admin'))
+        self.assertFalse(mock_datastore.get_cached_user.called)
+
+        # the revoked users and the stateful tokens are loaded
+        for payload in ({'sub': 2, 'pwd': md5('password'), 'roles': ['user']},
+                        {'sub': 1, 'pwd': md5('password')}):
+            self.assertEqual(jwt_load_user(payload), 'cached')
 
     def test_jwt_make_payload_default(self):
         from app.api.base import jwt_make_payload, md5, current_app, timedelta
@@ -114,6 +159,18 @@ class BaseTestCase(CurrentAppMockMixin, UnitTestCase):
         self.assertIsNotNone(payload['iat'])
         expected_exp = payload['iat'] + expiration_delta + timedelta(seconds=leeway)
         self.assertEqual(payload['exp'], expected_exp)
+        self.assertNotIn('roles', payload)
+
+    def test_jwt_make_payload_stateless(self):
+        from app.api.base import jwt_make_payload
+        from app.auth.models import Role, User
+
+        self.base_mock_current_app.config['JWT_STATELESS'] = True
+        user = User(id=1, password='pwd', roles=[Role(name='admin')])
+
+        payload = jwt_make_payload(user)
+
+        self.assertEqual(payload['roles'], ['admin'])
 
     @patch('app.api.base.jwt_lib')
     def test_jwt_encode_payload(self, mock_jwt_lib):
@@ -178,6 +235,84 @@ class ResourceTestCase(CurrentAppMockMixin, UnitTestCase):
     def test_something(self):
         pass
 
+    def test_build_rule_custom_method(self):
+        from app.api.base import Resource
+
+        class ItemResource(Resource):
+            pass
+
+        self.assertEqual(ItemResource.build_rule(':batch'), '/items:batch')
+        self.assertEqual(ItemResource.build_rule('export'), '/items/export')
+
+    def test_make_proxy_method(self):
+        import json
+        from flask import Flask, request
+        from app.api.base import Resource
+        from app.policies import guard, processor
+
+        class ItemResource(Resource):
+            decorators = [guard('auth', lambda *args, **kwargs: None)]
+
+            @processor('marshal', lambda result: {'data': result})
+            def read(self, id):
+                return {'id': id}
+
+            def after_read(self, response):
+                response.headers['X-After'] = 'read'
+                return response
+
+        with Flask(__name__).test_request_context('/items/1'):
+            request.view_args = {'id': 1}
+            proxy = ItemResource.make_proxy_method('read')
+            # the class decorators are compiled with the ones of the method
+            self.assertEqual(proxy.stages, ['auth', 'call', 'marshal'])
+
+            response = proxy(id=1)
+            self.assertEqual(json.loads(response.data), {'data': {'id': 1}})
+            self.assertEqual(response.headers['X-After'], 'read')
+
+    def test_unpack(self):
+        from app.api.base import unpack
+
+        self.assertEqual(unpack({'id': 1}), ({'id': 1}, 200, {}))
+        self.assertEqual(unpack(({'id': 1},)), ({'id': 1}, 200, {}))
+        self.assertEqual(unpack(({'id': 1}, 201)), ({'id': 1}, 201, {}))
+        self.assertEqual(unpack(({'id': 1}, 201, {'Location': '/items/1'})),
+                         ({'id': 1}, 201, {'Location': '/items/1'}))
+
+    def test_make_proxy_method_representations(self):
+        import json
+        from flask import Flask, make_response, request
+        from app.api.base import Resource
+        from app.api.representations.json import output_json
+
+        class ItemResource(Resource):
+            representations = {
+                'application/json': output_json,
+                'text/plain': lambda data, code, headers: make_response(str(data['id']), code,
+                                                                        headers)
+            }
+
+            def create(self):
+                return {'id': 1}, 201
+
+            def update(self, id):
+                return {'id': id}, 200, {'X-Updated': str(id)}
+
+        app = Flask(__name__)
+        with app.test_request_context('/items', headers={'Accept': 'application/json'}):
+            request.view_args = {}
+            response = ItemResource.make_proxy_method('create')()
+            # the (data, code) tuple
+            self.assertEqual((response.status_code, json.loads(response.data)), (201, {'id': 1}))
+
+        with app.test_request_context('/items/2', headers={'Accept': 'text/plain'}):
+            request.view_args = {'id': 2}
+            response = ItemResource.make_proxy_method('update')(id=2)
+            # the best match of the accept header
+            self.assertEqual((response.status_code, response.data), (200, '2'))
+            self.assertEqual(response.headers['X-Updated'], '2')
+
 class TokenRequiredResourceTestCase(CurrentAppMockMixin, UnitTestCase):
     def test_class(self):
         from app.api.base import TokenRequiredResource, Resource
@@ -9,7 +9,7 @@ from app.api import (anonymous_required, token_auth_required, http_auth_required
                      session_auth_required, auth_required, roles_required, roles_accepted, one_of,
                      permissions_required, permissions_accepted)
 
-from app.exceptions import BadRequestException, UnauthorizedException
+from app.exceptions import ApplicationException, BadRequestException, UnauthorizedException
 
 
 class DecoratorsTestCase(UnitTestCase):
@@ -30,7 +30,8 @@ class DecoratorsTestCase(UnitTestCase):
     @patch('app.api.decorators.current_identity')
     @patch('app.api.decorators._jwt_required')
     def test_token_auth_required_unauthorized(self, mock_jwt_required, mock_current_identity):
-        mock_current_identity.is_authenticated.return_value = False
+        user = mock_current_identity._get_current_object.return_value
+        user.is_authenticated.return_value = False
 
         @token_auth_required('realm')
         def test():
@@ -42,17 +43,16 @@ class DecoratorsTestCase(UnitTestCase):
         self.assertIsInstance(ex, UnauthorizedException)
         self.assertTrue(ex.message, 'Invalid Token')
         mock_jwt_required.assert_called_once_with('realm')
-        mock_current_identity.is_authenticated.assert_called_once_with()
+        user.is_authenticated.assert_called_once_with()
 
-    @patch('app.api.decorators.identity_changed')
+    @patch('app.api.decorators.change_identity')
     @patch('app.api.decorators._request_ctx_stack')
-    @patch('app.api.decorators.current_app')
     @patch('app.api.decorators.current_identity')
     @patch('app.api.decorators._jwt_required')
     def test_token_auth_required_authorized(self, mock_jwt_required, mock_current_identity,
-                                            mock_current_app, mock_request_ctx_stack,
-                                            mock_identity_changed):
-        mock_current_identity.is_authenticated.return_value = True
+                                            mock_request_ctx_stack, mock_change_identity):
+        user = mock_current_identity._get_current_object.return_value
+        user.is_authenticated.return_value = True
 
         @token_auth_required('realm')
         def test():
@@ -62,10 +62,9 @@ class DecoratorsTestCase(UnitTestCase):
                          'test() should return {}'.format('token_auth_required'))
 
         mock_jwt_required.assert_called_once_with('realm')
-        mock_current_identity.is_authenticated.assert_called_once_with()
-        mock_current_app._get_current_object.assert_called_once_with()
-        self.assertEqual(mock_request_ctx_stack.top.user, mock_current_identity)
-        self.assertEqual(mock_identity_changed.send.call_count, 1)
+        user.is_authenticated.assert_called_once_with()
+        self.assertEqual(mock_request_ctx_stack.top.user, user)
+        mock_change_identity.assert_called_once_with(user)
 
     @patch('app.api.decorators.http_authenticated')
     def test_http_auth_required(self, mock_http_authenticated):
@@ -246,6 +245,41 @@ class DecoratorsTestCase(UnitTestCase):
 
         self.assertEqual(test5(), 'one_of', 'test5() should return {}'.format('one_of'))
 
+    def test_one_of_view_once(self):
+        from flask_jwt import JWTError
+
+        def failed_guard(func):
+            def decorated(*args, **kwargs):
+                raise JWTError('Authorization Required', 'token is invalid')
+            return decorated
+
+        passed_guard = Mock(side_effect=lambda func: func)
+        view = Mock(side_effect=ValueError('database error'))
+
+        @one_of(failed_guard, passed_guard, passed_guard)
+        def test(*args, **kwargs):
+            return view(*args, **kwargs)
+
+        # the exceptions of the view are not the ones of the guards, it is run once
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                test(1, key='value')
+        self.assertEqual(view.call_count, 2)
+        view.assert_called_with(1, key='value')
+        # the guards are applied once
+        self.assertEqual(passed_guard.call_count, 1)
+
+        @one_of(failed_guard, failed_guard)
+        def test_failed():
+            return view()
+
+        # the status code of the last failed guard is kept
+        view.reset_mock()
+        with self.assertRaises(ApplicationException) as ae:
+            test_failed()
+        self.assertEqual(ae.exception.status_code, 401)
+        self.assertFalse(view.called)
+
     @patch('app.api.decorators.OffsetPagination')
     def test_paginated_one(self, mock_offset_pagination):
         from app.api.decorators import paginated
@@ -290,10 +324,13 @@ class DecoratorsTestCase(UnitTestCase):
 
         pagination.data = ['hi', 'there']
         pagination.count = 7
+        pagination.count_mode = 'exact'
         pagination.offset = 0
         pagination.limit = 2
         pagination.prev_url = None
         pagination.next_url = 'next_url'
+        pagination.before = 'before_cursor'
+        pagination.after = 'after_cursor'
 
         mock_query = MagicMock()
         mock_args = MagicMock()
@@ -301,7 +338,9 @@ class DecoratorsTestCase(UnitTestCase):
         mock_args.get.side_effect = [
             None,
             0,
-            2
+            2,
+            '-name',
+            'exact'
         ]
 
         @paginated
@@ -314,19 +353,238 @@ class DecoratorsTestCase(UnitTestCase):
             'data': ['hi', 'there'],
             'paging': {
                 'count': 7,
+                'count_mode': 'exact',
                 'offset': 0,
                 'limit': 2,
+                'cursors': {
+                    'before': 'before_cursor',
+                    'after': 'after_cursor'
+                },
                 'previous': None,
                 'next': 'next_url'
             }
         }
 
-        mock_offset_pagination.assert_called_once_with(mock_query, offset=0, limit=2)
+        mock_offset_pagination.assert_called_once_with(mock_query, offset=0, limit=2, sort='-name',
+                                                       count_mode='exact', stream=True)
         mock_args.get.assert_has_calls([call('one', False),
                                         call('offset', None),
-                                        call('limit', None)])
+                                        call('limit', None),
+                                        call('sort', None),
+                                        call('count', None)])
         self.assertEqual(result, expected_result)
 
+    @patch('app.api.decorators.OffsetPagination')
+    def test_paginated_many_without_count(self, mock_offset_pagination):
+        from app.api.decorators import paginated
+
+        pagination = MagicMock()
+        mock_offset_pagination.return_value = pagination
+        pagination.count = None
+        pagination.count_mode = 'none'
+
+        @paginated
+        def test():
+            return MagicMock(), {'count': 'none'}
+
+        result = test()
+
+        self.assertNotIn('count', result['paging'])
+        self.assertEqual(result['paging']['count_mode'], 'none')
+
+    @patch('app.api.decorators.OffsetPagination')
+    def test_paginated_many_lazy(self, mock_offset_pagination):
+        from app.api.decorators import paginated
+        from app.pagination import LazyData
+
+        pagination = MagicMock()
+        mock_offset_pagination.return_value = pagination
+        pagination.data = LazyData(MagicMock(), 0, 500)
+        pagination.count = 7
+
+        @paginated
+        def test():
+            return MagicMock(), {}
+
+        result = test()
+
+        self.assertIs(result['data'], pagination.data)
+        # the paging is made once the data is streamed
+        self.assertTrue(callable(result['paging']))
+        pagination.count = 3
+        self.assertEqual(result['paging']()['count'], 3)
+
+    @patch('app.api.decorators.current_app')
+    def test_batched(self, mock_current_app):
+        from flask import Flask
+        from webargs import fields
+        from app.api.decorators import batched
+        from app.exceptions import NotFoundException
+
+        mock_current_app.config = {'BATCH_MAX_ITEMS': 5, 'BATCH_CHUNK_SIZE': 2}
+        mock_func = MagicMock(return_value=[1, None, False])
+
+        @batched({'name': fields.Str(required=True)}, status_code=201,
+                 error=lambda item: NotFoundException('Not Found'))
+        def test(resource, items, chunk_size):
+            return mock_func(items, chunk_size)
+
+        app = Flask(__name__)
+        with app.test_request_context(method='POST',
+                                      data='[{"name": "a"}, {}, 1, {"name": "b"}, {"name": "c"}]',
+                                      content_type='application/json'):
+            result = test(MagicMock())
+
+        mock_func.assert_called_once_with([{'name': 'a'}, {'name': 'b'}, {'name': 'c'}], 2)
+        self.assertEqual(result['data'][0], {'status': 201, 'id': 1})
+        # the conflicting items are conflicts by default
+        self.assertEqual([item['status'] for item in result['data']], [201, 400, 400, 404, 409])
+        self.assertEqual(result['data'][1]['error']['errors'],
+                         [{'name': ['Missing data for required field.']}])
+        self.assertNotIn('status_code', result['data'][3]['error'])
+
+        for data in ('{}', '[1, 2, 3, 4, 5, 6]'):
+            with app.test_request_context(method='POST', data=data,
+                                          content_type='application/json'):
+                with self.assertRaises(BadRequestException):
+                    test(MagicMock())
+
+        # the max number of items is read from another config
+        mock_current_app.config['BATCH_MAX_USERS'] = 1
+
+        @batched({'name': fields.Str(required=True)}, max_items='BATCH_MAX_USERS')
+        def test_users(resource, items, chunk_size):
+            return mock_func(items, chunk_size)
+
+        with app.test_request_context(method='POST', data='[{"name": "a"}, {"name": "b"}]',
+                                      content_type='application/json'):
+            with self.assertRaises(BadRequestException):
+                test_users(MagicMock())
+
+    @patch('app.api.decorators.iter_keyset')
+    @patch('app.api.decorators.current_app')
+    def test_exported(self, mock_current_app, mock_iter_keyset):
+        from flask import Flask
+        from app.api.decorators import exported
+        from app.api_1_0.schemas import RoleSchema
+
+        mock_current_app.config = {'EXPORT_WINDOW_SIZE': 2}
+        mock_query = MagicMock()
+        mock_iter_keyset.return_value = iter([{'id': 1, 'name': 'user'},
+                                              {'id': 2, 'name': 'admin'}])
+
+        @exported(RoleSchema())
+        def test():
+            return mock_query, {'format': 'csv', 'fields': {'name': {}}}
+
+        with Flask(__name__).test_request_context():
+            resp = test()
+
+            self.assertEqual(resp.headers['Content-Type'], 'text/csv; charset=utf-8')
+            self.assertEqual(resp.get_data(), 'name\r\nuser\r\nadmin\r\n')
+
+        mock_iter_keyset.assert_called_once_with(mock_query, 2)
+
+    @patch('app.api.decorators.OffsetPagination')
+    @patch('app.api.decorators.CursorPagination')
+    def test_paginated_cursor(self, mock_cursor_pagination, mock_offset_pagination):
+        from app.api.decorators import paginated
+
+        pagination = MagicMock()
+        mock_cursor_pagination.return_value = pagination
+
+        pagination.data = ['hi', 'there']
+        pagination.before = 'before_cursor'
+        pagination.after = 'after_cursor'
+        pagination.limit = 2
+        pagination.prev_url = None
+        pagination.next_url = 'next_url'
+
+        mock_query = MagicMock()
+        args = {
+            'after': 'cursor',
+            'limit': 2,
+            'sort': '-name'
+        }
+
+        @paginated
+        def test():
+            return mock_query, args
+
+        result = test()
+
+        expected_result = {
+            'data': ['hi', 'there'],
+            'paging': {
+                'cursors': {
+                    'before': 'before_cursor',
+                    'after': 'after_cursor'
+                },
+                'limit': 2,
+                'previous': None,
+                'next': 'next_url'
+            }
+        }
+
+        mock_cursor_pagination.assert_called_once_with(mock_query, before=None, after='cursor',
+                                                       limit=2, sort='-name')
+        self.assertFalse(mock_offset_pagination.called)
+        self.assertEqual(result, expected_result)
+
+    @patch('app.api.decorators.OffsetPagination')
+    @patch('app.api.decorators.TimePagination')
+    def test_paginated_time(self, mock_time_pagination, mock_offset_pagination):
+        from app.api.decorators import paginated
+
+        pagination = MagicMock()
+        mock_time_pagination.return_value = pagination
+
+        pagination.data = ['hi', 'there']
+        pagination.limit = 2
+        pagination.prev_url = 'prev_url'
+        pagination.next_url = None
+
+        mock_query = MagicMock()
+        args = {
+            'since': '1451606400',
+            'time_key': 'updated_at'
+        }
+
+        @paginated
+        def test():
+            return mock_query, args
+
+        result = test()
+
+        expected_result = {
+            'data': ['hi', 'there'],
+            'paging': {
+                'limit': 2,
+                'previous': 'prev_url',
+                'next': None
+            }
+        }
+
+        mock_time_pagination.assert_called_once_with(mock_query, since='1451606400', until=None,
+                                                     limit=None, time_key='updated_at',
+                                                     since_id=None, until_id=None)
+        self.assertFalse(mock_offset_pagination.called)
+        self.assertEqual(result, expected_result)
+
+    @patch('app.api.decorators.marshal')
+    def test_marshal_with_fields(self, mock_marshal):
+        from flask import Flask
+        from app.api.decorators import marshal_with
+
+        @marshal_with('schema')
+        def test():
+            return 'data'
+
+        with Flask(__name__).test_request_context('/?fields=id,email'):
+            self.assertEqual(test(), mock_marshal.return_value)
+
+        mock_marshal.assert_called_once_with('data', 'schema', None, 'id,email')
+
     @patch('app.api.decorators.marshal_with')
     def test_marshal_with_data_envelop(self, mock_marshal_with):
         from app.api.decorators import marshal_with_data_envelope
@@ -334,17 +592,15 @@ class DecoratorsTestCase(UnitTestCase):
         marshal_with_data_envelope({'hi': 'there'})
         mock_marshal_with.assert_called_once_with({'hi': 'there'}, envelope='data')
 
-    @patch('app.api.decorators.use_args')
-    def test_extract_args_class_method(self, mock_use_args):
+    @patch('app.api.decorators._args_parser')
+    def test_extract_args_class_method(self, mock_args_parser):
         from app.api.decorators import extract_args
 
         search_args = {
         }
 
-        def use_args(args):
-            return args
-
-        mock_use_args.return_value = use_args
+        # the args are not parsed from the request
+        mock_args_parser.return_value = lambda args, kwargs: (args, kwargs)
 
         # class method
         class Test(object):
@@ -420,17 +676,27 @@ class DecoratorsTestCase(UnitTestCase):
 
         self.assertEqual(result, expected_result)
 
-    @patch('app.api.decorators.use_args')
-    def test_extract_args_single_function(self, mock_use_args):
+        # contain fields
+        result = test.test({
+            'fields': 'id,roles{name}'
+        })
+
+        expected_result = {
+            'fields': {'id': {}, 'roles': {'name': {}}},
+            'filters': []
+        }
+
+        self.assertEqual(result, expected_result)
+
+    @patch('app.api.decorators._args_parser')
+    def test_extract_args_single_function(self, mock_args_parser):
         from app.api.decorators import extract_args
 
         search_args = {
         }
 
-        def use_args(args):
-            return args
-
-        mock_use_args.return_value = use_args
+        # the args are not parsed from the request
+        mock_args_parser.return_value = lambda args, kwargs: (args, kwargs)
 
         # function
         # @extract_args(search_args)
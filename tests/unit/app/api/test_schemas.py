@@ -343,3 +343,75 @@ class SchemasTestCase(UnitTestCase):
 
         self.assertEqual(result, json.dumps(desired_obj_list))
         self.assertEqual(type(result), str)
+
+    def test_dump_restricted(self):
+
+        class RoleSchema(Schema):
+            id = fields.Int()
+            name = fields.Str()
+
+        class UserSchema(Schema):
+            id = fields.Int()
+            email = fields.Email()
+            roles = fields.List(fields.Nested(RoleSchema))
+
+        class UserListSchema(Schema):
+            fields_scope = 'data'
+            data = fields.List(fields.Nested(UserSchema))
+            paging = fields.Dict()
+
+        class Role(object):
+            id = 1
+
+            @property
+            def name(self):
+                raise AssertionError('name is not selected')
+
+        class User(object):
+            id = 1
+            email = 'test@example.com'
+            roles = [Role()]
+
+        result, errors = UserSchema().dump(User(), fields='id,roles{id}')
+
+        self.assertEqual(result, {'id': 1, 'roles': [{'id': 1}]})
+
+        result, errors = UserListSchema().dump({'data': [User()], 'paging': {'limit': 1}},
+                                               fields='email')
+
+        self.assertEqual(result, {'data': [{'email': 'test@example.com'}], 'paging': {'limit': 1}})
+
+    def test_compile_fields(self):
+        from app.api.schemas import compile_fields, FieldSelector
+
+        self.assertFalse(compile_fields(None))
+        self.assertFalse(compile_fields(' '))
+
+        selector = compile_fields('id, roles[:1]{name}')
+
+        self.assertIsInstance(selector, FieldSelector)
+        self.assertIs(compile_fields('id, roles[:1]{name}'), selector)
+        self.assertEqual(selector.to_dict(), {
+            'id': {},
+            'roles': {'__slice': ':1', 'name': {}}
+        })
+
+        for fields in ('id,roles{name', 'id}', 'roles[0:a]', 'roles[0:1'):
+            with self.assertRaises(ValueError) as ve:
+                compile_fields(fields)
+            self.assertEqual(ve.exception.message, 'Invalid fields: {}'.format(fields))
+
+    def test_field_selector_filter_many(self):
+        from app.api.schemas import compile_fields
+
+        origin_list = [{
+            'id': 1,
+            'email': None,
+            'roles': [{'id': 1, 'name': 'user'}, {'id': 2, 'name': 'admin'}]
+        }, {
+            'id': 2
+        }]
+
+        result = compile_fields('id,email,roles{name}[1:]').filter_many(origin_list)
+
+        self.assertEqual(result, [{'id': 1, 'roles': [{'name': 'admin'}]}, {'id': 2}])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.api.streaming"""
+
+import json
+
+from mock import MagicMock
+
+from tests.unit import UnitTestCase
+from app.api_1_0.schemas import RoleListSchema, RoleSchema, UserSchema
+
+
+class JSONStreamTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.roles = [{'id': idx, 'name': 'role{}'.format(idx), 'description': 'desc'}
+                      for idx in range(1, 6)]
+
+    def test_iter_encode(self):
+        from app.api.streaming import JSONStream
+
+        paging = MagicMock(return_value={'count': 5, 'next': None})
+        stream = JSONStream({'data': iter(self.roles), 'paging': paging}, RoleListSchema(),
+                            buffer_size=2)
+
+        chunks = list(stream.iter_encode(json.dumps, separators=(',', ':')))
+
+        # the items are buffered by 2 and the paging is made after them
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(chunks[-1], '\n')
+        self.assertEqual(json.loads(''.join(chunks)),
+                         {'data': self.roles, 'paging': {'count': 5, 'next': None}})
+        paging.assert_called_once_with()
+
+    def test_iter_encode_fields(self):
+        from app.api.streaming import JSONStream
+
+        stream = JSONStream({'data': self.roles[:2]}, RoleListSchema(), fields='id,name')
+
+        self.assertEqual(''.join(stream.iter_encode(json.dumps)),
+                         '{"data":[{"id": 1, "name": "role1"},{"id": 2, "name": "role2"}]}\n')
+
+    def test_marshal(self):
+        from app.api.streaming import JSONStream
+        from app.api.utils import marshal
+        from app.pagination import LazyData
+
+        data = {'data': LazyData(MagicMock(), 0, 500), 'paging': {}}
+        result = marshal(data, RoleListSchema(), fields='id')
+
+        self.assertIsInstance(result, JSONStream)
+        self.assertEqual(result.stream_key, 'data')
+        self.assertIn('id', result.selector)
+
+        self.assertEqual(marshal({'data': []}, RoleListSchema()), {'data': []})
+
+
+class RowStreamTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.roles = [{'id': 1, 'name': u'r\xf4le', 'description': 'a, "b"'},
+                      {'id': 2, 'name': 'admin', 'description': None}]
+
+    def test_ndjson(self):
+        from app.api.streaming import NDJSONStream
+
+        stream = NDJSONStream(iter(self.roles), RoleSchema(), fields='id,name', buffer_size=1)
+        chunks = list(stream.iter_encode(json.dumps, sort_keys=True))
+
+        self.assertEqual(chunks, ['{"id": 1, "name": "r\\u00f4le"}\n',
+                                  '{"id": 2, "name": "admin"}\n'])
+
+    def test_csv(self):
+        from app.api.streaming import CSVStream
+
+        stream = CSVStream(self.roles, RoleSchema(), fields='description,id,name')
+
+        self.assertEqual(stream.columns, ['id', 'name', 'description'])
+        self.assertEqual(''.join(stream.iter_encode(json.dumps)),
+                         'id,name,description\r\n'
+                         '1,r\xc3\xb4le,"a, ""b"""\r\n'
+                         '2,admin,\r\n')
+
+        # the nested values are json encoded
+        stream = CSVStream([{'id': 1, 'roles': [{'id': 2, 'name': 'admin'}]}], UserSchema(),
+                           fields='id,roles{id}')
+        self.assertEqual(''.join(stream.iter_encode(json.dumps)),
+                         'id,roles\r\n1,"[{""id"": 2}]"\r\n')
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.auth.datastore"""
+
+from mock import patch, MagicMock
+
+from tests.unit import UnitTestCase
+from app.cache import LRUCache
+
+
+class SQLAlchemyAuthDatastoreTestCase(UnitTestCase):
+
+    def setUp(self):
+        from app.extensions import db
+        from app.auth.datastore import SQLAlchemyAuthDatastore
+
+        self.identity_cache = LRUCache(ttl=60)
+        self.datastore = SQLAlchemyAuthDatastore(db, identity_cache=self.identity_cache)
+        self.datastore.db = MagicMock()
+        self.datastore.db.session.info = {}
+
+    def commit(self):
+        from app.datastore import _run_after_commit
+
+        _run_after_commit(self.datastore.db.session)
+
+    def test_cache_user(self):
+        from app.auth.models import User, Role
+        from app.api.base import md5
+
+        from app.auth.tokens import TokenUser
+
+        user = User(id=1, password='password', active=False, roles=[Role(id=1, name='user')])
+        self.datastore.cache_user(user)
+
+        # plain data is cached, the hash is not
+        self.assertEqual(self.identity_cache.get('user:1'), {
+            'sub': 1, 'pwd': md5('password'), 'active': False, 'roles': ['user']})
+
+        cached_user = self.datastore.get_cached_user(1, md5('password'))
+
+        self.assertIsInstance(cached_user, TokenUser)
+        self.assertEqual(cached_user.id, 1)
+        self.assertFalse(cached_user.is_active())
+        self.assertTrue(cached_user.has_role('user'))
+        self.assertFalse(self.datastore.db.session.merge.called)
+
+    def test_get_cached_user_not_matched(self):
+        from app.auth.models import User
+        from app.api.base import md5
+
+        self.assertIsNone(self.datastore.get_cached_user(1, md5('password')))
+
+        self.datastore.cache_user(User(id=1, password='password'))
+
+        self.assertIsNone(self.datastore.get_cached_user(1, md5('changed')))
+
+    @patch('app.auth.datastore.SQLAlchemyDatastore.delete_by_model_name')
+    @patch('app.auth.datastore.SQLAlchemyDatastore.update_by_model_name')
+    def test_invalidation(self, mock_update_by_model_name, mock_delete_by_model_name):
+        from app.auth.models import User
+        from app.api.base import md5
+
+        self.datastore.cache_user(User(id=1, password='password'))
+        self.datastore.update_user(1, active=False)
+        mock_update_by_model_name.assert_called_once_with('user', 1, ('email', 'active'),
+                                                          active=False)
+
+        # cached again by a concurrent request before the commit
+        self.datastore.cache_user(User(id=1, password='password'))
+        self.commit()
+        self.assertIsNone(self.datastore.get_cached_user(1, md5('password')))
+
+        self.datastore.cache_user(User(id=1, password='password'))
+        self.datastore.delete_user(1)
+        self.commit()
+
+        self.assertIsNone(self.datastore.get_cached_user(1, md5('password')))
+        mock_delete_by_model_name.assert_called_once_with('user', 1)
+
+        # not uncached by a rolled back transaction
+        from app.datastore import _discard_after_commit
+
+        self.datastore.cache_user(User(id=1, password='password'))
+        self.datastore.delete_user(1)
+        _discard_after_commit(self.datastore.db.session)
+        self.commit()
+        self.assertIsNotNone(self.datastore.get_cached_user(1, md5('password')))
+
+    @patch('app.auth.datastore.SQLAlchemyDatastore.delete_by_model_name')
+    @patch('app.auth.datastore.SQLAlchemyDatastore.bulk_link_by_model_name')
+    def test_role_invalidation(self, mock_bulk_link, mock_delete_by_model_name):
+        from app.auth.models import User
+        from app.api.base import md5
+
+        for pid in (1, 2, 3):
+            self.datastore.cache_user(User(id=pid, password='password'))
+        # the users of the role
+        self.datastore.db.session.query.return_value.filter.return_value = [(1,), (2,)]
+
+        self.datastore.delete_role(5)
+        self.commit()
+        self.assertEqual([self.datastore.get_cached_user(pid, md5('password')) is None
+                          for pid in (1, 2, 3)], [True, True, False])
+
+        self.datastore.bulk_link_by_model_name('user', 'roles', [(3, 5)])
+        self.commit()
+        self.assertIsNone(self.datastore.get_cached_user(3, md5('password')))
+        mock_bulk_link.assert_called_once_with('user', 'roles', [(3, 5)])
+
+    @patch('app.auth.datastore.SQLAlchemyDatastore.bulk_delete_by_model_name')
+    @patch('app.auth.datastore.SQLAlchemyDatastore.delete_by_model_name')
+    def test_revoke_user_tokens(self, mock_delete_by_model_name, mock_bulk_delete):
+        from flask import Flask
+
+        self.datastore.token_revocations = revocations = set()
+        session = self.datastore.db.session
+        app = Flask(__name__)
+
+        with app.app_context():
+            # the stateful tokens are not revoked
+            self.datastore.delete_user(3)
+            self.commit()
+            self.assertFalse(session.execute.called)
+
+            app.config['JWT_STATELESS'] = True
+            self.datastore.delete_user(3)
+            self.datastore.bulk_delete_users([3, 4])
+
+        # the revocation times are replaced in the transaction, then added to this process
+        statements = [call[0][0] for call in session.execute.call_args_list]
+        self.assertEqual([statement.__visit_name__ for statement in statements],
+                         ['delete', 'insert'] * 2)
+        self.assertEqual([params['user_id'] for params in session.execute.call_args[0][1]],
+                         [3, 4])
+        self.assertEqual(revocations, set())
+        self.commit()
+        self.assertEqual(revocations, {3, 4})
+
+    def test_find_revoked_user_ids(self):
+        from datetime import datetime
+
+        session = self.datastore.db.session
+        session.query.return_value.filter.side_effect = [[(1,)], [(2,), (3,)]]
+
+        self.assertEqual(self.datastore.find_revoked_user_ids(datetime(2016, 1, 1)), [1, 2, 3])
+        self.assertEqual(session.query.call_count, 2)
+
+    def test_get_load_options(self):
+        from sqlalchemy.orm.strategy_options import Load
+
+        options = self.datastore.get_load_options('user')
+        self.assertEqual(len(options), 1)
+        self.assertIsInstance(options[0], Load)
+
+        self.assertEqual(self.datastore.get_load_options('role'), [])
+
+        # eager roles and load only id
+        self.assertEqual(len(self.datastore.get_load_options('user', {'roles': {}})), 2)
+
+    @patch('app.datastore.load_only')
+    def test_get_load_options_fields(self, mock_load_only):
+        options = self.datastore.get_load_options('user', {'email': {}, 'unknown': {}},
+                                                  sort='-created_at')
+
+        self.assertEqual(options, [mock_load_only.return_value])
+        self.assertEqual(sorted(mock_load_only.call_args[0]), ['created_at', 'email', 'id'])
+
+    @patch('app.auth.datastore.encrypt_password', side_effect=lambda password: 'hashed')
+    @patch('app.auth.datastore.SQLAlchemyDatastore.bulk_link_by_model_name')
+    @patch('app.auth.datastore.SQLAlchemyDatastore.bulk_create_by_model_name')
+    def test_bulk_create_users(self, mock_bulk_create, mock_bulk_link, mock_encrypt_password):
+        mock_bulk_create.return_value = [3, None]
+        self.datastore.get_role_by_name = MagicMock()
+        self.datastore.get_role_by_name.return_value.id = 1
+
+        items = [{'email': 'a@example.com', 'password': 'password'},
+                 {'email': 'b@example.com', 'password': 'password'}]
+        pids = self.datastore.bulk_create_users(items, chunk_size=2)
+
+        self.assertEqual(pids, [3, None])
+        created_items = mock_bulk_create.call_args[0][2]
+        self.assertEqual([item['password'] for item in created_items], ['hashed', 'hashed'])
+        self.assertTrue(created_items[0]['active'])
+        mock_bulk_link.assert_called_once_with('user', 'roles', [(3, 1)], chunk_size=2)
+        self.datastore.db.session.commit.assert_called_once_with()
+
+    @patch('app.auth.datastore.SQLAlchemyDatastore.bulk_delete_by_model_name')
+    def test_bulk_delete_users(self, mock_bulk_delete):
+        from app.auth.models import User
+        from app.api.base import md5
+
+        self.datastore.cache_user(User(id=1, password='password'))
+        self.datastore.bulk_delete_users([1, 2])
+        self.commit()
+
+        self.assertIsNone(self.datastore.get_cached_user(1, md5('password')))
+        mock_bulk_delete.assert_called_once_with('user', [1, 2])
+
+    def test_get_role_by_name(self):
+        from app.auth.models import Role
+
+        self.datastore.role_cache = LRUCache(ttl=60)
+        self.datastore.find_roles = MagicMock()
+        role = Role(id=1, name='user')
+        self.datastore.find_roles.return_value.first.return_value = role
+        mock_get = self.datastore.db.session.query.return_value.get
+        mock_get.return_value = role
+
+        self.assertEqual(self.datastore.get_role_by_name('user').id, 1)
+        # plain data is cached
+        self.assertEqual(self.datastore.role_cache.get('role:user'), {'id': 1, 'name': 'user'})
+
+        # got by the cached primary id
+        self.assertIs(self.datastore.get_role_by_name('user'), role)
+        self.assertEqual(self.datastore.find_roles.call_count, 1)
+        self.datastore.db.session.query.assert_called_once_with(Role)
+        mock_get.assert_called_once_with(1)
+        self.assertFalse(self.datastore.db.session.merge.called)
+
+        # found by name again once the cached role is gone
+        mock_get.return_value = None
+        self.assertIs(self.datastore.get_role_by_name('user'), role)
+        self.assertEqual(self.datastore.find_roles.call_count, 2)
+
+        self.datastore.get_role_by_name('editor')
+        self.datastore.get_role_by_name('editor')
+        self.assertEqual(self.datastore.find_roles.call_count, 4)
+
+        self.datastore.uncache_roles()
+        self.datastore.get_role_by_name('user')
+        self.assertEqual(self.datastore.find_roles.call_count, 5)
+
+    @patch('app.auth.datastore.encrypt_password', side_effect=lambda password: 'hashed')
+    def test_create_user(self, mock_encrypt_password):
+        from app.auth.models import Role
+
+        role = Role(id=1, name='user')
+        self.datastore.get_role_by_name = MagicMock(return_value=role)
+        self.datastore.find_roles = MagicMock()
+
+        user = self.datastore.create_user(email='a@example.com', password='password', roles=[])
+
+        self.assertEqual((user.email, user.password, user.active),
+                         ('a@example.com', 'hashed', True))
+        self.assertEqual(user.roles, [role])
+        self.datastore.db.session.add.assert_called_once_with(user)
+        # one commit, no role query
+        self.datastore.db.session.commit.assert_called_once_with()
+        self.assertFalse(self.datastore.find_roles.called)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.auth.passwords"""
+
+import threading
+
+from flask import Flask
+from mock import MagicMock, patch
+from passlib.context import CryptContext
+
+from tests.unit import UnitTestCase
+from app.cache import LRUCache
+from app.exceptions import ServiceUnavailableException
+
+
+class PasswordVerifierTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SECRET_KEY='secret', PASSWORD_VERIFY_WORKERS=1,
+                               PASSWORD_VERIFY_QUEUE_SIZE=0, PASSWORD_VERIFY_TIMEOUT=5)
+        self.pwd_context = CryptContext(schemes=['hex_sha256', 'plaintext'],
+                                        deprecated=['plaintext'])
+        self.app.extensions['security'] = MagicMock(pwd_context=self.pwd_context)
+        self.user = MagicMock(id=1, password=self.pwd_context.encrypt('hmac:password'))
+
+    @patch('app.auth.passwords.get_hmac')
+    def test_verify(self, mock_get_hmac):
+        from app.auth.passwords import PasswordVerifier
+
+        mock_get_hmac.side_effect = lambda password: 'hmac:' + password
+        verifier = PasswordVerifier(LRUCache(ttl=60), app=self.app)
+
+        with self.app.app_context():
+            self.assertFalse(verifier.verify('wrong', self.user))
+            self.assertFalse(verifier.verify('wrong', self.user))
+            self.assertTrue(verifier.verify('password', self.user))
+
+            # the verified credential is cached, the failed ones are not
+            self.assertTrue(verifier.verify('password', self.user))
+            self.assertFalse(verifier.verify(None, self.user))
+            metrics = verifier.get_metrics()
+            self.assertEqual((metrics['verifications'], metrics['cache_hits']), (3, 1))
+            self.assertGreater(metrics['hash_seconds_avg'], 0)
+
+            # a changed password changes the credential key
+            self.user.password = self.pwd_context.encrypt('hmac:other')
+            self.assertFalse(verifier.verify('password', self.user))
+            self.assertEqual(verifier.get_metrics()['verifications'], 4)
+
+    @patch('app.auth.passwords.encrypt_password')
+    def test_verify_update(self, mock_encrypt_password):
+        from app.auth.passwords import PasswordVerifier
+
+        mock_encrypt_password.return_value = 'updated'
+        self.app.config['PASSWORD_VERIFY_WORKERS'] = 0
+        verifier = PasswordVerifier(LRUCache(ttl=60), app=self.app)
+        self.user.password = 'password'
+
+        with self.app.app_context():
+            # the deprecated plaintext password is hashed again
+            self.assertTrue(verifier.verify('password', self.user))
+            self.assertEqual(self.user.password, 'updated')
+            mock_encrypt_password.assert_called_once_with('password')
+            self.app.extensions['security'].datastore.put.assert_called_once_with(self.user)
+            self.assertIsNone(verifier.pool)
+
+    def test_run_saturated(self):
+        from app.auth.passwords import PasswordVerifier
+
+        verifier = PasswordVerifier(app=self.app)
+        started, release = threading.Event(), threading.Event()
+
+        def hash_password():
+            started.set()
+            release.wait()
+            return True
+
+        thread = threading.Thread(target=verifier.run, args=(hash_password,))
+        thread.start()
+        started.wait()
+
+        # the only worker is busy and there is no queue
+        with self.assertRaises(ServiceUnavailableException) as sue:
+            verifier.run(lambda: True)
+        self.assertEqual(sue.exception.status_code, 503)
+        self.assertEqual(verifier.get_metrics()['rejections'], 1)
+
+        release.set()
+        thread.join()
+        self.assertTrue(verifier.run(lambda: True))
+
+        # timed out
+        verifier.timeout = 0.01
+        release.clear()
+        with self.assertRaises(ServiceUnavailableException):
+            verifier.run(hash_password)
+        release.set()
+
+    def test_run_timeout_queued(self):
+        from app.auth.passwords import PasswordVerifier
+
+        self.app.config['PASSWORD_VERIFY_QUEUE_SIZE'] = 1
+        verifier = PasswordVerifier(app=self.app)
+        started, release = threading.Event(), threading.Event()
+        mock_hash = MagicMock(return_value=True)
+
+        def hash_password():
+            started.set()
+            release.wait()
+            return True
+
+        thread = threading.Thread(target=verifier.run, args=(hash_password,))
+        thread.start()
+        started.wait()
+
+        # timed out in the queue
+        verifier.timeout = 0.01
+        with self.assertRaises(ServiceUnavailableException):
+            verifier.run(mock_hash)
+        release.set()
+        thread.join()
+
+        # the slots are released once the jobs are done, the timed out one is not hashed
+        verifier.timeout = 5
+        self.assertTrue(verifier.run(lambda: True))
+        self.assertFalse(mock_hash.called)
+        self.assertEqual(verifier.get_metrics()['rejections'], 1)
+
+    def test_run_timed(self):
+        from app.auth.passwords import PasswordVerifier
+        from app.timings import Timings, current_timings
+
+        self.app.config['TIMINGS_ENABLED'] = True
+        Timings(self.app)
+        verifier = PasswordVerifier(app=self.app)
+
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            self.assertTrue(verifier.run(lambda: True))
+            # the hash phase of the request
+            self.assertEqual(current_timings().calls['hash'], 1)
+        self.assertEqual(verifier.get_metrics()['verifications'], 1)
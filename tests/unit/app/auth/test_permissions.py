@@ -27,3 +27,59 @@ class PermissionsTestCase(UnitTestCase):
         self.assertEqual(first_user_permission.needs, {UserNeed(1)})
         self.assertEqual(str(first_user_permission),
                          "<Permission needs=set([Need(method='id', value=1)]) excludes=set([])>")
+
+    def test_can(self):
+        from flask import Flask, g
+        from mock import patch
+        from app.auth.permissions import (can, admin_role_permission, user_permission,
+                                          Identity, Permission, RoleNeed, UserNeed)
+
+        with Flask(__name__).app_context():
+            g.identity = Identity(1)
+            g.identity.provides.update([UserNeed(1), RoleNeed('user')])
+
+            with patch.object(Permission, 'can', autospec=True,
+                              side_effect=lambda permission: permission.allows(g.identity)) \
+                    as mock_can:
+                self.assertTrue(can(user_permission(1)))
+                self.assertTrue(can(user_permission(1)))
+                self.assertFalse(can(admin_role_permission))
+                self.assertFalse(can(admin_role_permission))
+                # memoized by the needs of the permissions
+                self.assertEqual(mock_can.call_count, 2)
+
+                # until the identity is changed
+                g.identity = Identity(1)
+                self.assertFalse(can(user_permission(1)))
+                self.assertEqual(mock_can.call_count, 3)
+
+    def test_change_identity(self):
+        from flask import Flask, g, _request_ctx_stack
+        from flask_principal import Principal, identity_changed, identity_loaded
+        from flask_security.core import _on_identity_loaded
+        from mock import patch
+        from app.auth.models import Role, User
+        from app.auth.permissions import change_identity, RoleNeed
+
+        app = Flask(__name__)
+        Principal(app, use_sessions=False)
+        user = User(id=1, roles=[Role(name='admin')])
+
+        # the identity is loaded by the flask-security loader
+        with app.test_request_context(), \
+                identity_loaded.connected_to(_on_identity_loaded, sender=app), \
+                patch.object(identity_changed, 'send', wraps=identity_changed.send) as mock_send:
+            _request_ctx_stack.top.user = user
+            change_identity(user)
+            self.assertEqual(g.identity.id, 1)
+            self.assertIn(RoleNeed('admin'), g.identity.provides)
+
+            # the identity of the user is loaded once
+            change_identity(user)
+            self.assertEqual(mock_send.call_count, 1)
+
+            _request_ctx_stack.top.user = other = User(id=2, roles=[])
+            change_identity(other)
+            self.assertEqual(mock_send.call_count, 2)
+            self.assertEqual(g.identity.id, 2)
+            self.assertNotIn(RoleNeed('admin'), g.identity.provides)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.auth.tokens"""
+
+from datetime import datetime, timedelta
+
+from flask import Flask
+from mock import MagicMock, patch
+
+from tests.unit import UnitTestCase
+
+
+class TokensTestCase(UnitTestCase):
+
+    def test_bloom_filter(self):
+        from app.auth.tokens import BloomFilter
+
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for pid in range(1000):
+            bloom.add(pid)
+
+        self.assertEqual((bloom.size, bloom.hash_count), (9586, 7))
+        self.assertTrue(all(pid in bloom for pid in range(1000)))
+        false_positives = len([pid for pid in range(1000, 11000) if pid in bloom])
+        self.assertLess(false_positives, 200)
+
+    @patch('app.auth.tokens.time')
+    def test_token_revocations(self, mock_time):
+        from app.auth.tokens import TokenRevocations
+
+        app = Flask(__name__)
+        app.config.update(JWT_EXPIRATION_DELTA_MAX=timedelta(days=1), JWT_LEEWAY=10,
+                          TOKEN_REVOCATION_REFRESH_INTERVAL=30,
+                          TOKEN_REVOCATION_REBUILD_INTERVAL=3600)
+        loader = MagicMock(return_value=[1])
+        revocations = TokenRevocations(loader, app=app)
+        mock_time.time.return_value = 1000000
+
+        # rebuilt from the users updated within the token lifetime
+        self.assertIn(1, revocations)
+        self.assertNotIn(2, revocations)
+        since = loader.call_args[0][0]
+        self.assertAlmostEqual(since, datetime.utcnow() - timedelta(days=1, seconds=10),
+                               delta=timedelta(seconds=5))
+        self.assertEqual(loader.call_count, 1)
+
+        revocations.add(2)
+        self.assertIn(2, revocations)
+
+        # refreshed with the users updated since the previous refresh
+        mock_time.time.return_value += 30
+        loader.return_value = [3]
+        self.assertIn(3, revocations)
+        self.assertIn(2, revocations)
+        loader.assert_called_with(datetime.utcfromtimestamp(1000000 - 30))
+
+        # rebuilt
+        mock_time.time.return_value += 3600
+        loader.return_value = []
+        self.assertNotIn(2, revocations)
+        self.assertEqual(loader.call_count, 3)
+
+    def test_password_version(self):
+        from app.auth.models import User
+
+        user = User(password='first')
+        self.assertIsNone(user.password_version)
+
+        user.password_version = 0
+        user.password = 'second'
+        user.password = 'second'
+        self.assertEqual(user.password_version, 1)
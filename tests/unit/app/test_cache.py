@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.cache"""
+
+import cPickle as pickle
+
+from mock import patch, MagicMock
+
+from tests.unit import UnitTestCase
+from app.cache import NullCache, LRUCache, SharedCache, Cache, make_cache
+
+
+class NullCacheTestCase(UnitTestCase):
+
+    def test_cache_nothing(self):
+        cache = NullCache()
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+
+
+class LRUCacheTestCase(UnitTestCase):
+
+    def test_init_invalid(self):
+        with self.assertRaises(ValueError) as ve:
+            LRUCache(max_size=0)
+        self.assertEqual(ve.exception.message, 'max_size is negative(0), should be positive')
+
+    def test_get_set_delete(self):
+        cache = LRUCache(max_size=2, ttl=60)
+
+        self.assertIsNone(cache.get('a'))
+
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+        cache.set('b', 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(cache.get('a'), 1)  # `b` is the least recently used now
+
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    @patch('app.cache.time')
+    def test_ttl_expiration(self, mock_time):
+        mock_time.time.return_value = 100
+        cache = LRUCache(ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=30)
+
+        mock_time.time.return_value = 109
+        self.assertEqual(cache.get('a'), 1)
+
+        mock_time.time.return_value = 110
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+
+
+class SharedCacheTestCase(UnitTestCase):
+
+    def test_client_calls(self):
+        client = MagicMock()
+        client.get.return_value = 'value'
+        cache = SharedCache(client, ttl=20, key_prefix='prefix:')
+
+        self.assertEqual(cache.get(1), 'value')
+        client.get.assert_called_once_with('prefix:1')
+
+        cache.set(1, 'value')
+        client.set.assert_called_once_with('prefix:1', 'value', timeout=20)
+
+        cache.delete(1)
+        client.delete.assert_called_once_with('prefix:1')
+
+
+    def test_json_redis_cache(self):
+        from app.cache import _JSONRedisCache
+
+        cache = _JSONRedisCache(host=MagicMock())
+        value = {'sub': 1, 'roles': ['user']}
+        self.assertEqual(cache.load_object(cache.dump_object(value)), value)
+        self.assertEqual(cache.load_object(cache.dump_object(3)), 3)
+        self.assertIsNone(cache.load_object(None))
+        # the pickled values are not loaded
+        self.assertIsNone(cache.load_object('!' + pickle.dumps(value)))
+
+
+class MakeCacheTestCase(UnitTestCase):
+
+    def test_make_cache(self):
+        self.assertIsInstance(make_cache(None), NullCache)
+        self.assertIsInstance(make_cache('null'), NullCache)
+
+        cache = make_cache('lru', ttl=5, max_size=3)
+        self.assertIsInstance(cache, LRUCache)
+        self.assertEqual(cache.ttl, 5)
+        self.assertEqual(cache.max_size, 3)
+
+        with self.assertRaises(ValueError) as ve:
+            make_cache('unknown')
+        self.assertEqual(ve.exception.message, 'Invalid cache type: unknown')
+
+    @patch('app.cache._make_memcached_client')
+    def test_make_cache_shared(self, mock_make_memcached_client):
+        cache = make_cache('memcached', ttl=5, url='127.0.0.1:11211', key_prefix='p:')
+
+        self.assertIsInstance(cache, SharedCache)
+        self.assertEqual(cache.key_prefix, 'p:')
+        mock_make_memcached_client.assert_called_once_with('127.0.0.1:11211', default_timeout=5)
+
+
+class CacheTestCase(UnitTestCase):
+
+    def test_not_initialized(self):
+        cache = Cache('TEST_CACHE')
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_init_app(self):
+        app = MagicMock()
+        app.config = {
+            'TEST_CACHE_TYPE': 'lru',
+            'TEST_CACHE_TTL': 30,
+            'TEST_CACHE_MAX_SIZE': 10
+        }
+        cache = Cache('TEST_CACHE', app)
+
+        self.assertIsInstance(cache.backend, LRUCache)
+        self.assertEqual(cache.ttl, 30)
+        self.assertEqual(cache.backend.max_size, 10)
+
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.datastore"""
+
+from datetime import datetime
+
+from mock import MagicMock, patch
+from sqlalchemy import create_engine, event, Column, DateTime, Integer, String, Table, ForeignKey
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, relationship
+
+from tests.unit import UnitTestCase
+
+Base = declarative_base()
+
+post_tags = Table(
+    'post_tags', Base.metadata,
+    Column('post_id', Integer, ForeignKey('post.id'), nullable=False),
+    Column('tag_id', Integer, ForeignKey('tag.id'), nullable=False)
+)
+
+
+class Tag(Base):
+    __tablename__ = 'tag'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(80), unique=True)
+
+
+class Post(Base):
+    __tablename__ = 'post'
+    id = Column(Integer, primary_key=True)
+    title = Column(String(80), unique=True)
+    body = Column(String(255))
+    updated_at = Column(DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
+    tags = relationship('Tag', secondary=post_tags)
+
+
+class SQLAlchemyDatastoreTestCase(UnitTestCase):
+
+    def setUp(self):
+        from app.datastore import SQLAlchemyDatastore
+
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([Tag(id=1, name='a'), Post(id=1, title='first')])
+        self.session.commit()
+
+        db = MagicMock(Model=Base, metadata=Base.metadata, session=self.session)
+        self.datastore = SQLAlchemyDatastore(db)
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+    def tearDown(self):
+        self.session.close()
+
+    def count_statements(self, prefix):
+        return len([statement for statement in self.statements if statement.startswith(prefix)])
+
+    def test_find(self):
+        self.session.add(Post(id=2, title='second', body='b'))
+        query = self.datastore.find_by_model_name('post', accepted_filter_keys=('body',),
+                                                  filters=[{'key': 'body', 'op': 'ne',
+                                                            'value': 'x'}],
+                                                  sort='-title,id', offset=1, limit=5, body='b')
+
+        # the filters and the ordering apply to the table, not to a subquery
+        sql = ' '.join(str(query).split())
+        self.assertEqual(sql, 'SELECT post.id AS post_id, post.title AS post_title, '
+                              'post.body AS post_body, post.updated_at AS post_updated_at '
+                              'FROM post WHERE post.body != :body_1 AND post.body = :body_2 '
+                              'ORDER BY post.title DESC, post.id LIMIT :param_1 OFFSET :param_2')
+        self.assertEqual(query.offset(None).all(), [self.session.query(Post).get(2)])
+
+    def test_find_order_by_primary_key(self):
+        def order_by(**kwargs):
+            sql = ' '.join(str(self.datastore.find_by_model_name('post', **kwargs)).split())
+            return 'ORDER BY' + sql.split('ORDER BY')[1].split(' LIMIT')[0]
+
+        # the ties are broken by the primary key in the direction of the last sort key
+        self.assertEqual(order_by(), 'ORDER BY post.id')
+        self.assertEqual(order_by(sort='title'), 'ORDER BY post.title, post.id')
+        self.assertEqual(order_by(sort='body,-title'), 'ORDER BY post.body, post.title DESC, '
+                                                       'post.id DESC')
+        self.assertEqual(order_by(sort='-id,title'), 'ORDER BY post.id DESC, post.title')
+
+    def test_find_sort_keys(self):
+        for sort in ('tags', 'unknown', 'metadata'):
+            with self.assertRaises(ValueError) as ve:
+                self.datastore.find_by_model_name('post', sort=sort)
+            self.assertEqual(ve.exception.message, 'Invalid sort key: {}'.format(sort))
+
+        self.datastore.sort_keys = {'post': ('id', 'title')}
+        self.assertEqual(len(self.datastore.get_order_by('post', '-title,+id')), 2)
+        with self.assertRaises(ValueError):
+            self.datastore.get_order_by('post', 'body')
+
+    def test_find_search(self):
+        from flask import Flask
+        from app.datastore import SQLAlchemyDatastore
+        from app.search import NGramSearch
+
+        datastore = SQLAlchemyDatastore(self.datastore.db,
+                                        search_fields={'post': ('title', 'body')})
+        self.session.add_all([Post(id=2, title='second', body='first draft'),
+                              Post(id=3, title='third')])
+        self.session.commit()
+
+        with Flask(__name__).app_context():
+            self.assertIsInstance(datastore.get_search_backend('post'), NGramSearch)
+
+            def search(q, **kwargs):
+                return [post.id for post in datastore.find_by_model_name('post', q=q, **kwargs)]
+
+            # ranked by relevance unless sorted
+            self.assertEqual(search('fir'), [1, 2])
+            self.assertEqual(search('fir', sort='-id'), [2, 1])
+            self.assertEqual(search('fir draft'), [2])
+            self.assertEqual(search('nothing'), [])
+
+            # the index follows the changes of the instances
+            self.session.add(Post(id=4, title='firm'))
+            self.session.query(Post).get(1).title = 'renamed'
+            self.session.delete(self.session.query(Post).get(2))
+            self.session.commit()
+            self.assertEqual(search('fir'), [4])
+
+            # the bulk changes invalidate it
+            datastore.bulk_create_by_model_name('post', ('title',), [{'title': 'firewall'}],
+                                                'title')
+            self.assertEqual(search('fir'), [4, 5])
+
+            # the models without searchable fields are not searched
+            self.assertEqual(len(datastore.find_by_model_name('tag', q='a').all()), 1)
+
+    def test_search_backend(self):
+        from flask import Flask
+        from app.search import MySQLFullTextSearch
+
+        app = Flask(__name__)
+        with app.app_context():
+            app.config['SEARCH_BACKEND'] = 'mysql'
+            backend = self.datastore.get_search_backend('post')
+            self.assertIsInstance(backend, MySQLFullTextSearch)
+            self.assertIs(self.datastore.get_search_backend('post'), backend)
+
+            app.config['SEARCH_BACKEND'] = 'unknown'
+            with self.assertRaises(ValueError) as ve:
+                self.datastore.get_search_backend('post')
+            self.assertEqual(ve.exception.message, 'Invalid search backend: unknown')
+
+    def test_update(self):
+        post = self.session.query(Post).get(1)
+        updated_at = post.updated_at
+        del self.statements[:]
+
+        updated = self.datastore.update_by_model_name('post', 1, ('body',), body='b', title='x')
+
+        # the identity mapped instance is updated by one statement, without re-reading it
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(self.count_statements('UPDATE'), 1)
+        self.assertIs(updated, post)
+        self.assertEqual((post.title, post.body), ('first', 'b'))
+        self.assertGreater(post.updated_at, updated_at)
+
+        updated = self.datastore.update_by_model_name('post', 'first', ('body',), 'title',
+                                                      body='c')
+        self.assertEqual(updated.body, 'c')
+
+    def test_update_not_found(self):
+        from werkzeug.exceptions import NotFound
+
+        with self.assertRaises(NotFound):
+            self.datastore.update_by_model_name('post', 5, ('body',), body='b')
+
+        with patch.object(self.datastore, 'supports_returning', return_value=True), \
+                patch.object(self.session, 'execute') as mock_execute:
+            mock_execute.return_value = self.session.connection().execute(
+                Post.__table__.select().where(Post.id == 5))
+
+            with self.assertRaises(NotFound):
+                self.datastore.update_by_model_name('post', 5, ('body',), body='b')
+
+    def test_update_returning(self):
+        self.assertFalse(self.datastore.supports_returning('post'))
+
+        statement = self.datastore.make_update_returning('post', 1, {'body': 'b'})
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+
+        # the onupdate column is set by the same statement
+        self.assertEqual(sql, 'UPDATE post SET body=%(body)s, updated_at=%(updated_at)s '
+                              'WHERE post.id = %(id_1)s '
+                              'RETURNING post.id, post.title, post.body, post.updated_at')
+
+        # the returned row is loaded into the identity mapped instance
+        post = self.session.query(Post).get(1)
+        with patch.object(self.datastore, 'supports_returning', return_value=True), \
+                patch.object(self.session, 'execute') as mock_execute:
+            # the same result columns as the returning clause
+            mock_execute.return_value = self.session.connection().execute(
+                Post.__table__.select().where(Post.id == 1))
+            post.body = 'stale'
+
+            self.assertIs(self.datastore.update_by_model_name('post', 1, ('body',), body='b'),
+                          post)
+            self.assertIsNone(post.body)
+
+    def test_bulk_create(self):
+        items = [{'title': 'first'}, {'title': 'second', 'body': 'b', 'unknown': 1},
+                 {'title': 'third'}, {'title': 'Second'}, {'title': 'fourth'}]
+
+        pids = self.datastore.bulk_create_by_model_name('post', ('title', 'body'), items,
+                                                        'title', chunk_size=2)
+
+        # the conflicting items are skipped, the keys compared case sensitively as by sqlite
+        self.assertEqual(pids, [None, 2, 3, 4, 5])
+        self.assertEqual(self.session.query(Post).get(2).body, 'b')
+        # one multi-row insert statement per chunk with insertable items
+        self.assertEqual(self.count_statements('INSERT'), 3)
+
+        # the keys of the items are folded on the case insensitive dialects
+        with patch.object(self.datastore, 'case_insensitive_dialects', ('sqlite',)):
+            pids = self.datastore.bulk_create_by_model_name(
+                'post', ('title',), [{'title': 'Fifth'}, {'title': 'fifth'}], 'title')
+        self.assertEqual(pids, [6, None])
+
+    def test_bulk_link(self):
+        self.datastore.bulk_link_by_model_name('post', 'tags', [(1, 1)])
+
+        self.assertEqual([tag.name for tag in self.session.query(Post).get(1).tags], ['a'])
+
+    def test_bulk_update(self):
+        self.session.add(Post(id=2, title='second', body='b'))
+        self.session.commit()
+
+        pids = self.datastore.bulk_update_by_model_name(
+            'post', ('body',), [{'id': 1, 'body': 'x'}, {'id': 3, 'body': 'y'},
+                                {'id': 2, 'title': 'ignored'}])
+        self.session.expire_all()
+
+        self.assertEqual(pids, [1, None, 2])
+        self.assertEqual(self.session.query(Post).get(1).body, 'x')
+        self.assertEqual(self.session.query(Post).get(2).title, 'second')
+        self.assertEqual(self.count_statements('UPDATE'), 1)
+
+    def test_bulk_update_conflict(self):
+        self.session.add_all([Post(id=2, title='second'), Post(id=3, title='third')])
+        self.session.commit()
+
+        items = [{'id': 1, 'title': 'first'}, {'id': 2, 'title': 'third'},
+                 {'id': 3, 'title': 'fourth'}, {'id': 1, 'title': 'Fourth'},
+                 {'id': 5, 'title': 'fifth'}]
+        with patch.object(self.datastore, 'case_insensitive_dialects', ('sqlite',)):
+            pids = self.datastore.bulk_update_by_model_name('post', ('title',), items,
+                                                            unique_key='title', chunk_size=2)
+        self.session.expire_all()
+
+        # the items conflicting with the other posts or items are skipped, the keys of the items
+        # folded on the case insensitive dialects
+        self.assertEqual(pids, [1, False, 3, False, None])
+        self.assertEqual([post.title for post in self.session.query(Post).order_by(Post.id)],
+                         ['first', 'second', 'fourth'])
+
+        # compared case sensitively as by sqlite
+        pids = self.datastore.bulk_update_by_model_name(
+            'post', ('title',), [{'id': 2, 'title': 'Fourth'}, {'id': 1, 'title': 'fourth'}],
+            unique_key='title')
+        self.assertEqual(pids, [2, False])
+
+    def test_bulk_delete(self):
+        self.datastore.bulk_link_by_model_name('post', 'tags', [(1, 1)])
+
+        pids = self.datastore.bulk_delete_by_model_name('post', [1, 5])
+
+        self.assertEqual(pids, [1, None])
+        self.assertEqual(self.session.query(Post).count(), 0)
+        self.assertEqual(self.session.query(post_tags).count(), 0)
+        self.assertEqual(self.session.query(Tag).count(), 1)
+
+        self.assertEqual(self.datastore.bulk_delete_by_model_name('post', [1]), [None])
+
+
+class SQLAlchemyDatastoreUnitOfWorkTestCase(UnitTestCase):
+
+    def setUp(self):
+        from flask import Flask
+        from app.datastore import SQLAlchemyDatastore
+
+        self.app = Flask(__name__)
+        self.datastore = SQLAlchemyDatastore(MagicMock(Model=Base, metadata=Base.metadata))
+        self.datastore.init_app(self.app)
+        self.session = self.datastore.db.session
+
+    def test_commit(self):
+        self.assertFalse(self.app.config['DATASTORE_UNIT_OF_WORK'])
+
+        with self.app.test_request_context():
+            self.datastore.commit()
+
+        self.session.commit.assert_called_once_with()
+        self.assertFalse(self.session.flush.called)
+
+    def test_unit_of_work(self):
+        self.app.config['DATASTORE_UNIT_OF_WORK'] = True
+
+        with self.app.test_request_context():
+            self.datastore.commit()
+            self.datastore.commit()
+            self.assertFalse(self.session.commit.called)
+            self.assertEqual(self.session.flush.call_count, 2)
+
+            response = self.app.response_class(status=201)
+            self.assertIs(self.datastore.end_unit_of_work(response), response)
+            self.session.commit.assert_called_once_with()
+
+            # nothing flushed since then
+            self.datastore.end_unit_of_work(response)
+            self.session.commit.assert_called_once_with()
+
+            self.datastore.commit()
+            self.datastore.end_unit_of_work(self.app.response_class(status=400))
+            self.session.rollback.assert_called_once_with()
+            self.session.commit.assert_called_once_with()
+
+    def test_unit_of_work_commit_error(self):
+        from sqlalchemy.exc import SQLAlchemyError
+
+        self.app.config['DATASTORE_UNIT_OF_WORK'] = True
+        self.app.errorhandler(SQLAlchemyError)(lambda ex: ('conflict', 409))
+        self.session.commit.side_effect = SQLAlchemyError('failed')
+
+        with self.app.test_request_context():
+            self.datastore.commit()
+            response = self.datastore.end_unit_of_work(self.app.response_class(status=201))
+
+        # the response is replaced by the error response of the failed commit
+        self.assertEqual((response.status_code, response.get_data()), (409, 'conflict'))
+        self.session.rollback.assert_called_once_with()
@@ -4,7 +4,7 @@
 
 from tests.unit import UnitTestCase
 from app.exceptions import (ApplicationException, BadRequestException, UnauthorizedException,
-                            ForbiddenException, NotFoundException)
+                            ForbiddenException, NotFoundException, ServiceUnavailableException)
 
 
 class ApplicationExceptionTestCase(UnitTestCase):
@@ -152,3 +152,15 @@ class NotFoundExceptionTestCase(UnitTestCase):
                          'exception.message should be "something wrong"')
         self.assertEqual(exception.status_code, 404,
                          'exception.status_code should be 404')
+
+
+class ServiceUnavailableExceptionTestCase(UnitTestCase):
+
+    def test_init(self):
+        self.assertTrue(issubclass(ServiceUnavailableException, ApplicationException))
+        exception = ServiceUnavailableException('something wrong')
+
+        self.assertEqual(exception.message, 'something wrong',
+                         'exception.message should be "something wrong"')
+        self.assertEqual(exception.status_code, 503,
+                         'exception.status_code should be 503')
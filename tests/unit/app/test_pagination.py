@@ -2,29 +2,417 @@
 
 """tests for app.pagination"""
 
+from datetime import datetime, timedelta
+
 from mock import patch, MagicMock, call
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
 
 from tests.unit import UnitTestCase
+from app.cache import LRUCache
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'item'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(80))
+    created_at = Column(DateTime)
+
+
+class SQLiteQueryMixin(object):
+    """provides self.query of 7 items: (1, b), (2, c), (3, a), (4, b), (5, c), (6, a), (7, b)"""
+
+    def setUp(self):
+        super(SQLiteQueryMixin, self).setUp()
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        start = datetime(2016, 1, 1)
+        for idx in range(1, 8):
+            self.session.add(Item(id=idx, name='abc'[idx % 3],
+                                  created_at=start + timedelta(minutes=idx)))
+        self.session.commit()
+        self.query = self.session.query(Item)
+
+    def tearDown(self):
+        self.session.close()
+        super(SQLiteQueryMixin, self).tearDown()
+
+
+class PageUrlTestCase(UnitTestCase):
+
+    @patch('app.pagination.url_for')
+    @patch('app.pagination.request')
+    def test_page_url(self, mock_request, mock_url_for):
+        mock_request.view_args = {}
+        mock_request.values.to_dict.return_value = {'offset': '5', 'email': 'a@example.com'}
+        mock_request.endpoint = 'users'
+
+        from app.pagination import page_url
+
+        page_url(after='cursor', offset=None, limit=5)
+
+        mock_url_for.assert_called_once_with('users', _external=True,
+                                             **{'after': 'cursor', 'limit': 5,
+                                                'email': 'a@example.com'})
+
+
+class CursorTestCase(UnitTestCase):
+
+    def test_encode_decode(self):
+        from app.pagination import encode_cursor, decode_cursor
+
+        values = ['abc', datetime(2016, 1, 2, 3, 4, 5, 6), 3]
+        cursor = encode_cursor(values)
+
+        self.assertEqual(decode_cursor(cursor, [Item.name, Item.created_at, Item.id]), values)
+
+    def test_decode_invalid(self):
+        from app.pagination import encode_cursor, decode_cursor
+
+        with self.assertRaises(ValueError) as ve:
+            decode_cursor('invalid', [Item.id])
+        self.assertEqual(ve.exception.message, 'Invalid cursor: invalid')
+
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor([1, 2]), [Item.id])
+
+
+class CursorPaginationTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    def setUp(self):
+        super(CursorPaginationTestCase, self).setUp()
+        self.current_app_patcher = patch('app.pagination.current_app')
+        self.mock_current_app = self.current_app_patcher.start()
+        self.mock_current_app.config.get.return_value = 3
+
+    def tearDown(self):
+        self.current_app_patcher.stop()
+        super(CursorPaginationTestCase, self).tearDown()
+
+    def test_forward(self):
+        from app.pagination import CursorPagination
+
+        pagination = CursorPagination(self.query, after='')
+
+        self.assertEqual([item.id for item in pagination.data], [1, 2, 3])
+        self.assertFalse(pagination.has_prev)
+        self.assertTrue(pagination.has_next)
+
+        pagination = CursorPagination(self.query, after=pagination.after)
+
+        self.assertEqual([item.id for item in pagination.data], [4, 5, 6])
+        self.assertTrue(pagination.has_prev)
+        self.assertTrue(pagination.has_next)
+
+        pagination = CursorPagination(self.query, after=pagination.after)
+
+        self.assertEqual([item.id for item in pagination.data], [7])
+        self.assertFalse(pagination.has_next)
+
+    def test_backward(self):
+        from app.pagination import CursorPagination
+
+        pagination = CursorPagination(self.query, after='', limit=2)
+        pagination = CursorPagination(self.query, after=pagination.after, limit=2)
+        self.assertEqual([item.id for item in pagination.data], [3, 4])
+
+        pagination = CursorPagination(self.query, before=pagination.before, limit=2)
+
+        self.assertEqual([item.id for item in pagination.data], [1, 2])
+        self.assertFalse(pagination.has_prev)
+        self.assertTrue(pagination.has_next)
+
+    def test_sort(self):
+        from app.pagination import CursorPagination
+
+        # sorted by: name desc, id asc => (2, c), (5, c), (1, b), (4, b), (7, b), (3, a), (6, a)
+        pagination = CursorPagination(self.query, after='', sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [2, 5, 1])
 
+        pagination = CursorPagination(self.query, after=pagination.after, sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [4, 7, 3])
 
-class CursorPaginationTestCase(UnitTestCase):
+        pagination = CursorPagination(self.query, after=pagination.after, sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [6])
 
-    def test_init(self):
+        pagination = CursorPagination(self.query, before=pagination.before, sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [4, 7, 3])
+
+        pagination = CursorPagination(self.query, after='', sort='created_at,-id')
+        pagination = CursorPagination(self.query, after=pagination.after, sort='created_at,-id')
+        self.assertEqual([item.id for item in pagination.data], [4, 5, 6])
+
+    def test_urls(self):
         from app.pagination import CursorPagination
 
-        cursor_pagination = CursorPagination(MagicMock())
+        with patch('app.pagination.page_url', return_value='http://') as mock_page_url:
+            pagination = CursorPagination(self.query, after='')
+            self.assertIsNone(pagination.prev_url)
+            self.assertEqual(pagination.next_url, 'http://')
+            mock_page_url.assert_called_once_with(after=pagination.after, before=None,
+                                                  offset=None, limit=3)
+
+            mock_page_url.reset_mock()
+            pagination = CursorPagination(self.query, before=pagination.after)
+            self.assertIsNone(pagination.prev_url)
+            self.assertEqual(pagination.next_url, 'http://')
+
+
+class TimePaginationTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    def setUp(self):
+        super(TimePaginationTestCase, self).setUp()
+        self.current_app_patcher = patch('app.pagination.current_app')
+        self.mock_current_app = self.current_app_patcher.start()
+        self.mock_current_app.config.get.return_value = 3
+
+    def tearDown(self):
+        self.current_app_patcher.stop()
+        super(TimePaginationTestCase, self).tearDown()
 
-        self.assertIsNotNone(cursor_pagination)
+    def test_init_invalid(self):
+        from app.pagination import TimePagination
 
+        with self.assertRaises(ValueError) as ve:
+            TimePagination(self.query, time_key='name')
+        self.assertEqual(ve.exception.message, 'Invalid time key: name')
 
-class TimePaginationTestCase(UnitTestCase):
+        with self.assertRaises(ValueError) as ve:
+            TimePagination(self.query, since='yesterday')
+        self.assertEqual(ve.exception.message, 'Invalid datetime: yesterday')
 
-    def test_init(self):
+    @patch('app.pagination.page_url')
+    def test_newest_first(self, mock_page_url):
         from app.pagination import TimePagination
 
-        time_pagination = TimePagination(MagicMock())
+        pagination = TimePagination(self.query)
+
+        self.assertEqual([item.id for item in pagination.data], [7, 6, 5])
+        self.assertTrue(pagination.has_prev)
+        self.assertTrue(pagination.has_next)
+
+        pagination.next_url
+        mock_page_url.assert_called_with(since=None, until='2016-01-01T00:05:00', since_id=None,
+                                         until_id=5, time_key='created_at', offset=None, limit=3)
+        pagination.prev_url
+        mock_page_url.assert_called_with(since='2016-01-01T00:07:00', until=None, since_id=7,
+                                         until_id=None, time_key='created_at', offset=None,
+                                         limit=3)
+
+        pagination = TimePagination(self.query, until='2016-01-01T00:02:00')
+
+        self.assertEqual([item.id for item in pagination.data], [1])
+        self.assertFalse(pagination.has_next)
+        self.assertIsNone(pagination.next_url)
+
+    def test_since(self):
+        from app.pagination import TimePagination
+
+        # unix timestamp of 2016-01-01T00:02:00
+        pagination = TimePagination(self.query, since=1451606520)
+
+        self.assertEqual([item.id for item in pagination.data], [3, 4, 5])
+        self.assertTrue(pagination.has_next)
+
+        pagination = TimePagination(self.query, since='2016-01-01T00:06:00')
+
+        self.assertEqual([item.id for item in pagination.data], [7])
+        self.assertFalse(pagination.has_next)
+
+        pagination = TimePagination(self.query, since='2016-01-01T00:07:00')
+
+        self.assertEqual(pagination.data, [])
+        self.assertFalse(pagination.has_prev)
+        self.assertIsNone(pagination.prev_url)
+
+    def test_since_until(self):
+        from app.pagination import TimePagination
+
+        pagination = TimePagination(self.query, since='2016-01-01T00:01:00',
+                                    until='2016-01-01T00:06:00')
+
+        self.assertEqual([item.id for item in pagination.data], [5, 4, 3])
+        self.assertTrue(pagination.has_next)
+
+    def test_same_time(self):
+        from app.pagination import TimePagination
+
+        created_at = datetime(2016, 1, 1, 0, 5)
+        for idx in range(8, 12):
+            self.session.add(Item(id=idx, name='d', created_at=created_at))
+        self.session.commit()
+
+        # 7, 6, 11 | 10, 9, 8 | 5, 4, 3 | 2, 1, the pages of the same time are limited
+        pages = []
+        pagination = TimePagination(self.query)
+        pages.append([item.id for item in pagination.data])
+        while pagination.has_next:
+            last = pagination.data[-1]
+            pagination = TimePagination(self.query, until=last.created_at, until_id=last.id)
+            pages.append([item.id for item in pagination.data])
+        self.assertEqual(pages, [[7, 6, 11], [10, 9, 8], [5, 4, 3], [2, 1]])
+
+        # 1, 2, 3 | 4, 5, 8 | 9, 10, 11 | 6, 7 polled since the oldest
+        pages = []
+        pagination = TimePagination(self.query, since=datetime(2016, 1, 1))
+        pages.append([item.id for item in pagination.data])
+        while pagination.has_next:
+            last = pagination.data[-1]
+            pagination = TimePagination(self.query, since=last.created_at, since_id=last.id)
+            pages.append([item.id for item in pagination.data])
+        self.assertEqual(pages, [[1, 2, 3], [4, 5, 8], [9, 10, 11], [6, 7]])
+
+        # the items of the since time after the since_id
+        pagination = TimePagination(self.query, since=created_at, since_id=9)
+        self.assertEqual([item.id for item in pagination.data], [10, 11, 6])
+
+
+class OffsetPaginationCursorsTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    @patch('app.pagination.current_app')
+    def test_cursors(self, mock_current_app):
+        mock_current_app.config.get.return_value = 3
+
+        from app.pagination import OffsetPagination, CursorPagination
+
+        pagination = OffsetPagination(self.query.order_by(Item.name.desc(), Item.id), sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [2, 5, 1])
+
+        pagination = CursorPagination(self.query, after=pagination.after, sort='-name')
+        self.assertEqual([item.id for item in pagination.data], [4, 7, 3])
+
+        pagination = OffsetPagination(self.query.filter(Item.id < 0))
+        self.assertIsNone(pagination.before)
+        self.assertIsNone(pagination.after)
+
+
+class OffsetPaginationCountModeTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    def setUp(self):
+        super(OffsetPaginationCountModeTestCase, self).setUp()
+        self.current_app_patcher = patch('app.pagination.current_app')
+        self.mock_current_app = self.current_app_patcher.start()
+        self.mock_current_app.config.get.return_value = 3
+
+    def tearDown(self):
+        self.current_app_patcher.stop()
+        super(OffsetPaginationCountModeTestCase, self).tearDown()
+
+    def test_init_invalid(self):
+        from app.pagination import OffsetPagination
+
+        with self.assertRaises(ValueError) as ve:
+            OffsetPagination(self.query, count_mode='unknown')
+        self.assertEqual(ve.exception.message, 'Invalid count mode: unknown')
+
+    def test_count_none(self):
+        from app.pagination import OffsetPagination
+
+        pagination = OffsetPagination(self.query, offset=3, count_mode='none')
+
+        self.assertIsNone(pagination.count)
+        self.assertEqual([item.id for item in pagination.data], [4, 5, 6])
+        self.assertTrue(pagination.has_next)
+
+        pagination = OffsetPagination(self.query, offset=4, count_mode='none')
+
+        self.assertEqual([item.id for item in pagination.data], [5, 6, 7])
+        self.assertFalse(pagination.has_next)
+
+    @patch('app.pagination.count_cache', new_callable=lambda: LRUCache(ttl=60))
+    def test_count_estimate(self, mock_count_cache):
+        from app.pagination import OffsetPagination, count_key
+
+        pagination = OffsetPagination(self.query, count_mode='estimate')
+
+        self.assertEqual(pagination.count, 7)
+        self.assertTrue(pagination.has_next)
+        self.assertEqual(mock_count_cache.get(count_key(self.query)), 7)
+
+        self.session.add(Item(id=8, name='c'))
+        self.session.commit()
+
+        # cached by the filter signature
+        pagination = OffsetPagination(self.query.order_by(Item.name), offset=6,
+                                      count_mode='estimate')
+        self.assertEqual(pagination.count, 7)
+        self.assertEqual(len(pagination.data), 2)
+
+        pagination = OffsetPagination(self.query.filter(Item.name == 'c'), count_mode='estimate')
+        self.assertEqual(pagination.count, 3)
+        self.assertFalse(pagination.has_next)
+
+
+class LazyDataTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    def test_iter(self):
+        from app.pagination import LazyData
+
+        data = LazyData(self.query.order_by(Item.id), 1, 4, window_size=2)
+
+        self.assertIsNone(data.first)
+        self.assertEqual([item.id for item in data], [2, 3, 4, 5])
+        self.assertEqual((data.first.id, data.last.id, data.count), (2, 5, 4))
+        self.assertTrue(data.has_more)
+
+        data = LazyData(self.query.order_by(Item.id), 3, 10, window_size=3)
+
+        self.assertEqual([item.id for item in data], [4, 5, 6, 7])
+        self.assertFalse(data.has_more)
+
+    def test_iter_order_by_primary_key(self):
+        from sqlalchemy import desc
+        from app.pagination import LazyData, order_by_primary_key
+
+        # the names are not unique, the windows are ordered by the primary key too
+        data = LazyData(self.query.order_by(Item.name), 0, 7, window_size=2)
+        self.assertEqual([item.id for item in data], [3, 6, 1, 4, 7, 2, 5])
+
+        self.assertTrue(str(order_by_primary_key(self.query.order_by(Item.name)))
+                        .endswith('ORDER BY item.name, item.id'))
+        self.assertTrue(str(order_by_primary_key(self.query.order_by(desc(Item.id))))
+                        .endswith('ORDER BY item.id DESC'))
+
+    @patch('app.pagination.current_app')
+    def test_offset_pagination_stream(self, mock_current_app):
+        mock_current_app.config = {'STREAM_THRESHOLD': 3, 'STREAM_WINDOW_SIZE': 2,
+                                   'PAGINATION_LIMIT': 25}
+
+        from app.pagination import OffsetPagination, LazyData
+
+        pagination = OffsetPagination(self.query.order_by(Item.id), limit=2, stream=True)
+        self.assertIsInstance(pagination.data, list)
+
+        pagination = OffsetPagination(self.query.order_by(Item.id), offset=1, limit=3,
+                                      sort='id', count_mode='none', stream=True)
+        self.assertIsInstance(pagination.data, LazyData)
+        self.assertEqual([item.id for item in pagination.data], [2, 3, 4])
+        self.assertTrue(pagination.has_next)
+        self.assertIsNotNone(pagination.before)
+        self.assertIsNotNone(pagination.after)
+
+
+class IterKeysetTestCase(SQLiteQueryMixin, UnitTestCase):
+
+    def test_iter_keyset(self):
+        from app.pagination import iter_keyset
+
+        query = self.query.filter(Item.id != 3).order_by(Item.name).limit(2)
+        items = iter_keyset(query, window_size=2)
+        self.assertEqual([item.id for item in items], [1, 2, 4, 5, 6, 7])
 
-        self.assertIsNotNone(time_pagination)
+        statements = []
+        event.listen(self.session.bind, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        self.assertEqual(len(list(iter_keyset(self.query, window_size=3))), 7)
+        # windows of 3, 3 and 1 items, the next windows start after the last primary key
+        self.assertEqual(len(statements), 3)
+        self.assertNotIn('item.id >', statements[0])
+        self.assertIn('item.id >', statements[1])
 
 
 class OffsetPaginationTestCase(UnitTestCase):
@@ -60,6 +448,7 @@ class OffsetPaginationTestCase(UnitTestCase):
         mock_query = MagicMock()
         mock_query.offset.return_value = mock_query
         mock_query.limit.return_value = mock_query
+        mock_query.order_by.return_value = mock_query
         mock_query.count.return_value = 15
         mock_query.all.return_value = ['hi']
 
@@ -83,6 +472,7 @@ class OffsetPaginationTestCase(UnitTestCase):
         mock_query = MagicMock()
         mock_query.offset.return_value = mock_query
         mock_query.limit.return_value = mock_query
+        mock_query.order_by.return_value = mock_query
         mock_query.count.return_value = 3
         mock_query.all.return_value = ['hi', 'there']
 
@@ -119,6 +509,7 @@ class OffsetPaginationTestCase(UnitTestCase):
         mock_query = MagicMock()
         mock_query.offset.return_value = mock_query
         mock_query.limit.return_value = mock_query
+        mock_query.order_by.return_value = mock_query
         mock_query.count.return_value = 10
 
         from app.pagination import OffsetPagination
@@ -163,7 +554,8 @@ class OffsetPaginationTestCase(UnitTestCase):
 
         from app.pagination import OffsetPagination
         mock_query = MagicMock()
-        mock_query.offset.return_value.limit.return_value.count.return_value = 15
+        mock_count = mock_query.offset.return_value.limit.return_value.order_by.return_value.count
+        mock_count.return_value = 15
 
         offset_pagination = OffsetPagination(mock_query, offset=10, limit=5)
 
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.policies"""
+
+from tests.unit import UnitTestCase
+
+
+class PoliciesTestCase(UnitTestCase):
+
+    def test_compile_view(self):
+        from app.policies import guard, parser, processor, compile_view
+
+        calls = []
+
+        def check(*args, **kwargs):
+            calls.append(('check', args, kwargs))
+            if kwargs.get('id') == 'denied':
+                return 'denied'
+
+        class Resource(object):
+
+            @processor('marshal', lambda result: {'data': result})
+            @guard('permission', check)
+            @processor('paginate', lambda result: result + ['paged'])
+            @parser('args', lambda args, kwargs: (args + ({'limit': 1},), kwargs))
+            def list(self, args, id=None):
+                calls.append(('list', args, id))
+                return [id]
+
+        resource = Resource()
+        view = guard('auth', lambda *args, **kwargs: None)(resource.list)
+        compiled = compile_view(view)
+        self.assertEqual(compiled.stages, ['auth', 'permission', 'args', 'call', 'paginate',
+                                           'marshal'])
+        self.assertEqual(compiled.__name__, 'list')
+        self.assertFalse(hasattr(compiled, 'policy'))
+
+        # the same result as the nested decorators
+        self.assertEqual(compiled(id=1), {'data': [1, 'paged']})
+        self.assertEqual(compiled(id=1), view(id=1))
+        self.assertEqual(calls[:2], [('check', (resource,), {'id': 1}),
+                                     ('list', {'limit': 1}, 1)])
+
+        # the response of a guard is processed by the processors declared out of it
+        self.assertEqual(compiled(id='denied'), {'data': 'denied'})
+        self.assertEqual(compiled(id='denied'), view(id='denied'))
+
+        # a decorator which is not a policy is called as the view
+        def plain(func):
+            return lambda *args, **kwargs: func(*args, **kwargs)
+
+        self.assertIs(compile_view(plain), plain)
+        compiled = compile_view(processor('marshal', lambda result: {'data': result})(
+            plain(lambda: 'plain')))
+        self.assertEqual(compiled.stages, ['call', 'marshal'])
+        self.assertEqual(compiled(), {'data': 'plain'})
+
+    def test_compile_view_wrap(self):
+        from app.policies import guard, processor, compile_view
+
+        wrapped = []
+
+        def wrap(name, step):
+            wrapped.append(name)
+            return step
+
+        view = guard('auth', lambda: None)(processor('marshal', lambda result: [result])(
+            lambda: 'item'))
+        compiled = compile_view(view, wrap=wrap)
+        self.assertEqual(compiled(), ['item'])
+        self.assertEqual(sorted(wrapped), ['auth', 'call', 'marshal'])
+
+        # the call of a view without policy is wrapped
+        compiled = compile_view(lambda: 'item', wrap=wrap)
+        self.assertEqual((compiled(), compiled.stages), ('item', ['call']))
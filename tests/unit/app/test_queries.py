@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.queries"""
+
+from threading import Thread
+
+from flask import Flask
+from mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from tests.unit import UnitTestCase
+
+
+class QueriesTestCase(UnitTestCase):
+
+    def test_request_queries(self):
+        from app.queries import RequestQueries
+
+        queries = RequestQueries()
+        for idx in range(3):
+            queries.add('SELECT * FROM role WHERE id = ?', 0.001)
+        queries.add('SELECT * FROM user', 0.002)
+        self.assertEqual(queries.count, 4)
+        self.assertAlmostEqual(queries.seconds, 0.005)
+        self.assertEqual(queries.repeated(3), [('SELECT * FROM role WHERE id = ?', 3)])
+        self.assertEqual(queries.repeated(5), [])
+
+    @patch('app.queries.logger')
+    def test_monitor(self, mock_logger):
+        from app.queries import QueryMonitor, current_queries
+
+        app = Flask(__name__)
+        app.config.update(QUERIES_ENABLED=True, QUERIES_REPEATED=3, QUERIES_SLOW=60)
+        monitor = QueryMonitor(app)
+        engine = create_engine('sqlite://')
+        counts = []
+
+        @app.route('/items')
+        def items():
+            for idx in range(3):
+                engine.execute('select ?', idx)
+            engine.execute('select 1')
+            counts.append(current_queries().count)
+            return 'items'
+
+        client = app.test_client()
+        client.get('/items')
+        self.assertEqual(counts, [4])
+        # the repeated statement is logged with its endpoint
+        self.assertEqual(mock_logger.warning.call_count, 1)
+        self.assertEqual(mock_logger.warning.call_args[0][1:], ('items', 3, 'select ?'))
+
+        mock_logger.reset_mock()
+        monitor.slow_query = 0
+        client.get('/items')
+        self.assertEqual(mock_logger.warning.call_count, 5)
+        self.assertEqual(mock_logger.warning.call_args_list[0][0][1], 'items')
+
+        # the queries of a block are captured out of the requests
+        with monitor.capture() as queries:
+            engine.execute('select 1')
+        engine.execute('select 1')
+        self.assertEqual(queries.count, 1)
+
+        # a failed statement is not counted and does not time the next one
+        with monitor.capture() as queries:
+            self.assertRaises(OperationalError, engine.execute, 'select * from missing')
+            engine.execute('select 1')
+        self.assertEqual(queries.statements, {'select 1': 1})
+
+        # the queries of the other threads are not captured
+        with monitor.capture() as queries:
+            thread = Thread(target=engine.execute, args=('select 2',))
+            thread.start()
+            thread.join()
+            engine.execute('select 1')
+        self.assertEqual(queries.statements, {'select 1': 1})
+
+        # disabled
+        monitor.enabled = False
+        mock_logger.reset_mock()
+        client.get('/items')
+        self.assertFalse(mock_logger.warning.called)
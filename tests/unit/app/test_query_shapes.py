@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.query_shapes"""
+
+from collections import Counter
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import Flask
+from mock import patch
+
+from tests.unit import UnitTestCase
+
+
+class QueryShapesTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'shapes', 'query_shapes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_make_query_shape(self):
+        from app.query_shapes import QueryShape, make_query_shape
+
+        shape = make_query_shape('user', [{'key': 'updated_at', 'op': 'gt', 'value': 1},
+                                          {'key': 'email', 'op': 'eq', 'value': 'a'}],
+                                 {'active': True}, '-created_at,id')
+        self.assertEqual(shape, QueryShape('user', ('active', 'email'), ('updated_at',),
+                                           ('created_at', 'id')))
+        self.assertEqual(make_query_shape('role'), QueryShape('role', (), (), ()))
+        self.assertEqual(QueryShape.from_dict(json.loads(json.dumps(shape.to_dict()))), shape)
+
+    def test_registry(self):
+        from app.query_shapes import QueryShapeRegistry, make_query_shape
+
+        app = Flask(__name__)
+        app.config.update(QUERY_SHAPES_FILE=self.path, QUERY_SHAPES_FLUSH_INTERVAL=3600)
+        registry = QueryShapeRegistry()
+        registry.init_app(app)
+        process_path = os.path.join(self.directory, 'shapes',
+                                    'query_shapes.{}.json'.format(os.getpid()))
+
+        shape = make_query_shape('user', sort='-created_at')
+        with patch('app.query_shapes.threading.Thread') as mock_thread:
+            registry.record(shape)
+            registry.record(shape)
+        # the flushing thread is started once per process, the requests do not write
+        mock_thread.assert_called_once_with(target=registry.run,
+                                            name='query-shapes-{}'.format(os.getpid()))
+        mock_thread.return_value.start.assert_called_once_with()
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+        self.assertEqual(registry.load(), Counter({shape: 2}))
+
+        # the counts of the process are written into its own file
+        registry.flush()
+        registry.record(shape)
+        registry.flush()
+        self.assertEqual(registry.read_file(process_path), Counter({shape: 3}))
+        self.assertEqual(registry.counts, Counter({shape: 3}))
+
+        registry.record(shape)
+        self.assertEqual(QueryShapeRegistry(self.path).load(), Counter({shape: 3}))
+        self.assertEqual(registry.load(), Counter({shape: 4}))
+
+        # the files of the other processes and the path itself are merged
+        other = make_query_shape('role')
+        for path in (self.path, os.path.join(self.directory, 'shapes', 'query_shapes.1.json')):
+            with open(path, 'w') as shapes_file:
+                json.dump([dict(other.to_dict(), hits=2)], shapes_file)
+        self.assertEqual(registry.load(), Counter({shape: 4, other: 4}))
+        self.assertEqual(QueryShapeRegistry(self.path).load(), Counter({shape: 3, other: 4}))
+
+        registry.enabled = False
+        registry.record(shape)
+        self.assertEqual(registry.load(), Counter({shape: 4, other: 4}))
+
+    def test_registry_run(self):
+        from app.query_shapes import QueryShapeRegistry, make_query_shape
+
+        registry = QueryShapeRegistry(self.path, flush_interval=10)
+        shape = make_query_shape('user')
+        os.makedirs(os.path.dirname(self.path))
+        with open(registry.get_process_path(), 'w') as shapes_file:
+            json.dump([dict(shape.to_dict(), hits=2)], shapes_file)
+
+        with patch('app.query_shapes.threading.Thread'):
+            registry.record(shape)
+
+        # the thread flushes every interval, the sleeps of the other threads are not counted
+        current_thread = threading.current_thread()
+        intervals = []
+
+        def sleep(seconds):
+            if threading.current_thread() is current_thread:
+                intervals.append(seconds)
+                if len(intervals) > 1:
+                    raise ValueError()
+
+        with patch('app.query_shapes.time.sleep', side_effect=sleep):
+            with self.assertRaises(ValueError):
+                registry.run()
+
+        self.assertEqual(intervals, [10, 10])
+        # the counts of a previous process of the same pid are kept
+        self.assertEqual(registry.read_file(registry.get_process_path()), Counter({shape: 3}))
+
+    def test_suggest_indexes(self):
+        from app.extensions import auth_datastore
+        from app.query_shapes import IndexSuggestion, QueryShape, suggest_indexes
+
+        counts = Counter({
+            QueryShape('user', ('active',), (), ('created_at',)): 5,
+            QueryShape('user', ('active',), ('updated_at',), ()): 3,
+            # covered by the index of created_at, the unique email and the above suggestion
+            QueryShape('user', (), (), ('created_at',)): 10,
+            QueryShape('user', ('email',), (), ()): 10,
+            QueryShape('user', ('active',), (), ()): 2,
+            # not columns
+            QueryShape('user', ('roles',), (), ()): 2,
+            QueryShape('unknown', ('active',), (), ()): 2,
+        })
+
+        self.assertEqual(suggest_indexes(counts, auth_datastore), [
+            IndexSuggestion('ix_role_users_user_id_role_id', 'role_users', ['user_id', 'role_id'],
+                            32),
+            IndexSuggestion('ix_user_active_created_at', 'user', ['active', 'created_at'], 5),
+            IndexSuggestion('ix_user_active_updated_at', 'user', ['active', 'updated_at'], 3)
+        ])
+        self.assertEqual([suggestion.name for suggestion in
+                          suggest_indexes(counts, auth_datastore, min_hits=4)],
+                         ['ix_role_users_user_id_role_id', 'ix_user_active_created_at'])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.search"""
+
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.orm import Query
+
+from tests.unit import UnitTestCase
+
+
+class SearchTestCase(UnitTestCase):
+
+    def test_make_ngrams(self):
+        from app.search import make_ngrams, parse_words
+
+        self.assertEqual(parse_words(u'Jo.Doe@example.com'), [u'jo', u'doe', u'example', u'com'])
+        self.assertEqual(make_ngrams('Jo'), set(['  j', ' jo', 'jo ']))
+        self.assertEqual(make_ngrams('Jo', prefix=True), set(['  j', ' jo']))
+        self.assertEqual(make_ngrams('@@'), set())
+
+    def test_ngram_index(self):
+        from app.search import NGramIndex
+
+        index = NGramIndex()
+        index.add(1, 'user1@example.com')
+        index.add(2, 'user12@example.com')
+        index.add(3, 'admin@example.com')
+        index.add(4, 'user2@example.com')
+
+        # the words are matched as prefixes, the closest documents first
+        self.assertEqual(index.search('user1'), [1, 2])
+        self.assertEqual(index.search('USER12'), [2])
+        self.assertEqual(index.search('example'), [1, 3, 4, 2])
+        self.assertEqual(index.search('example', max_results=1), [1])
+        self.assertEqual(index.search('usr1'), [])
+        self.assertEqual(index.search('usr1', min_score=0.5), [1, 4, 2])
+        self.assertEqual(index.search('!'), [])
+
+        index.add(1, 'renamed@example.com')
+        index.remove(2)
+        self.assertEqual(index.search('user1'), [])
+        self.assertEqual(index.search('renamed'), [1])
+        self.assertNotIn('r12', index.postings)
+
+    def test_mysql(self):
+        from app.auth.models import Role
+        from app.search import MySQLFullTextSearch
+
+        backend = MySQLFullTextSearch()
+        query, order_by = backend.search(Query(Role), Role, ('name', 'description'), 'Adm, x')
+        compiled = query.order_by(*order_by).statement.compile(dialect=mysql.dialect())
+
+        self.assertIn('WHERE MATCH (role.name, role.description) AGAINST (%s IN BOOLEAN MODE) > %s '
+                      'ORDER BY MATCH (role.name, role.description) AGAINST (%s IN BOOLEAN MODE) '
+                      'DESC', str(compiled))
+        self.assertIn('+adm* +x*', compiled.params.values())
+
+        ddl = backend.index_ddl(Role.__table__, ('name', 'description')).against(Role.__table__)
+        self.assertEqual(str(ddl.compile(dialect=mysql.dialect())),
+                         'CREATE FULLTEXT INDEX ix_role_search ON role (name, description)')
+
+    def test_postgresql(self):
+        from app.auth.models import Role, User
+        from app.search import PostgreSQLFullTextSearch
+
+        backend = PostgreSQLFullTextSearch()
+        query, order_by = backend.search(Query(Role), Role, ('name', 'description'), 'Adm, x')
+        compiled = query.order_by(*order_by).statement.compile(dialect=postgresql.dialect())
+
+        vector = "to_tsvector('simple', regexp_replace(coalesce(role.name, '') || ' ' || " \
+                 "coalesce(role.description, ''), '\\W+', ' ', 'g'))"
+        self.assertIn("WHERE {0} @@ to_tsquery('simple', %(to_tsquery_1)s) "
+                      "ORDER BY ts_rank({0}, to_tsquery('simple', %(to_tsquery_1)s)) DESC"
+                      .format(vector), str(compiled))
+        self.assertEqual(compiled.params, {'to_tsquery_1': 'adm:* & x:*'})
+
+        # the index is made of the same document
+        ddl = backend.index_ddl(Role.__table__, ('name', 'description')).against(Role.__table__)
+        self.assertEqual(str(ddl.compile(dialect=postgresql.dialect())),
+                         "CREATE INDEX ix_role_search ON role USING gin (to_tsvector('simple', "
+                         "regexp_replace(coalesce(name, '') || ' ' || coalesce(description, ''), "
+                         "'\\W+', ' ', 'g')))")
+
+        # the words of an email are matched, the parser keeps it as one email lexeme otherwise
+        query, order_by = backend.search(Query(User), User, ('email',), 'John.Doe@example.com')
+        compiled = query.order_by(*order_by).statement.compile(dialect=postgresql.dialect())
+        self.assertIn("WHERE to_tsvector('simple', regexp_replace(coalesce(\"user\".email, ''), "
+                      "'\\W+', ' ', 'g')) @@ to_tsquery('simple', %(to_tsquery_1)s)", str(compiled))
+        self.assertEqual(compiled.params, {'to_tsquery_1': 'john:* & doe:* & example:* & com:*'})
+
+        query, order_by = backend.search(Query(Role), Role, ('name',), '...')
+        self.assertIn('false', str(query.statement.compile(dialect=postgresql.dialect())))
+        self.assertEqual(order_by, [])
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""tests for app.timings"""
+
+from flask import Flask
+from mock import patch
+from sqlalchemy import create_engine
+
+from tests.unit import UnitTestCase
+
+
+class TimingsTestCase(UnitTestCase):
+
+    def test_request_timings(self):
+        from app.timings import RequestTimings
+
+        timings = RequestTimings()
+        timings.add('auth', 0.001)
+        timings.add('db', 0.002)
+        timings.add('db', 0.001)
+        self.assertEqual(timings.calls, {'auth': 1, 'db': 2})
+        self.assertEqual(timings.server_timing(0.005),
+                         'auth;dur=1.000, db;desc="2 queries";dur=3.000, total;dur=5.000')
+
+    def test_histogram(self):
+        from app.timings import Histogram
+
+        histogram = Histogram()
+        for _ in range(98):
+            histogram.record(0.00015)
+        histogram.record(0.003, calls=3)
+        histogram.record(2.5)
+
+        stats = histogram.to_dict()
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['calls_mean'], 1.02)
+        # the upper bounds of the buckets, the max at most
+        self.assertAlmostEqual(stats['p50_ms'], 0.2)
+        self.assertAlmostEqual(stats['p99_ms'], 3.2)
+        self.assertAlmostEqual(stats['max_ms'], 2500)
+        self.assertAlmostEqual(histogram.percentile(1), 2.5)
+
+    @patch('app.timings.logger')
+    def test_requests(self, mock_logger):
+        from app.queries import QueryMonitor
+        from app.timings import Timings
+
+        app = Flask(__name__)
+        app.config.update(TIMINGS_ENABLED=True, TIMINGS_HEADER=True, TIMINGS_SLOW_REQUEST=60)
+        timings = Timings(app)
+        # the queries are timed by the query monitor
+        QueryMonitor(app)
+        engine = create_engine('sqlite://')
+
+        @app.route('/items')
+        def items():
+            engine.execute('select 1')
+            engine.execute('select 2')
+            return timings.timed('call', lambda: 'items')()
+
+        client = app.test_client()
+        response = client.get('/items')
+        metrics = [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'call', 'total'])
+        self.assertIn('db;desc="2 queries"', response.headers['Server-Timing'])
+
+        client.get('/items')
+        stats = timings.get_stats()
+        self.assertEqual(sorted(stats['items']), ['call', 'db', 'total'])
+        self.assertEqual((stats['items']['db']['count'], stats['items']['db']['calls_mean']),
+                         (2, 2.0))
+        self.assertFalse(mock_logger.warning.called)
+
+        # the not found requests are not recorded
+        timings.reset()
+        client.get('/unknown')
+        self.assertEqual(timings.get_stats(), {})
+
+        timings.slow_request = 0
+        client.get('/items')
+        self.assertTrue(mock_logger.warning.called)
+
+        # disabled
+        timings.enabled = False
+        response = client.get('/items')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(timings.timed('call', lambda: 'untimed')(), 'untimed')
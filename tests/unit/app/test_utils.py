@@ -249,3 +249,47 @@ class UtilsTestCase(UnitTestCase):
         mock_eq.assert_called_once_with('test')
         mock_query.filter.assert_called_once_with(mock_eq('test'))
         self.assertEqual(query, mock_query_return)
+
+    def test_make_filter_plan(self):
+        from app.auth.models import Role
+
+        plan = utils.make_filter_plan(Role)
+
+        self.assertEqual(sorted(plan), ['created_at', 'description', 'id', 'name', 'updated_at'])
+        self.assertIn('like', plan['name'])
+        self.assertNotIn('like', plan['id'])
+        self.assertEqual(str(plan['name']['in_'](['a', 'b'])), 'role.name IN (:name_1, :name_2)')
+        self.assertEqual(str(plan['id']['ge'](2)), 'role.id >= :id_1')
+
+    def test_apply_filter_plan(self):
+        from app.auth.models import Role
+
+        plan = utils.make_filter_plan(Role)
+        mock_query = MagicMock()
+        op_sequence = [{'key': 'name', 'op': 'like', 'value': 'a%'},
+                       {'key': 'id', 'op': 'ne', 'value': 1},
+                       {'key': 'description', 'op': 'eq', 'value': 'ignored'}]
+
+        self.assertEqual(utils.apply_filter_plan(mock_query, plan, op_sequence, None), mock_query)
+
+        query = utils.apply_filter_plan(mock_query, plan, op_sequence, ('id', 'name'))
+
+        self.assertEqual(query, mock_query.filter.return_value)
+        criteria = mock_query.filter.call_args[0]
+        self.assertEqual([str(criterion) for criterion in criteria],
+                         ['role.name LIKE :name_1', 'role.id != :id_1'])
+
+        with self.assertRaises(ValueError) as ve:
+            utils.apply_filter_plan(mock_query, plan, [{'key': 'unknown', 'op': 'eq'}],
+                                    ('unknown',))
+        self.assertEqual(ve.exception.message, 'Invalid filter column: unknown')
+
+        for operator in ('like', '__class__', 'label'):
+            with self.assertRaises(ValueError) as ve:
+                utils.apply_filter_plan(mock_query, plan, [{'key': 'id', 'op': operator}], ('id',))
+            self.assertEqual(ve.exception.message,
+                             'Invalid filter operator: {}'.format(operator))
+
+    def test_chunked(self):
+        self.assertEqual(utils.chunked(xrange(5), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(utils.chunked([], 2), [])
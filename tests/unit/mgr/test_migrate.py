@@ -2,6 +2,8 @@
 
 """unit tests for mgr.migrate"""
 
+import os
+
 from mock import patch
 from tests.unit import UnitTestCase
 
@@ -103,3 +105,34 @@ class MigrateTestCase(UnitTestCase):
         reset()
         mock_drop.assert_called_once_with()
         mock_setup.assert_called_once_with()
+
+    @patch('mgr.migrate.ScriptDirectory')
+    @patch('mgr.migrate.current_app')
+    @patch('mgr.migrate.make_index_suggestions')
+    @patch('mgr.migrate.auth_datastore')
+    def test_suggest_indexes(self, mock_auth_datastore, mock_make_index_suggestions,
+                             mock_current_app, mock_script_directory):
+        from app.query_shapes import IndexSuggestion
+        from mgr.migrate import suggest_indexes
+
+        mock_make_index_suggestions.return_value = []
+        suggest_indexes()
+        self.assertFalse(mock_script_directory.from_config.called)
+
+        mock_make_index_suggestions.return_value = [
+            IndexSuggestion('ix_user_active_created_at', 'user', ['active', 'created_at'], 5)]
+        mock_script_directory.from_config.return_value.versions = os.path.dirname(__file__)
+        suggest_indexes(min_hits=2)
+
+        mock_make_index_suggestions.assert_called_with(
+            mock_auth_datastore.query_shapes.load.return_value, mock_auth_datastore, min_hits=2)
+        get_config = mock_current_app.extensions['migrate'].migrate.get_config
+        get_config.assert_called_once_with(None)
+        mock_script_directory.from_config.assert_called_once_with(get_config.return_value)
+        generate_revision = mock_script_directory.from_config.return_value.generate_revision
+        self.assertEqual(generate_revision.call_args[1], {
+            'head': 'head',
+            'upgrades': "op.create_index('ix_user_active_created_at', 'user', "
+                        "['active', 'created_at'], unique=False)",
+            'downgrades': "op.drop_index('ix_user_active_created_at', table_name='user')"
+        })